@@ -8,6 +8,7 @@ import uuid
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import config
 from backend.utils.session_manager import session_manager
+from backend.utils.metrics import metrics
 
 def create_app(config_name=None):
     """应用工厂函数"""
@@ -45,6 +46,22 @@ def create_app(config_name=None):
             'version': '1.0.0'
         })
     
+    @app.route('/api/metrics', methods=['GET'])
+    def get_metrics():
+        """运行指标接口（大模型连接复用、流式首字延迟等）"""
+        from backend.services.qwen_transport import qwen_transport
+        from backend.services.image_payload_cache import image_payload_cache
+        from backend.services.semantic_cache import semantic_cache
+        from backend.services.summarizer import summary_flights
+        return jsonify({
+            'success': True,
+            'qwen_transport': qwen_transport.get_stats(),
+            'image_payload_cache': image_payload_cache.get_stats(),
+            'semantic_cache': semantic_cache.get_stats(),
+            'summary_single_flight': summary_flights.get_stats(),
+            **metrics.snapshot()
+        })
+    
     # 会话管理路由
     @app.route('/api/session/info', methods=['GET'])
     def session_info():
@@ -1,17 +1,24 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 import os
 import re
+import json
+import time
 from backend.services.pdf_processor import PDFProcessor
 from backend.services.qwen_client import QwenClient
+from backend.services.async_qwen_client import AsyncQwenClient
 from backend.services.question_analyzer import PageSelector, QuestionAnalyzer
+from backend.services.semantic_cache import semantic_cache
+from backend.services.page_notes import notes_cover_page
+from backend.utils.metrics import metrics
+from backend.utils.event_loop import event_loop_thread
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
-from config import Config
 
 chat_bp = Blueprint('chat', __name__)
 pdf_processor = PDFProcessor()
 qwen_client = QwenClient()
+async_qwen_client = AsyncQwenClient(qwen_client)
 page_selector = PageSelector(pdf_processor)
 
 def extract_figures_from_answer(answer_text, relevant_pages, document_id, figure_request):
@@ -47,15 +54,25 @@ def extract_figures_from_answer(answer_text, relevant_pages, document_id, figure
             found_pages = set(relevant_pages)
         
         # 为每个找到的页面尝试提取图片
-        for page_num in found_pages:
+        target_pages = []
+        for page_num in sorted(found_pages):
             if page_num in relevant_pages:
                 # 检查页面图片是否存在
                 image_path = pdf_processor.get_page_image_path(document_id, page_num)
                 if os.path.exists(image_path):
-                     # 分析页面中的图表位置
-                     figure_info = analyze_page_figures(image_path, figure_request, page_num, document_id)
-                     if figure_info:
-                         extracted_figures.extend(figure_info)
+                    target_pages.append((page_num, image_path))
+        
+        # 并发检测各页面中的图表，再依次截取
+        detections = event_loop_thread.run(async_qwen_client.detect_figures_in_pages(
+            [image_path for _, image_path in target_pages], build_figure_query(figure_request)
+        )) if target_pages else []
+        
+        for (page_num, image_path), detection_result in zip(target_pages, detections):
+            # 分析页面中的图表位置
+            figure_info = analyze_page_figures(image_path, figure_request, page_num, document_id,
+                                               detection_result=detection_result)
+            if figure_info:
+                extracted_figures.extend(figure_info)
         
         # 如果有特定的Figure或Table编号请求，尝试精确匹配
         if figure_request.get('figure_number'):
@@ -175,59 +192,126 @@ def handle_general_chat(question):
             'error': f'聊天失败: {str(e)}'
         }), 500
 
-def handle_document_chat(document_id, question, session_id=None):
-    """处理文档相关聊天请求"""
-    try:
-        # 获取文档信息
-        doc_info = pdf_processor.get_document_info(document_id)
-        if not doc_info['success']:
-            return jsonify({
-                'success': False,
-                'error': '文档不存在或已被删除'
-            }), 404
-        
-        document = doc_info['document']
-        
-        # 分析问题
-        question_analyzer = QuestionAnalyzer()
-        question_analysis = question_analyzer.analyze_question(question)
-        
-        # 选择相关页面
-        relevant_pages = page_selector.select_relevant_pages(document_id, question)
+def prepare_document_question(document_id, question):
+    """准备文档问答需要的问题分析、相关页面内容和页面图片
+    
+    Args:
+        document_id: 文档ID
+        question: 用户问题
         
-        if not relevant_pages:
-            return jsonify({
-                'success': False,
-                'error': '无法找到相关页面'
-            }), 400
+    Returns:
+        (上下文字典, None)，失败时返回 (None, (错误信息, HTTP状态码))
+    """
+    # 获取文档信息
+    doc_info = pdf_processor.get_document_info(document_id)
+    if not doc_info['success']:
+        return None, ('文档不存在或已被删除', 404)
+    
+    # 分析问题
+    question_analyzer = QuestionAnalyzer()
+    question_analysis = question_analyzer.analyze_question(question)
+    
+    # 选择相关页面
+    relevant_pages = page_selector.select_relevant_pages(document_id, question)
+    
+    if not relevant_pages:
+        return None, ('无法找到相关页面', 400)
+    
+    # 获取页面内容
+    page_contents = page_selector.get_page_content(document_id, relevant_pages)
+    
+    # 获取页面图片
+    page_images = []
+    for page_num in relevant_pages:
+        image_path = pdf_processor.get_page_image_path(document_id, page_num)
+        if os.path.exists(image_path):
+            page_images.append({
+                'page': page_num,
+                'image_path': image_path
+            })
+    
+    if not page_images:
+        return None, ('无法获取页面图片', 500)
+    
+    # 页面笔记足以覆盖的页面（描述了图表、公式或内容充足）回答时不再发送图片
+    noted_pages = {page for page, page_notes in pdf_processor.get_page_notes(document_id, relevant_pages).items()
+                   if notes_cover_page(page_notes)}
+    answer_images = [img['image_path'] for img in page_images if img['page'] not in noted_pages]
+    answer_pages = [img['page'] for img in page_images if img['page'] not in noted_pages]
+    if not answer_images:
+        metrics.increment('answers_from_page_notes')
+    
+    return {
+        'question_analysis': question_analysis,
+        'relevant_pages': relevant_pages,
+        'page_contents': page_contents,
+        'page_images': page_images,
+        'answer_images': answer_images,
+        'answer_pages': answer_pages
+    }, None
+
+def lookup_cached_answer(document_id, question):
+    """在语义缓存中查找相似问题的回答
+    
+    Args:
+        document_id: 文档ID
+        question: 用户问题
         
-        # 获取页面内容
-        page_contents = page_selector.get_page_content(document_id, relevant_pages)
-        
-        # 获取页面图片
-        page_images = []
-        for page_num in relevant_pages:
-            image_path = pdf_processor.get_page_image_path(document_id, page_num)
-            if os.path.exists(image_path):
-                page_images.append({
-                    'page': page_num,
-                    'image_path': image_path
-                })
+    Returns:
+        带 cached、cached_question、cache_similarity 标记的回答数据，未命中时返回None
+    """
+    hit = semantic_cache.lookup(document_id, question)
+    if not hit:
+        return None
+    
+    # 文档已被删除（例如会话清理）时丢弃缓存
+    if not pdf_processor.get_document_info(document_id)['success']:
+        semantic_cache.invalidate(document_id)
+        return None
+    
+    return {
+        **hit['response'],
+        'cached': True,
+        'cached_question': hit['matched_question'],
+        'cache_similarity': hit['similarity']
+    }
+
+def handle_document_chat(document_id, question, session_id=None, use_cache=True):
+    """处理文档相关聊天请求
+    
+    Args:
+        document_id: 文档ID
+        question: 用户问题
+        session_id: 会话ID
+        use_cache: 是否使用语义缓存和响应缓存（客户端传 no_cache 时为False）
+    """
+    try:
+        # 相似问题已回答过时直接返回缓存的回答，不调用大模型
+        cached_response = lookup_cached_answer(document_id, question) if use_cache else None
+        if cached_response:
+            metrics.increment('semantic_cache_served')
+            save_session_messages(session_id, question, cached_response)
+            return jsonify(cached_response)
         
-        if not page_images:
+        prepared, error = prepare_document_question(document_id, question)
+        if error:
             return jsonify({
                 'success': False,
-                'error': '无法获取页面图片'
-            }), 500
+                'error': error[0]
+            }), error[1]
         
-        # 提取图片路径列表（用于answer_question方法）
-        image_paths = [img['image_path'] for img in page_images]
+        question_analysis = prepared['question_analysis']
+        relevant_pages = prepared['relevant_pages']
+        page_contents = prepared['page_contents']
+        page_images = prepared['page_images']
         
-        # 使用Qwen分析并回答问题
+        # 使用Qwen分析并回答问题（相关页面都被页面笔记覆盖时只调用文本模型）
         answer_result = qwen_client.answer_question(
             question=question,
             relevant_pages=page_contents,
-            page_images=image_paths
+            page_images=prepared['answer_images'],
+            use_cache=use_cache,
+            page_numbers=prepared['answer_pages']
         )
         
         # 检查是否有错误
@@ -238,178 +322,9 @@ def handle_document_chat(document_id, question, session_id=None):
             }), 500
         
         # 统一的Figure检测和截取逻辑
-        auto_extracted_figures = []
-        figures_info = []
-        
-        if question_analysis['figure_info']['has_figure_request']:
-            # 构建具体的Figure或Table查询字符串
-            figure_query = None
-            if question_analysis['figure_info']['figure_numbers']:
-                # 如果有具体的编号，根据查询类型构建查询字符串
-                figure_num = question_analysis['figure_info']['figure_numbers'][0]
-                
-                # 检测查询类型：Table还是Figure
-                question_lower = question.lower()
-                if any(keyword in question_lower for keyword in ['table', '表', '表格']):
-                    figure_query = f"Table {figure_num}"
-                    print(f"检测到Table查询，构建查询字符串: {figure_query}")
-                else:
-                    figure_query = f"Figure {figure_num}"
-                    print(f"检测到Figure查询，构建查询字符串: {figure_query}")
-            elif any(keyword in question.lower() for keyword in ['table', '表', '表格']):
-                # Table相关的一般性查询
-                figure_query = question
-                print(f"检测到Table一般性查询: {figure_query}")
-            elif 'figure' in question.lower() or 'fig' in question.lower():
-                # Figure相关的一般性查询
-                figure_query = question
-                print(f"检测到Figure一般性查询: {figure_query}")
-            
-            print(f"Figure查询: {figure_query}")
-            
-            # 收集所有检测到的Figure，按置信度排序
-            all_detected_figures = []
-            
-            for page_image in page_images:
-                page_num = page_image['page']
-                image_path = page_image['image_path']
-                
-                print(f"正在页面 {page_num} 中搜索目标Figure...")
-                
-                # 检测页面中的Figure
-                detected_figures = qwen_client.detect_figures_in_page(
-                    image_path, figure_query
-                )
-                
-                if detected_figures['success'] and detected_figures['figures']:
-                    # 只处理匹配查询的Figure
-                    matching_figures = [
-                        fig for fig in detected_figures['figures'] 
-                        if fig.get('matches_query', False) and fig.get('confidence', 0) >= 0.6
-                    ]
-                    
-                    for figure_data in matching_figures:
-                        figure_data['page_number'] = page_num
-                        figure_data['image_path'] = image_path
-                        all_detected_figures.append(figure_data)
-                        print(f"在页面 {page_num} 找到匹配Figure: {figure_data.get('title', 'unknown')} (置信度: {figure_data.get('confidence', 0):.2f})")
-                else:
-                    print(f"页面 {page_num} 中Figure检测失败或无Figure")
-            
-            # 按置信度降序排序，优先使用置信度最高的Figure
-            all_detected_figures.sort(key=lambda x: x.get('confidence', 0), reverse=True)
-            
-            if all_detected_figures:
-                print(f"\n=== 检测到 {len(all_detected_figures)} 个候选Figure ===")
-                
-                # 截取所有候选Figure用于审查
-                candidate_figures = []
-                for i, figure_data in enumerate(all_detected_figures[:3]):  # 最多审查前3个候选
-                    page_num = figure_data['page_number']
-                    
-                    print(f"截取候选Figure {i+1}: 页面{page_num}, 置信度{figure_data.get('confidence', 0):.2f}")
-                    
-                    # 获取Figure位置信息
-                    position = figure_data.get('position', {})
-                    x = position.get('x', 0) / 100.0  # 转换为0-1范围
-                    y = position.get('y', 0) / 100.0
-                    width = position.get('width', 100) / 100.0
-                    height = position.get('height', 100) / 100.0
-                    
-                    # 坐标校正：根据置信度进行微调
-                    confidence = figure_data.get('confidence', 0.8)
-                    if confidence < 0.9:  # 如果置信度不够高，进行保守的边界扩展
-                        margin = 0.02  # 2%的边界扩展
-                        x = max(0, x - margin)
-                        y = max(0, y - margin)
-                        width = min(1 - x, width + 2 * margin)
-                        height = min(1 - y, height + 2 * margin)
-                    
-                    # 确保坐标在有效范围内
-                    x = max(0, min(1, x))
-                    y = max(0, min(1, y))
-                    width = max(0.1, min(1 - x, width))
-                    height = max(0.1, min(1 - y, height))
-                    
-                    # 获取Figure名称
-                    figure_name = f"candidate_figure_{i+1}_page_{page_num}_{figure_data.get('id', 'unknown')}"
-                    
-                    figure_url = auto_extract_figure(
-                        document_id, page_num, x, y, width, height, figure_name
-                    )
-                    
-                    if figure_url:
-                        # 获取截取图片的完整路径（修正：使用实际的保存路径）
-                        figures_dir = os.path.join(Config.DATA_FOLDER, 'figures', document_id)
-                        # 从auto_extract_figure返回的URL中提取实际文件名
-                        figure_filename = figure_url.split('/')[-1]  # 提取最后的文件名部分
-                        figure_path = os.path.join(figures_dir, figure_filename)
-                        
-                        candidate_info = {
-                            'page_number': page_num,
-                            'figure_id': figure_data.get('id'),
-                            'title': figure_data.get('title'),
-                            'type': figure_data.get('type'),
-                            'description': figure_data.get('description'),
-                            'confidence': figure_data.get('confidence', 0.8),
-                            'matches_query': True,
-                            'figure_url': figure_url,
-                            'image_path': figure_path,  # 用于大模型审查
-                            'coordinates': {
-                                'x': x, 'y': y, 'width': width, 'height': height
-                            },
-                            'auto_extracted': True,
-                            'candidate_index': i
-                        }
-                        candidate_figures.append(candidate_info)
-                        print(f"成功截取候选Figure {i+1}: {figure_name}")
-                    else:
-                        print(f"候选Figure {i+1}截取失败: {figure_name}")
-                
-                # 使用大模型审查机制选择最佳Figure
-                if candidate_figures:
-                    print(f"\n=== 启动大模型审查机制 ===")
-                    print(f"候选Figure数量: {len(candidate_figures)}")
-                    
-                    review_result = qwen_client.review_extracted_figures(candidate_figures, question)
-                    
-                    if review_result['success']:
-                        # 使用审查推荐的最佳Figure
-                        recommended_figure = review_result['recommended_figure']
-                        review_data = review_result['review_data']
-                        
-                        print(f"\n=== 大模型审查完成 ===")
-                        print(f"推荐Figure: 候选{recommended_figure['candidate_index']+1}")
-                        print(f"审查置信度: {review_data.get('confidence', 0):.2f}")
-                        print(f"推荐理由: {review_data.get('summary', 'N/A')}")
-                        
-                        # 添加审查信息到Figure数据中
-                        recommended_figure['review_confidence'] = review_data.get('confidence', 0)
-                        recommended_figure['review_summary'] = review_data.get('summary', '')
-                        recommended_figure['review_data'] = review_data
-                        
-                        auto_extracted_figures.append(recommended_figure)
-                        print(f"最终选择Figure: {recommended_figure.get('title', 'unknown')}")
-                    else:
-                        # 如果审查失败，回退到置信度最高的Figure
-                        print(f"\n=== 大模型审查失败，回退到置信度排序 ===")
-                        print(f"审查失败原因: {review_result.get('error', 'unknown')}")
-                        
-                        best_figure = candidate_figures[0]  # 第一个就是置信度最高的
-                        auto_extracted_figures.append(best_figure)
-                        print(f"回退选择Figure: {best_figure.get('title', 'unknown')}")
-                else:
-                    print("所有候选Figure截取都失败了")
-            else:
-                print("在所有页面中都没有找到匹配的Figure")
-        else:
-            # 如果不是Figure查询，使用传统的extract_figures_from_answer方法
-            figures_info = extract_figures_from_answer(
-                answer_result['answer'], 
-                relevant_pages, 
-                document_id, 
-                question_analysis['figure_info']
-            )
+        figures_info, auto_extracted_figures = collect_answer_figures(
+            document_id, question, question_analysis, page_images, relevant_pages, answer_result['answer']
+        )
         
         response_data = {
             'success': True,
@@ -420,23 +335,10 @@ def handle_document_chat(document_id, question, session_id=None):
             'question_analysis': question_analysis
         }
         
+        semantic_cache.store(document_id, question, response_data, question_analysis)
+        
         # 保存聊天记录
-        if session_id:
-            session_manager.add_message(
-                session_id=session_id,
-                message_type='user',
-                content=question
-            )
-            session_manager.add_message(
-                session_id=session_id,
-                message_type='assistant',
-                content=answer_result['answer'],
-                metadata={
-                    'relevant_pages': relevant_pages,
-                    'figures': figures_info,
-                    'auto_extracted_figures': auto_extracted_figures
-                }
-            )
+        save_session_messages(session_id, question, response_data)
         
         return jsonify(response_data)
         
@@ -447,7 +349,230 @@ def handle_document_chat(document_id, question, session_id=None):
             'error': f'处理请求时出错: {str(e)}'
         }), 500
 
-def analyze_page_figures(image_path, figure_request, page_num, document_id):
+def save_session_messages(session_id, question, response_data):
+    """把问题和回答保存到会话记录"""
+    if not session_id:
+        return
+    
+    session_manager.add_message(
+        session_id=session_id,
+        message_type='user',
+        content=question
+    )
+    session_manager.add_message(
+        session_id=session_id,
+        message_type='assistant',
+        content=response_data['answer'],
+        metadata={
+            'relevant_pages': response_data['relevant_pages'],
+            'figures': response_data['figures'],
+            'auto_extracted_figures': response_data['auto_extracted_figures']
+        }
+    )
+
+def collect_answer_figures(document_id, question, question_analysis, page_images, relevant_pages, answer_text):
+    """检测并截取与问题相关的Figure
+    
+    Figure查询时逐页检测候选Figure，截取后交给大模型审查选出最佳结果；
+    其他问题从回答中解析页面位置提取图表。
+    
+    Args:
+        document_id: 文档ID
+        question: 用户问题
+        question_analysis: 问题分析结果
+        page_images: 相关页面图片列表（{'page', 'image_path'}）
+        relevant_pages: 相关页面列表
+        answer_text: AI回答内容
+        
+    Returns:
+        (figures_info, auto_extracted_figures)
+    """
+    auto_extracted_figures = []
+    figures_info = []
+    
+    if question_analysis['figure_info']['has_figure_request']:
+        # 构建具体的Figure或Table查询字符串
+        figure_query = None
+        if question_analysis['figure_info']['figure_numbers']:
+            # 如果有具体的编号，根据查询类型构建查询字符串
+            figure_num = question_analysis['figure_info']['figure_numbers'][0]
+            
+            # 检测查询类型：Table还是Figure
+            question_lower = question.lower()
+            if any(keyword in question_lower for keyword in ['table', '表', '表格']):
+                figure_query = f"Table {figure_num}"
+                print(f"检测到Table查询，构建查询字符串: {figure_query}")
+            else:
+                figure_query = f"Figure {figure_num}"
+                print(f"检测到Figure查询，构建查询字符串: {figure_query}")
+        elif any(keyword in question.lower() for keyword in ['table', '表', '表格']):
+            # Table相关的一般性查询
+            figure_query = question
+            print(f"检测到Table一般性查询: {figure_query}")
+        elif 'figure' in question.lower() or 'fig' in question.lower():
+            # Figure相关的一般性查询
+            figure_query = question
+            print(f"检测到Figure一般性查询: {figure_query}")
+        
+        print(f"Figure查询: {figure_query}")
+        
+        # 收集所有检测到的Figure，按置信度排序
+        all_detected_figures = []
+        
+        # 并发检测各页面中的Figure，结果按页面顺序返回
+        print(f"正在 {len(page_images)} 个页面中并发搜索目标Figure...")
+        detections = event_loop_thread.run(async_qwen_client.detect_figures_in_pages(
+            [page_image['image_path'] for page_image in page_images], figure_query
+        ))
+        
+        for page_image, detected_figures in zip(page_images, detections):
+            page_num = page_image['page']
+            image_path = page_image['image_path']
+            
+            if detected_figures['success'] and detected_figures['figures']:
+                # 只处理匹配查询的Figure
+                matching_figures = [
+                    fig for fig in detected_figures['figures'] 
+                    if fig.get('matches_query', False) and fig.get('confidence', 0) >= 0.6
+                ]
+                
+                for figure_data in matching_figures:
+                    figure_data['page_number'] = page_num
+                    figure_data['image_path'] = image_path
+                    all_detected_figures.append(figure_data)
+                    print(f"在页面 {page_num} 找到匹配Figure: {figure_data.get('title', 'unknown')} (置信度: {figure_data.get('confidence', 0):.2f})")
+            else:
+                print(f"页面 {page_num} 中Figure检测失败或无Figure")
+        
+        # 按置信度降序排序，优先使用置信度最高的Figure
+        all_detected_figures.sort(key=lambda x: x.get('confidence', 0), reverse=True)
+        
+        if all_detected_figures:
+            print(f"\n=== 检测到 {len(all_detected_figures)} 个候选Figure ===")
+            
+            # 截取所有候选Figure用于审查
+            candidate_figures = []
+            for i, figure_data in enumerate(all_detected_figures[:3]):  # 最多审查前3个候选
+                page_num = figure_data['page_number']
+                
+                print(f"截取候选Figure {i+1}: 页面{page_num}, 置信度{figure_data.get('confidence', 0):.2f}")
+                
+                # 获取Figure位置信息
+                position = figure_data.get('position', {})
+                x = position.get('x', 0) / 100.0  # 转换为0-1范围
+                y = position.get('y', 0) / 100.0
+                width = position.get('width', 100) / 100.0
+                height = position.get('height', 100) / 100.0
+                
+                # 坐标校正：根据置信度进行微调
+                confidence = figure_data.get('confidence', 0.8)
+                if confidence < 0.9:  # 如果置信度不够高，进行保守的边界扩展
+                    margin = 0.02  # 2%的边界扩展
+                    x = max(0, x - margin)
+                    y = max(0, y - margin)
+                    width = min(1 - x, width + 2 * margin)
+                    height = min(1 - y, height + 2 * margin)
+                
+                # 确保坐标在有效范围内
+                x = max(0, min(1, x))
+                y = max(0, min(1, y))
+                width = max(0.1, min(1 - x, width))
+                height = max(0.1, min(1 - y, height))
+                
+                # 获取Figure名称
+                figure_name = f"candidate_figure_{i+1}_page_{page_num}_{figure_data.get('id', 'unknown')}"
+                
+                figure_url = auto_extract_figure(
+                    document_id, page_num, x, y, width, height, figure_name
+                )
+                
+                if figure_url:
+                    # 获取截取图片的完整路径（修正：使用实际的保存路径）
+                    figures_dir = pdf_processor.get_figures_dir(document_id)
+                    # 从auto_extract_figure返回的URL中提取实际文件名
+                    figure_filename = figure_url.split('/')[-1]  # 提取最后的文件名部分
+                    figure_path = os.path.join(figures_dir, figure_filename)
+                    
+                    candidate_info = {
+                        'page_number': page_num,
+                        'figure_id': figure_data.get('id'),
+                        'title': figure_data.get('title'),
+                        'type': figure_data.get('type'),
+                        'description': figure_data.get('description'),
+                        'confidence': figure_data.get('confidence', 0.8),
+                        'matches_query': True,
+                        'figure_url': figure_url,
+                        'image_path': figure_path,  # 用于大模型审查
+                        'coordinates': {
+                            'x': x, 'y': y, 'width': width, 'height': height
+                        },
+                        'auto_extracted': True,
+                        'candidate_index': i
+                    }
+                    candidate_figures.append(candidate_info)
+                    print(f"成功截取候选Figure {i+1}: {figure_name}")
+                else:
+                    print(f"候选Figure {i+1}截取失败: {figure_name}")
+            
+            # 使用大模型审查机制选择最佳Figure
+            if candidate_figures:
+                print(f"\n=== 启动大模型审查机制 ===")
+                print(f"候选Figure数量: {len(candidate_figures)}")
+                
+                review_result = qwen_client.review_extracted_figures(candidate_figures, question)
+                
+                if review_result['success']:
+                    # 使用审查推荐的最佳Figure
+                    recommended_figure = review_result['recommended_figure']
+                    review_data = review_result['review_data']
+                    
+                    print(f"\n=== 大模型审查完成 ===")
+                    print(f"推荐Figure: 候选{recommended_figure['candidate_index']+1}")
+                    print(f"审查置信度: {review_data.get('confidence', 0):.2f}")
+                    print(f"推荐理由: {review_data.get('summary', 'N/A')}")
+                    
+                    # 添加审查信息到Figure数据中
+                    recommended_figure['review_confidence'] = review_data.get('confidence', 0)
+                    recommended_figure['review_summary'] = review_data.get('summary', '')
+                    recommended_figure['review_data'] = review_data
+                    
+                    auto_extracted_figures.append(recommended_figure)
+                    print(f"最终选择Figure: {recommended_figure.get('title', 'unknown')}")
+                else:
+                    # 如果审查失败，回退到置信度最高的Figure
+                    print(f"\n=== 大模型审查失败，回退到置信度排序 ===")
+                    print(f"审查失败原因: {review_result.get('error', 'unknown')}")
+                    
+                    best_figure = candidate_figures[0]  # 第一个就是置信度最高的
+                    auto_extracted_figures.append(best_figure)
+                    print(f"回退选择Figure: {best_figure.get('title', 'unknown')}")
+            else:
+                print("所有候选Figure截取都失败了")
+        else:
+            print("在所有页面中都没有找到匹配的Figure")
+    else:
+        # 如果不是Figure查询，使用传统的extract_figures_from_answer方法
+        figures_info = extract_figures_from_answer(
+            answer_text, 
+            relevant_pages, 
+            document_id, 
+            question_analysis['figure_info']
+        )
+    
+    return figures_info, auto_extracted_figures
+
+def build_figure_query(figure_request):
+    """根据Figure请求信息构建检测用的查询字符串"""
+    if figure_request:
+        if 'figure_number' in figure_request:
+            return f"Figure {figure_request['figure_number']}"
+        elif 'table_number' in figure_request:
+            return f"Table {figure_request['table_number']}"
+        elif 'query_text' in figure_request:
+            return figure_request['query_text']
+    return None
+
+def analyze_page_figures(image_path, figure_request, page_num, document_id, detection_result=None):
     """分析页面中的图表信息并自动截取
     
     Args:
@@ -455,6 +580,7 @@ def analyze_page_figures(image_path, figure_request, page_num, document_id):
         figure_request: Figure请求信息
         page_num: 页面号
         document_id: 文档ID
+        detection_result: 已完成的Figure检测结果，为空时在此检测
         
     Returns:
         图表信息列表
@@ -463,19 +589,13 @@ def analyze_page_figures(image_path, figure_request, page_num, document_id):
         print(f"\n=== 开始分析页面 {page_num} 中的图表 ===")
         
         # 构建查询字符串
-        figure_query = None
-        if figure_request:
-            if 'figure_number' in figure_request:
-                figure_query = f"Figure {figure_request['figure_number']}"
-            elif 'table_number' in figure_request:
-                figure_query = f"Table {figure_request['table_number']}"
-            elif 'query_text' in figure_request:
-                figure_query = figure_request['query_text']
+        figure_query = build_figure_query(figure_request)
         
         print(f"Figure查询: {figure_query}")
         
         # 使用新的Figure检测功能
-        detection_result = qwen_client.detect_figures_in_page(image_path, figure_query)
+        if detection_result is None:
+            detection_result = qwen_client.detect_figures_in_page(image_path, figure_query)
         
         extracted_figures = []
         
@@ -673,7 +793,7 @@ def auto_extract_figure(document_id, page_number, x, y, width, height, figure_na
             return None
         
         # 创建figures目录
-        figures_dir = os.path.join(Config.DATA_FOLDER, 'figures', document_id)
+        figures_dir = pdf_processor.get_figures_dir(document_id)
         os.makedirs(figures_dir, exist_ok=True)
         
         # 生成唯一的文件名
@@ -789,6 +909,7 @@ def chat():
         
         document_id = data.get('document_id')
         question = data.get('question', '').strip()
+        use_cache = not data.get('no_cache', False)
         
         if not question:
             print("错误: 问题不能为空")
@@ -809,7 +930,7 @@ def chat():
         
         print("处理类型: 文档相关问答")
         print("=== 开始处理文档聊天 ===\n")
-        return handle_document_chat(document_id, question)
+        return handle_document_chat(document_id, question, use_cache=use_cache)
         
 
         
@@ -821,6 +942,175 @@ def chat():
             'error': f'处理问题时出现错误: {str(e)}'
         }), 500
 
+def sse_event(event, data):
+    """格式化一条Server-Sent Events消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@chat_bp.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """流式聊天接口（Server-Sent Events）
+    
+    依次发送 meta（相关页面）、若干 delta（增量文本）和 done（完整回答、Figure、耗时），
+    出错时发送 error。完整回答通过 add_conversation 保存。
+    相似问题命中语义缓存时一次性发送完整回答，done 中带 cached 标记；请求中传 no_cache 可跳过缓存。
+    """
+    started_at = time.perf_counter()
+    data = request.get_json(silent=True)
+    
+    if not data:
+        return jsonify({
+            'success': False,
+            'error': '请求数据为空'
+        }), 400
+    
+    document_id = data.get('document_id')
+    question = data.get('question', '').strip()
+    use_cache = not data.get('no_cache', False)
+    
+    if not question:
+        return jsonify({
+            'success': False,
+            'error': '问题不能为空'
+        }), 400
+    
+    print(f"\n=== 收到流式聊天请求 ===")
+    print(f"用户问题: {question}")
+    print(f"文档ID: {document_id if document_id else '无（通用聊天）'}")
+    
+    if document_id and use_cache:
+        cached_response = lookup_cached_answer(document_id, question)
+        if cached_response:
+            metrics.increment('semantic_cache_served')
+            return Response(
+                stream_cached_answer(document_id, question, cached_response, started_at),
+                mimetype='text/event-stream',
+                headers={
+                    'Cache-Control': 'no-cache',
+                    'X-Accel-Buffering': 'no'
+                }
+            )
+    
+    prepared = None
+    if document_id:
+        prepared, error = prepare_document_question(document_id, question)
+        if error:
+            return jsonify({
+                'success': False,
+                'error': error[0]
+            }), error[1]
+    
+    def generate():
+        first_token_at = None
+        parts = []
+        relevant_pages = prepared['relevant_pages'] if prepared else []
+        
+        try:
+            yield sse_event('meta', {
+                'relevant_pages': relevant_pages,
+                'is_general_chat': prepared is None
+            })
+            
+            if prepared:
+                events = qwen_client.answer_question_stream(
+                    question=question,
+                    relevant_pages=prepared['page_contents'],
+                    page_images=prepared['answer_images'],
+                    page_numbers=prepared['answer_pages']
+                )
+            else:
+                conversation_history = pdf_processor.get_conversations('')
+                events = ({'type': 'delta', 'content': delta}
+                          for delta in qwen_client.chat_stream(question, conversation_history))
+            
+            result = {}
+            for event in events:
+                if event['type'] != 'delta':
+                    result = event
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    metrics.observe('chat_stream_ttft', first_token_at - started_at)
+                    print(f"首个token耗时: {(first_token_at - started_at) * 1000:.0f} ms")
+                parts.append(event['content'])
+                yield sse_event('delta', {'content': event['content']})
+            
+            answer = result.get('answer', ''.join(parts))
+            
+            figures_info, auto_extracted_figures = [], []
+            if prepared:
+                figures_info, auto_extracted_figures = collect_answer_figures(
+                    document_id, question, prepared['question_analysis'],
+                    prepared['page_images'], relevant_pages, answer
+                )
+            
+            # 保存完整回答
+            pdf_processor.add_conversation(document_id or '', question, answer, relevant_pages)
+            
+            response_data = {
+                'success': True,
+                'answer': answer,
+                'answer_type': result.get('answer_type', 'text'),
+                'confidence': result.get('confidence', 0.8),
+                'model_used': result.get('model_used', qwen_client.text_model),
+                'relevant_pages': relevant_pages,
+                'figures': figures_info,
+                'auto_extracted_figures': auto_extracted_figures
+            }
+            if prepared:
+                semantic_cache.store(document_id, question, response_data, prepared['question_analysis'])
+            
+            total_seconds = time.perf_counter() - started_at
+            metrics.observe('chat_stream_total', total_seconds)
+            metrics.increment('chat_stream_completed')
+            print(f"=== 流式聊天完成，总耗时 {total_seconds:.1f} 秒 ===\n")
+            
+            yield sse_event('done', {
+                **response_data,
+                'is_general_chat': prepared is None,
+                'ttft_ms': round((first_token_at - started_at) * 1000) if first_token_at else None,
+                'total_ms': round(total_seconds * 1000)
+            })
+        except Exception as e:
+            print(f"流式聊天异常: {str(e)}")
+            metrics.increment('chat_stream_failed')
+            yield sse_event('error', {
+                'success': False,
+                'error': f'处理问题时出现错误: {str(e)}'
+            })
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # 禁止反向代理缓冲
+        }
+    )
+
+def stream_cached_answer(document_id, question, cached_response, started_at):
+    """以SSE事件发送语义缓存命中的回答（meta、一个包含完整回答的 delta 和 done）"""
+    relevant_pages = cached_response.get('relevant_pages', [])
+    yield sse_event('meta', {
+        'relevant_pages': relevant_pages,
+        'is_general_chat': False,
+        'cached': True
+    })
+    yield sse_event('delta', {'content': cached_response['answer']})
+    
+    pdf_processor.add_conversation(document_id, question, cached_response['answer'], relevant_pages)
+    
+    total_seconds = time.perf_counter() - started_at
+    metrics.observe('chat_stream_total', total_seconds)
+    metrics.increment('chat_stream_completed')
+    print(f"=== 流式聊天完成（语义缓存），总耗时 {total_seconds * 1000:.0f} ms ===\n")
+    
+    yield sse_event('done', {
+        **cached_response,
+        'is_general_chat': False,
+        'ttft_ms': round(total_seconds * 1000),
+        'total_ms': round(total_seconds * 1000)
+    })
+
 @chat_bp.route('/api/chat/analyze', methods=['POST'])
 def analyze_question():
     """分析问题（调试用）"""
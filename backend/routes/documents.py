@@ -1,12 +1,13 @@
-from flask import Blueprint, jsonify, send_file, current_app
+from flask import Blueprint, jsonify, request, send_file, current_app
 import os
+import threading
 from backend.services.pdf_processor import PDFProcessor
-from backend.services.qwen_client import QwenClient
-from config import Config
+from backend.services.summarizer import document_summarizer
+from backend.services.summary_progress import summary_progress
+from backend.utils.cancellation import CancelledError, cancellable, cancellation_registry
 
 documents_bp = Blueprint('documents', __name__)
 pdf_processor = PDFProcessor()
-qwen_client = QwenClient()
 
 @documents_bp.route('/api/documents', methods=['GET'])
 def get_documents():
@@ -36,9 +37,109 @@ def get_document(document_id):
             'error': f'获取文档信息失败: {str(e)}'
         }), 500
 
+def load_saved_summary(document_id):
+    """读取文档已保存的总结，没有时返回None"""
+    doc_info = pdf_processor.get_document_info(document_id)
+    return doc_info['document'].get('summary') if doc_info['success'] else None
+
+def collect_page_images(document_id, document):
+    """收集文档所有页面的 (页码, 图片路径)（懒加载模式下会渲染尚未生成的页面）
+    
+    缺失的页面被跳过但保留其余页面的实际页码，总结中的页码标注和页面笔记不会错位。
+    """
+    pages = []
+    for page_info in document['pages']:
+        image_path = pdf_processor.get_page_image_path(document_id, page_info['page_number'])
+        if os.path.exists(image_path):
+            pages.append((page_info['page_number'], image_path))
+    return pages
+
+def generate_summary(document_id, document, pages):
+    """分块并发分析页面后逐级合并生成并保存总结
+    
+    各阶段输出保存为检查点，之前失败或被取消时只执行缺失的阶段；
+    上传后台线程或其他请求正在生成同一文档的总结时等待其结果。
+    """
+    return document_summarizer.summarize_once(
+        pages,
+        pdf_processor.get_artifact_id(document_id),
+        load_summary=lambda: load_saved_summary(document_id),
+        save_summary=lambda summary: pdf_processor.update_document_summary(document_id, summary),
+        total_pages=document.get('total_pages')
+    )
+
+def start_background_summary(document_id, document, artifact_id):
+    """在后台线程中生成总结（删除文档或结束会话时可取消）"""
+    summary_progress.begin(artifact_id)
+    
+    def run():
+        try:
+            with cancellable(document_id):
+                pages = collect_page_images(document_id, document)
+                if not pages:
+                    raise ValueError('无法找到文档图片')
+                generate_summary(document_id, document, pages)
+        except BaseException as e:
+            print(f"后台生成文档总结失败: {e}")
+            summary_progress.fail(artifact_id, str(e) or type(e).__name__)
+    
+    threading.Thread(target=run, daemon=True, name=f'summary-{document_id[:8]}').start()
+
+def get_summary_progress(document_id, document, cursor):
+    """按游标返回总结的生成进度：尚未开始时在后台开始生成，立即返回
+    
+    Args:
+        document_id: 文档ID
+        document: 文档元数据
+        cursor: 客户端已收到的部分结果数
+    
+    Returns:
+        status为done时包含最终总结；running时包含游标之后新完成的分块分析和中间摘要
+    """
+    summary = document.get('summary')
+    artifact_id = pdf_processor.get_artifact_id(document_id)
+    progress = summary_progress.get(artifact_id, cursor)
+    
+    if not summary and progress['status'] != 'running':
+        # 两次读取之间可能刚好生成完成
+        summary = load_saved_summary(document_id)
+        # 失败后重新加载页面（游标为0）时重试，仍在轮询的客户端收到失败状态
+        if not summary and (progress['status'] == 'idle' or cursor == 0):
+            start_background_summary(document_id, document, artifact_id)
+            progress = summary_progress.get(artifact_id, cursor)
+    
+    if summary:
+        return jsonify({
+            'success': True,
+            'status': 'done',
+            'summary': summary,
+            'parts': [],
+            'cursor': cursor,
+            'reset': False
+        })
+    
+    if progress['status'] == 'failed':
+        return jsonify({
+            'success': False,
+            'status': 'failed',
+            'error': f"文档分析失败: {progress['error']}"
+        }), 500
+    
+    return jsonify({
+        'success': True,
+        'status': progress['status'],
+        'parts': progress['parts'],
+        'cursor': progress['cursor'],
+        'total_chunks': progress['total_chunks'],
+        'reset': progress['reset']
+    })
+
 @documents_bp.route('/api/documents/<document_id>/summary', methods=['GET'])
 def get_document_summary(document_id):
-    """获取文档总结"""
+    """获取文档总结
+    
+    带 cursor 参数时不等待生成完成：返回游标之后新完成的部分结果，客户端轮询直到 status 为 done。
+    """
     try:
         # 获取文档信息
         doc_info = pdf_processor.get_document_info(document_id)
@@ -47,6 +148,10 @@ def get_document_summary(document_id):
         
         document = doc_info['document']
         
+        cursor = request.args.get('cursor', type=int)
+        if cursor is not None:
+            return get_summary_progress(document_id, document, max(0, cursor))
+        
         # 检查是否已有总结
         if document.get('summary'):
             return jsonify({
@@ -56,25 +161,22 @@ def get_document_summary(document_id):
             })
         
         # 生成总结 - 使用批量分析方法
-        image_paths = []
+        pages = collect_page_images(document_id, document)
         
-        # 收集所有页面图片路径
-        for page_info in document['pages']:
-            page_number = page_info['page_number']
-            image_path = pdf_processor.get_page_image_path(document_id, page_number)
-            
-            if os.path.exists(image_path):
-                image_paths.append(image_path)
-        
-        if not image_paths:
+        if not pages:
             return jsonify({
                 'success': False,
                 'error': '无法找到文档图片'
             }), 500
         
-        # 使用新的直接从图片生成总结的方法
         try:
-            summary = qwen_client.generate_document_summary_from_images(image_paths)
+            with cancellable(document_id):
+                result = generate_summary(document_id, document, pages)
+        except CancelledError as e:
+            return jsonify({
+                'success': False,
+                'error': f'总结生成已取消: {e}'
+            }), 409
         except Exception as e:
             print(f"批量分析失败: {str(e)}")
             return jsonify({
@@ -82,13 +184,14 @@ def get_document_summary(document_id):
                 'error': f'文档分析失败: {str(e)}'
             }), 500
         
-        # 保存总结
-        pdf_processor.update_document_summary(document_id, summary)
-        
         return jsonify({
             'success': True,
-            'summary': summary,
-            'cached': False
+            'summary': result['summary'],
+            'cached': False,
+            'shared': result['shared'],
+            'stages': result['stages'],
+            'skipped_stages': result['skipped_stages'],
+            'skipped_seconds': result['skipped_seconds']
         })
         
     except Exception as e:
@@ -229,7 +332,7 @@ def extract_figure(document_id, page_number):
             cropped_img = img.crop((left, top, right, bottom))
             
             # 保存截取的图片
-            figures_dir = os.path.join(Config.DATA_FOLDER, 'figures', document_id)
+            figures_dir = pdf_processor.get_figures_dir(document_id)
             os.makedirs(figures_dir, exist_ok=True)
             
             figure_filename = f'{figure_name}_page_{page_number}.png'
@@ -261,7 +364,7 @@ def extract_figure(document_id, page_number):
 def get_figure(document_id, figure_filename):
     """获取截取的Figure图片"""
     try:
-        figures_dir = os.path.join(Config.DATA_FOLDER, 'figures', document_id)
+        figures_dir = pdf_processor.get_figures_dir(document_id)
         figure_path = os.path.join(figures_dir, figure_filename)
         
         if not os.path.exists(figure_path):
@@ -307,29 +410,26 @@ def get_conversations(document_id):
 def delete_document(document_id):
     """删除文档"""
     try:
+        # 先取消该文档进行中的处理和总结生成
+        cancelled = cancellation_registry.cancel(document_id, '文档已删除')
+        
         # 获取文档信息
         doc_info = pdf_processor.get_document_info(document_id)
         if not doc_info['success']:
+            if cancelled:
+                # 文档仍在处理中，取消后由处理任务自行清理
+                return jsonify({
+                    'success': True,
+                    'message': '文档处理已取消'
+                })
             return jsonify(doc_info), 404
         
-        document = doc_info['document']
-        
-        # 删除相关文件
-        import shutil
-        
-        # 删除图片目录
-        images_dir = os.path.join(Config.DATA_FOLDER, 'images', document_id)
-        if os.path.exists(images_dir):
-            shutil.rmtree(images_dir)
-        
-        # 删除原始PDF文件
-        if os.path.exists(document['original_path']):
-            os.remove(document['original_path'])
-        
-        # 删除元数据文件
-        metadata_path = os.path.join(Config.DATA_FOLDER, f'{document_id}.json')
-        if os.path.exists(metadata_path):
-            os.remove(metadata_path)
+        # 删除元数据；页面图片、Figure和原始PDF在没有其他文档引用时删除
+        if not pdf_processor.delete_document(document_id):
+            return jsonify({
+                'success': False,
+                'error': '删除文档失败'
+            }), 500
         
         return jsonify({
             'success': True,
@@ -1,21 +1,26 @@
 from flask import Blueprint, request, jsonify, current_app, session
 import os
 import uuid
-import threading
+import hashlib
 import time
 from werkzeug.utils import secure_filename
 from backend.services.pdf_processor import PDFProcessor
-from backend.services.qwen_client import QwenClient
+from backend.services.summarizer import document_summarizer
 from backend.utils.session_manager import session_manager
+from backend.utils.job_queue import JobQueue, QueueFullError, JOB_PRIORITIES
+from backend.utils.cancellation import CancelledError, cancellation_registry
+from backend.utils.artifact_store import artifact_store, ArtifactRegistryError
 from config import Config
 
 upload_bp = Blueprint('upload', __name__)
 pdf_processor = PDFProcessor()
-qwen_client = QwenClient()
 
 # 进度状态存储
 processing_progress = {}
 
+# 保存上传文件时每次读取的字节数
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
 def update_progress(document_id, progress, message):
     """更新处理进度"""
     processing_progress[document_id] = {
@@ -24,6 +29,11 @@ def update_progress(document_id, progress, message):
         'timestamp': time.time()
     }
 
+def load_saved_summary(document_id):
+    """读取文档已保存的总结，没有时返回None"""
+    doc_info = pdf_processor.get_document_info(document_id)
+    return doc_info['document'].get('summary') if doc_info['success'] else None
+
 def generate_document_summary(document_id):
     """生成文档总结
     
@@ -52,27 +62,34 @@ def generate_document_summary(document_id):
         # 批量分析所有页面图片（根据实际页数）
         print(f"将批量分析所有 {total_pages} 页内容")
         
-        # 收集所有图片路径
-        image_paths = []
+        # 收集所有图片路径（保留实际页码，缺失的页面不会使后续页面的页码错位）
+        pages = []
         for page_num in range(1, total_pages + 1):
             image_path = pdf_processor.get_page_image_path(document_id, page_num)
             if os.path.exists(image_path):
-                image_paths.append(image_path)
+                pages.append((page_num, image_path))
                 print(f"添加第 {page_num} 页图片: {image_path}")
             else:
                 print(f"第 {page_num} 页图片文件不存在: {image_path}")
         
-        if not image_paths:
+        if not pages:
             print("没有找到任何有效的页面图片")
             print("=== 文档总结生成失败 ===\n")
             return "无法找到文档图片，请检查文档格式。"
         
-        print(f"找到 {len(image_paths)} 个有效图片文件")
+        print(f"找到 {len(pages)} 个有效图片文件")
         
         try:
-            # 使用新的直接从图片生成总结的方法
-            print("正在从图片直接生成文档总结...")
-            summary = qwen_client.generate_document_summary_from_images(image_paths)
+            # 分块并发分析页面后逐级合并生成总结（总结接口同时请求时共享同一次生成）
+            print("正在分块分析页面并生成文档总结...")
+            result = document_summarizer.summarize_once(
+                pages,
+                pdf_processor.get_artifact_id(document_id),
+                load_summary=lambda: load_saved_summary(document_id),
+                save_summary=lambda summary: pdf_processor.update_document_summary(document_id, summary),
+                total_pages=total_pages
+            )
+            summary = result['summary']
             
         except Exception as e:
             print(f"批量分析失败: {str(e)}")
@@ -95,32 +112,39 @@ def generate_document_summary(document_id):
         print("=== 文档总结生成异常 ===\n")
         return None
 
-def process_pdf_async(file_path, filename, document_id, session_id):
-    """异步处理PDF"""
+def process_pdf_async(file_path, filename, document_id, session_id, content_hash=None, generate_summary=True):
+    """异步处理PDF（由入库任务队列的工作线程调用）"""
     try:
         result = pdf_processor.process_pdf(file_path, filename, 
-                                         lambda doc_id, prog, msg: update_progress(doc_id, prog, msg))
+                                         lambda doc_id, prog, msg: update_progress(doc_id, prog, msg),
+                                         document_id=document_id,
+                                         content_hash=content_hash)
         
         if result['success']:
             # 将文档与当前会话关联
             if session_id:
                 session_manager.add_document_to_session(session_id, result['document_id'])
             
-            # 更新进度：开始生成文档总结
-            update_progress(document_id, 95, "正在生成文档总结...")
-            
-            # 生成文档总结
-            try:
-                summary = generate_document_summary(result['document_id'])
-                if summary:
-                    # 保存总结到文档元数据
-                    pdf_processor.update_document_summary(result['document_id'], summary)
-                    update_progress(document_id, 98, "文档总结生成完成")
-                else:
-                    update_progress(document_id, 98, "文档总结生成失败，但PDF处理完成")
-            except Exception as e:
-                print(f"生成文档总结失败: {str(e)}")
-                update_progress(document_id, 98, f"文档总结生成失败: {str(e)}，但PDF处理完成")
+            # 复用已有产物时总结随产物一起复用，无需再次调用大模型
+            # （同步上传接口不生成总结，首次查看总结时再生成）
+            doc_info = pdf_processor.get_document_info(result['document_id'])
+            if doc_info['success'] and doc_info['document'].get('summary'):
+                update_progress(document_id, 98, "已复用相同文件的文档总结")
+            elif generate_summary:
+                # 更新进度：开始生成文档总结
+                update_progress(document_id, 95, "正在生成文档总结...")
+                
+                # 生成文档总结
+                try:
+                    # 生成成功的总结已在单飞协调内保存到文档元数据，失败时不保存，查看总结时重试
+                    generate_document_summary(result['document_id'])
+                    if load_saved_summary(result['document_id']):
+                        update_progress(document_id, 98, "文档总结生成完成")
+                    else:
+                        update_progress(document_id, 98, "文档总结生成失败，但PDF处理完成")
+                except Exception as e:
+                    print(f"生成文档总结失败: {str(e)}")
+                    update_progress(document_id, 98, f"文档总结生成失败: {str(e)}，但PDF处理完成")
             
             # 更新最终状态
             processing_progress[document_id] = {
@@ -130,6 +154,8 @@ def process_pdf_async(file_path, filename, document_id, session_id):
                 'document_id': result['document_id'],
                 'total_pages': result['total_pages'],
                 'file_size': result['file_size'],
+                'pages_per_second': result.get('pages_per_second'),
+                'deduplicated': result.get('deduplicated', False),
                 'filename': filename
             }
         else:
@@ -143,6 +169,16 @@ def process_pdf_async(file_path, filename, document_id, session_id):
                 'success': False
             }
             
+    except CancelledError as e:
+        # 已取消：删除已生成的文档数据、页面和上传文件，再交给队列记录
+        if not pdf_processor.delete_document(document_id):
+            try:
+                artifact_store.release(document_id, document_id, file_path)
+            except ArtifactRegistryError as registry_error:
+                print(f"清理已取消的上传失败: {registry_error}")
+        _mark_cancelled(document_id, e)
+        raise
+    
     except Exception as e:
         # 删除上传的文件
         if os.path.exists(file_path):
@@ -154,6 +190,46 @@ def process_pdf_async(file_path, filename, document_id, session_id):
             'success': False
         }
 
+def discard_queued_upload(file_path, document_id, reason=None, **kwargs):
+    """清理在排队中被取消的上传任务"""
+    if os.path.exists(file_path):
+        os.remove(file_path)
+    _mark_cancelled(document_id, reason)
+
+def _mark_cancelled(document_id, reason):
+    """记录任务已取消的进度状态"""
+    processing_progress[document_id] = {
+        'progress': -1,
+        'message': f'处理已取消: {reason or "任务已取消"}',
+        'success': False,
+        'cancelled': True,
+        'timestamp': time.time()
+    }
+
+# PDF入库任务队列：固定数量的工作线程处理上传，未完成的任务记录在 data/jobs 中
+ingest_queue = JobQueue(
+    'ingest',
+    process_pdf_async,
+    cancel_handler=discard_queued_upload,
+    workers=Config.INGEST_WORKERS,
+    max_depth=Config.INGEST_QUEUE_MAX_DEPTH,
+    policy=Config.INGEST_QUEUE_POLICY,
+    journal_dir=os.path.join(Config.DATA_FOLDER, 'jobs'),
+    default_retry_after=Config.INGEST_RETRY_AFTER
+)
+ingest_queue.start()
+
+def _queue_full_response(retry_after):
+    """构建队列已满的429响应"""
+    response = jsonify({
+        'success': False,
+        'error': f'当前上传任务过多，请在{retry_after}秒后重试',
+        'retry_after': retry_after
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
 @upload_bp.route('/api/upload', methods=['POST'])
 def upload_file():
     """上传PDF文件"""
@@ -202,32 +278,52 @@ def upload_file():
         # 确保上传目录存在
         os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
         
-        file.save(file_path)
+        try:
+            ingest_queue.check_capacity()
+        except QueueFullError as e:
+            return _queue_full_response(e.retry_after)
         
-        # 处理PDF
-        result = pdf_processor.process_pdf(file_path, filename)
+        content_hash = _save_upload(file, file_path)
         
-        if result['success']:
-            # 将文档与当前会话关联
-            session_id = session.get('session_id')
-            if session_id:
-                session_manager.add_document_to_session(session_id, result['document_id'])
-            
+        # 通过入库队列处理PDF并等待完成（相同内容的文件直接复用已有结果）
+        document_id = str(uuid.uuid4())
+        try:
+            ingest_queue.submit(document_id, {
+                'file_path': file_path,
+                'filename': filename,
+                'document_id': document_id,
+                'session_id': session.get('session_id'),
+                'content_hash': content_hash,
+                'generate_summary': False
+            })
+        except QueueFullError as e:
+            os.remove(file_path)
+            return _queue_full_response(e.retry_after)
+        
+        # 最多等待配置的时间，超时后返回202，客户端改为通过进度接口查询
+        if not ingest_queue.wait(document_id, timeout=Config.INGEST_SYNC_WAIT_SECONDS):
+            return jsonify({
+                'success': True,
+                'message': '文件上传成功，仍在处理中，请通过进度接口查询结果',
+                'document_id': document_id,
+                'job_id': document_id,
+                'queue_position': ingest_queue.get_position(document_id)
+            }), 202
+        result = processing_progress.pop(document_id, None) or {}
+        
+        if result.get('success'):
             return jsonify({
                 'success': True,
                 'message': '文件上传并处理成功',
                 'document_id': result['document_id'],
                 'total_pages': result['total_pages'],
-                'file_size': result['file_size']
+                'file_size': result['file_size'],
+                'deduplicated': result.get('deduplicated', False)
             })
         else:
-            # 删除上传的文件
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            
             return jsonify({
                 'success': False,
-                'error': result['error']
+                'error': result.get('message', 'PDF处理失败')
             }), 500
             
     except Exception as e:
@@ -242,6 +338,23 @@ def _allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in {'pdf'}
 
+def _save_upload(file, file_path):
+    """保存上传文件，同时流式计算内容的SHA-256
+    
+    Args:
+        file: 上传的文件对象
+        file_path: 保存路径
+        
+    Returns:
+        文件内容的SHA-256（十六进制）
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, 'wb') as f:
+        for chunk in iter(lambda: file.stream.read(UPLOAD_CHUNK_SIZE), b''):
+            sha256.update(chunk)
+            f.write(chunk)
+    return sha256.hexdigest()
+
 @upload_bp.route('/api/upload/with-progress', methods=['POST'])
 def upload_file_with_progress():
     """上传PDF文件（带进度）"""
@@ -290,7 +403,13 @@ def upload_file_with_progress():
         # 确保上传目录存在
         os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
         
-        file.save(file_path)
+        # 队列已满时在保存文件前拒绝
+        try:
+            ingest_queue.check_capacity()
+        except QueueFullError as e:
+            return _queue_full_response(e.retry_after)
+        
+        content_hash = _save_upload(file, file_path)
         
         # 生成处理ID
         document_id = str(uuid.uuid4())
@@ -302,21 +421,31 @@ def upload_file_with_progress():
             'timestamp': time.time()
         }
         
-        # 获取会话ID
+        # 获取会话ID，提交时即关联文档，会话结束时可以取消处理中的任务
         session_id = session.get('session_id')
+        if session_id:
+            session_manager.add_document_to_session(session_id, document_id)
         
-        # 启动异步处理
-        thread = threading.Thread(
-            target=process_pdf_async,
-            args=(file_path, filename, document_id, session_id)
-        )
-        thread.daemon = True
-        thread.start()
+        # 提交到入库队列
+        priority = JOB_PRIORITIES.get(request.form.get('priority', 'normal'), JOB_PRIORITIES['normal'])
+        try:
+            queue_position = ingest_queue.submit(document_id, {
+                'file_path': file_path,
+                'filename': filename,
+                'document_id': document_id,
+                'session_id': session_id,
+                'content_hash': content_hash
+            }, priority=priority)
+        except QueueFullError as e:
+            processing_progress.pop(document_id, None)
+            os.remove(file_path)
+            return _queue_full_response(e.retry_after)
         
         return jsonify({
             'success': True,
             'message': '文件上传成功，开始处理',
-            'document_id': document_id
+            'document_id': document_id,
+            'queue_position': queue_position
         })
         
     except Exception as e:
@@ -330,13 +459,26 @@ def upload_file_with_progress():
 def get_upload_progress(document_id):
     """获取上传处理进度"""
     try:
-        if document_id not in processing_progress:
+        queue_position = ingest_queue.get_position(document_id)
+        if document_id not in processing_progress and queue_position is None:
             return jsonify({
                 'success': False,
                 'error': '未找到处理记录'
             }), 404
         
-        progress_info = processing_progress[document_id]
+        progress_info = processing_progress.get(document_id, {
+            'progress': 0,
+            'message': '等待处理...',
+            'timestamp': time.time()
+        })
+        
+        # 排队中的任务显示队列位置
+        if queue_position:
+            progress_info = {
+                **progress_info,
+                'queue_position': queue_position,
+                'message': f'排队等待处理（第{queue_position}位）...'
+            }
         
         # 如果处理完成，清理进度记录（延迟清理）
         if progress_info.get('progress') == 100 or progress_info.get('progress') == -1:
@@ -356,6 +498,38 @@ def get_upload_progress(document_id):
             'error': f'获取进度失败: {str(e)}'
         }), 500
 
+@upload_bp.route('/api/upload/jobs/<job_id>', methods=['DELETE'])
+def cancel_upload_job(job_id):
+    """取消排队中或处理中的上传任务"""
+    try:
+        # 同时取消该文档的其他进行中工作（如按需生成的总结）
+        if not cancellation_registry.cancel(job_id, '用户取消了任务'):
+            return jsonify({
+                'success': False,
+                'error': '未找到进行中的任务'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'message': '任务已取消',
+            'document_id': job_id
+        })
+        
+    except Exception as e:
+        current_app.logger.error(f"取消任务失败: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'取消任务失败: {str(e)}'
+        }), 500
+
+@upload_bp.route('/api/upload/queue', methods=['GET'])
+def get_upload_queue():
+    """获取入库队列状态"""
+    return jsonify({
+        'success': True,
+        'queue': ingest_queue.get_stats()
+    })
+
 @upload_bp.route('/api/upload/status', methods=['GET'])
 def upload_status():
     """获取上传状态"""
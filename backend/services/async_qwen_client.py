@@ -0,0 +1,117 @@
+import asyncio
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+from backend.services.qwen_client import QwenClient
+from backend.utils.api_manager import api_manager
+from backend.utils.cancellation import CancelledError
+
+class AsyncQwenClient:
+    """Qwen API异步客户端 - 与QwenClient方法相同的协程版本
+    
+    每个调用在专用线程池中执行同步客户端的方法（共享同一个HTTP连接池），
+    信号量限制同时进行的大模型调用数量，多页面操作可以用 asyncio.gather 并发执行。
+    """
+    
+    def __init__(self, client: QwenClient = None, max_concurrency: int = None):
+        """初始化异步客户端
+        
+        Args:
+            client: 同步客户端，为空时新建
+            max_concurrency: 最大并发调用数，为空时使用配置值
+        """
+        self.client = client or QwenClient()
+        self.max_concurrency = max_concurrency or api_manager.get_qwen_config()['max_concurrency']
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='qwen-async')
+        self._semaphores = {}  # 事件循环 -> 信号量（信号量绑定创建它的事件循环）
+    
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """获取当前事件循环的并发信号量"""
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores[loop] = semaphore
+        return semaphore
+    
+    async def _call(self, func: Callable, *args, **kwargs) -> Any:
+        """在线程池中执行同步方法（传递当前上下文，包括取消令牌）"""
+        async with self._get_semaphore():
+            context = contextvars.copy_context()
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, functools.partial(context.run, func, *args, **kwargs)
+            )
+    
+    async def analyze_document_image(self, image_path: str, prompt: str = None,
+                                     analysis_type: str = 'comprehensive') -> str:
+        """分析文档图片（参见 QwenClient.analyze_document_image）"""
+        return await self._call(self.client.analyze_document_image, image_path, prompt, analysis_type)
+    
+    async def detect_figures_in_page(self, image_path: str, figure_query: str = None) -> Dict:
+        """检测页面中的Figure（参见 QwenClient.detect_figures_in_page）"""
+        return await self._call(self.client.detect_figures_in_page, image_path, figure_query)
+    
+    async def review_extracted_figures(self, figure_images: List[Dict], user_query: str) -> Dict:
+        """审查截取的Figure（参见 QwenClient.review_extracted_figures）"""
+        return await self._call(self.client.review_extracted_figures, figure_images, user_query)
+    
+    async def analyze_multiple_images(self, image_paths: List[str], prompt: str = None,
+                                      analysis_type: str = 'comprehensive', use_cache: bool = True,
+                                      first_page: int = 1, total_pages: int = None,
+                                      page_numbers: List[int] = None) -> str:
+        """批量分析多张文档图片（参见 QwenClient.analyze_multiple_images）"""
+        return await self._call(self.client.analyze_multiple_images, image_paths, prompt, analysis_type, use_cache,
+                                first_page, total_pages, page_numbers)
+    
+    async def generate_document_summary_from_images(self, image_paths: List[str]) -> str:
+        """从页面图片生成文档总结（参见 QwenClient.generate_document_summary_from_images）"""
+        return await self._call(self.client.generate_document_summary_from_images, image_paths)
+    
+    async def generate_text(self, prompt: str, max_tokens: int = 4000, temperature: float = 0.2,
+                            call_type: str = 'summary') -> str:
+        """使用文本模型生成内容（参见 QwenClient.generate_text）"""
+        return await self._call(self.client.generate_text, prompt, max_tokens, temperature, call_type)
+    
+    async def generate_summary(self, page_contents: List[str]) -> str:
+        """从页面内容生成文档总结（参见 QwenClient.generate_summary）"""
+        return await self._call(self.client.generate_summary, page_contents)
+    
+    async def answer_question(self, question: str, relevant_pages: List[str],
+                              conversation_history: List[Dict] = None,
+                              page_images: List[str] = None, use_cache: bool = True,
+                              page_numbers: List[int] = None) -> Dict:
+        """回答关于文档的问题（参见 QwenClient.answer_question）"""
+        return await self._call(self.client.answer_question, question, relevant_pages,
+                                conversation_history, page_images, use_cache, page_numbers)
+    
+    async def chat(self, message: str, conversation_history: List[Dict] = None) -> str:
+        """通用聊天（参见 QwenClient.chat）"""
+        return await self._call(self.client.chat, message, conversation_history)
+    
+    async def test_connection(self) -> bool:
+        """测试API连接（参见 QwenClient.test_connection）"""
+        return await self._call(self.client.test_connection)
+    
+    async def detect_figures_in_pages(self, image_paths: List[str], figure_query: str = None) -> List[Dict]:
+        """并发检测多个页面中的Figure
+        
+        Args:
+            image_paths: 页面图片路径列表
+            figure_query: 用户查询的Figure描述
+        
+        Returns:
+            与image_paths顺序一致的检测结果列表
+        """
+        results = await asyncio.gather(
+            *(self.detect_figures_in_page(image_path, figure_query) for image_path in image_paths),
+            return_exceptions=True
+        )
+        detections = []
+        for result in results:
+            if isinstance(result, CancelledError):
+                raise result
+            if isinstance(result, Exception):
+                result = {'success': False, 'error': f'Figure检测失败: {result}', 'figures': []}
+            detections.append(result)
+        return detections
@@ -0,0 +1,89 @@
+import os
+import math
+from typing import Dict, List
+from PIL import Image
+
+# Qwen-VL每个视觉token对应28x28像素
+PATCH_SIZE = 28
+# 每张图片额外的起止标记token
+IMAGE_EXTRA_TOKENS = 2
+
+def estimate_image_tokens(width: int, height: int, min_pixels: int, max_pixels: int) -> int:
+    """按Qwen-VL的缩放规则估算一张图片的token数
+    
+    图片宽高先取整到28的倍数，像素总数超出 [min_pixels, max_pixels] 时按比例缩放到范围内，
+    每个28x28的块计为一个token。
+    
+    Args:
+        width: 图片宽度（像素）
+        height: 图片高度（像素）
+        min_pixels: 模型处理的最小像素数
+        max_pixels: 模型处理的最大像素数
+    
+    Returns:
+        估算的token数
+    """
+    resized_height = max(PATCH_SIZE, round(height / PATCH_SIZE) * PATCH_SIZE)
+    resized_width = max(PATCH_SIZE, round(width / PATCH_SIZE) * PATCH_SIZE)
+    
+    if resized_height * resized_width > max_pixels:
+        beta = math.sqrt(height * width / max_pixels)
+        resized_height = max(PATCH_SIZE, math.floor(height / beta / PATCH_SIZE) * PATCH_SIZE)
+        resized_width = max(PATCH_SIZE, math.floor(width / beta / PATCH_SIZE) * PATCH_SIZE)
+    elif resized_height * resized_width < min_pixels:
+        beta = math.sqrt(min_pixels / (height * width))
+        resized_height = math.ceil(height * beta / PATCH_SIZE) * PATCH_SIZE
+        resized_width = math.ceil(width * beta / PATCH_SIZE) * PATCH_SIZE
+    
+    return (resized_height // PATCH_SIZE) * (resized_width // PATCH_SIZE) + IMAGE_EXTRA_TOKENS
+
+class ImageTokenBudgeter:
+    """多图请求的token预算 - 按像素尺寸估算图片token数，把页面拆分为不超过预算的批次"""
+    
+    def __init__(self, token_budget: int, min_pixels: int, max_pixels: int):
+        """初始化预算器
+        
+        Args:
+            token_budget: 单次请求的输入token预算（提示词加图片）
+            min_pixels: 模型处理的最小像素数
+            max_pixels: 模型处理的最大像素数
+        """
+        self.token_budget = token_budget
+        self.min_pixels = min_pixels
+        self.max_pixels = max_pixels
+    
+    def estimate(self, image_path: str) -> int:
+        """估算一张图片的token数（只读取图片头部的尺寸信息）"""
+        with Image.open(image_path) as image:
+            width, height = image.size
+        return estimate_image_tokens(width, height, self.min_pixels, self.max_pixels)
+    
+    def plan_batches(self, image_paths: List[str], reserved_tokens: int = 0) -> List[Dict]:
+        """按页面顺序把图片拆分为不超过预算的批次
+        
+        不存在的图片会被跳过；单张图片超出预算时独占一个批次。
+        
+        Args:
+            image_paths: 图片路径列表
+            reserved_tokens: 每个请求中提示词等占用的token数
+        
+        Returns:
+            批次列表，每个批次为 {'indices': 图片在image_paths中的下标, 'tokens': 估算的图片token数}
+        """
+        available = max(1, self.token_budget - reserved_tokens)
+        batches = []
+        current = {'indices': [], 'tokens': 0}
+        
+        for index, image_path in enumerate(image_paths):
+            if not os.path.exists(image_path):
+                continue
+            tokens = self.estimate(image_path)
+            if current['indices'] and current['tokens'] + tokens > available:
+                batches.append(current)
+                current = {'indices': [], 'tokens': 0}
+            current['indices'].append(index)
+            current['tokens'] += tokens
+        
+        if current['indices']:
+            batches.append(current)
+        return batches
@@ -0,0 +1,115 @@
+import os
+import base64
+import threading
+from collections import OrderedDict
+from typing import Dict, Tuple
+from config import Config
+
+# 编码配置 -> MIME类型（original：原文件字节直接编码）
+ENCODING_PROFILES = {
+    'original': 'image/jpeg'
+}
+
+class ImagePayloadCache:
+    """图片data URL缓存 - 缓存可直接放入请求体的base64图片，避免每次调用重新读取和编码
+    
+    以 (路径, 修改时间, 文件大小, 编码配置) 为键，按LRU顺序在字节预算内淘汰。
+    页面重新渲染后修改时间变化，旧条目自然失效并被替换。
+    """
+    
+    def __init__(self, max_bytes: int):
+        """初始化缓存
+        
+        Args:
+            max_bytes: 缓存的data URL总字节数上限，0表示不缓存
+        """
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()  # 键 -> (data URL, 原文件大小)
+        self._current_keys: Dict[Tuple[str, str], tuple] = {}  # (路径, 编码配置) -> 当前键
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+    
+    def get_data_url(self, image_path: str, profile: str = 'original') -> Tuple[str, int]:
+        """获取图片的data URL
+        
+        Args:
+            image_path: 图片路径
+            profile: 编码配置
+        
+        Returns:
+            (data URL, 原文件字节数)
+        """
+        path = os.path.abspath(image_path)
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size, profile)
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry
+            self._misses += 1
+        
+        entry = self._encode(path, profile)
+        
+        with self._lock:
+            self._store(key, entry)
+        return entry
+    
+    def _encode(self, path: str, profile: str) -> Tuple[str, int]:
+        """读取并编码图片"""
+        mime_type = ENCODING_PROFILES[profile]
+        with open(path, 'rb') as f:
+            image_data = f.read()
+        image_base64 = base64.b64encode(image_data).decode('utf-8')
+        return f'data:{mime_type};base64,{image_base64}', len(image_data)
+    
+    def _store(self, key: tuple, entry: Tuple[str, int]):
+        """写入缓存并按预算淘汰（调用方持有锁）"""
+        size = len(entry[0])
+        if size > self.max_bytes or key in self._entries:
+            return
+        
+        # 同一图片的旧版本（重新渲染前的内容）直接移除
+        stale_key = self._current_keys.get((key[0], key[3]))
+        if stale_key is not None:
+            self._remove(stale_key)
+        
+        self._entries[key] = entry
+        self._current_keys[(key[0], key[3])] = key
+        self._bytes += size
+        
+        while self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self._evictions += 1
+    
+    def _remove(self, key: tuple):
+        """移除条目（调用方持有锁）"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= len(entry[0])
+        if self._current_keys.get((key[0], key[3])) == key:
+            del self._current_keys[(key[0], key[3])]
+    
+    def get_stats(self) -> Dict:
+        """获取缓存统计"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'hit_ratio': round(self._hits / lookups, 3) if lookups else 0.0
+            }
+
+# 全局图片data URL缓存
+image_payload_cache = ImagePayloadCache(Config.IMAGE_PAYLOAD_CACHE_MB * 1024 * 1024)
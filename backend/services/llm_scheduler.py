@@ -0,0 +1,149 @@
+import time
+import threading
+import itertools
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Optional
+from backend.utils.metrics import metrics
+from backend.utils.cancellation import check_cancelled
+
+# 优先级从高到低：用户正在等待的聊天问答 > Figure检测和审查 > 后台总结和预计算
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_FIGURE = 'figure'
+PRIORITY_BACKGROUND = 'background'
+PRIORITY_CLASSES = (PRIORITY_INTERACTIVE, PRIORITY_FIGURE, PRIORITY_BACKGROUND)
+
+# 未显式指定优先级时按调用类型确定，其余调用视为交互式
+CALL_TYPE_PRIORITIES = {
+    'figure_detection': PRIORITY_FIGURE,
+    'figure_review': PRIORITY_FIGURE,
+    'summary': PRIORITY_BACKGROUND
+}
+
+# 检查取消状态的间隔（秒）
+CANCEL_CHECK_INTERVAL = 0.2
+
+# 当前上下文中大模型调用的优先级
+_current_priority: contextvars.ContextVar = contextvars.ContextVar('llm_priority', default=None)
+
+@contextmanager
+def llm_priority(priority: str):
+    """在当前上下文中以指定优先级调用大模型（如后台总结任务）
+    
+    Args:
+        priority: 优先级，PRIORITY_CLASSES 之一
+    """
+    if priority not in PRIORITY_CLASSES:
+        raise ValueError(f"未知的优先级: {priority}")
+    reset_token = _current_priority.set(priority)
+    try:
+        yield priority
+    finally:
+        _current_priority.reset(reset_token)
+
+def resolve_priority(call_type: Optional[str]) -> str:
+    """确定一次调用的优先级：上下文中显式指定的优先，其次按调用类型"""
+    return _current_priority.get() or CALL_TYPE_PRIORITIES.get(call_type, PRIORITY_INTERACTIVE)
+
+class PriorityScheduler:
+    """大模型调用的优先级调度 - 限制同时进行的调用数，空出的名额优先分配给高优先级的等待者
+    
+    每个优先级另有并发上限，后台任务积压时也不会占满所有名额，交互式请求总有名额可用。
+    """
+    
+    def __init__(self, max_slots: int, class_caps: Dict[str, int]):
+        """初始化调度器
+        
+        Args:
+            max_slots: 同时进行的调用总数上限
+            class_caps: 各优先级的并发上限
+        """
+        self.max_slots = max_slots
+        self.class_caps = {priority: min(class_caps.get(priority, max_slots), max_slots)
+                           for priority in PRIORITY_CLASSES}
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+        self._waiters = []
+        self._active = {priority: 0 for priority in PRIORITY_CLASSES}
+        self._granted = {priority: 0 for priority in PRIORITY_CLASSES}
+        self._queued = {priority: 0 for priority in PRIORITY_CLASSES}  # 需要排队的次数
+    
+    def _dispatch(self):
+        """按优先级和到达顺序把空闲名额分配给等待者（调用方持有锁）
+        
+        某个优先级达到自身上限时跳过其等待者，名额继续分配给后面的等待者。
+        """
+        for waiter in sorted(self._waiters, key=lambda item: (item['rank'], item['sequence'])):
+            if sum(self._active.values()) >= self.max_slots:
+                break
+            priority = waiter['priority']
+            if self._active[priority] >= self.class_caps[priority]:
+                continue
+            self._active[priority] += 1
+            self._granted[priority] += 1
+            self._waiters.remove(waiter)
+            waiter['event'].set()
+    
+    @contextmanager
+    def slot(self, priority: str):
+        """占用一个调用名额，名额不足时按优先级排队（排队期间可被取消）
+        
+        Args:
+            priority: 优先级
+        """
+        waiter = {
+            'priority': priority,
+            'rank': PRIORITY_CLASSES.index(priority),
+            'sequence': next(self._sequence),
+            'event': threading.Event()
+        }
+        started_at = time.perf_counter()
+        
+        with self._lock:
+            self._waiters.append(waiter)
+            self._dispatch()
+            if not waiter['event'].is_set():
+                self._queued[priority] += 1
+        
+        try:
+            while not waiter['event'].wait(CANCEL_CHECK_INTERVAL):
+                check_cancelled()
+        except BaseException:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                else:
+                    self._release(priority)
+            raise
+        
+        metrics.observe(f'llm_queue_wait_{priority}', time.perf_counter() - started_at)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._release(priority)
+    
+    def _release(self, priority: str):
+        """归还名额并重新分配（调用方持有锁）"""
+        self._active[priority] -= 1
+        self._dispatch()
+    
+    def get_stats(self) -> Dict:
+        """获取调度统计"""
+        with self._lock:
+            waiting = {priority: 0 for priority in PRIORITY_CLASSES}
+            for waiter in self._waiters:
+                waiting[waiter['priority']] += 1
+            return {
+                'max_slots': self.max_slots,
+                'classes': {
+                    priority: {
+                        'cap': self.class_caps[priority],
+                        'active': self._active[priority],
+                        'waiting': waiting[priority],
+                        'granted': self._granted[priority],
+                        'queued': self._queued[priority]
+                    }
+                    for priority in PRIORITY_CLASSES
+                }
+            }
@@ -0,0 +1,176 @@
+import os
+import re
+import json
+from typing import Dict, List, Optional
+from config import Config
+
+# 页面笔记的分类及其在问答上下文中的标题
+NOTE_CATEGORIES = (
+    ('text', '文字内容'),
+    ('formulas', '公式'),
+    ('figures', '图表'),
+    ('key_points', '要点')
+)
+
+# 笔记覆盖整页内容所需的最少字数（零星几行笔记不足以代替页面图片）
+NOTES_MIN_CHARS = 200
+
+# 分析结果中的页码标注：[第3页]、【第3-4页】
+_PAGE_TAG_PATTERN = re.compile(r'[\[【]第\s*(\d+)\s*(?:[-–~至到]\s*(\d+)\s*)?页[\]】]')
+# 按页码分段的标题：## 第3页、### 第3-4页
+_PAGE_HEADING_PATTERN = re.compile(r'^第\s*(\d+)\s*(?:[-–~至到]\s*(\d+)\s*)?页\s*$')
+_HEADING_PATTERN = re.compile(r'^#{1,6}\s*(.+?)\s*#*$')
+_FIGURE_PATTERN = re.compile(r'(Figure|Fig\.?|Table|图|表)\s*[0-9一二三四五六七八九十]', re.I)
+_FORMULA_PATTERN = re.compile(r'\$|\\\(|\\\[|公式|方程|等式')
+# 标题中含这些词的段落（如"重要内容索引"、"核心结论"）归为要点
+_KEY_SECTION_WORDS = ('索引', '要点', '结论', '核心', '关键', '贡献')
+
+def _page_range(match: re.Match, first_page: int, last_page: int) -> List[int]:
+    """页码标注对应的页码列表（只保留分析范围内的页码）"""
+    start = int(match.group(1))
+    end = int(match.group(2) or start)
+    return [page for page in range(start, end + 1) if first_page <= page <= last_page]
+
+def _categorize(content: str, section: str) -> str:
+    """判断一条笔记的分类"""
+    if _FIGURE_PATTERN.search(content):
+        return 'figures'
+    if _FORMULA_PATTERN.search(content):
+        return 'formulas'
+    if content.startswith('**') or any(word in section for word in _KEY_SECTION_WORDS):
+        return 'key_points'
+    return 'text'
+
+def split_page_notes(analysis: str, first_page: int, last_page: int) -> Dict[int, Dict[str, List[str]]]:
+    """把多图分析结果按[第X页]标注拆分为每页的结构化笔记
+    
+    带页码标注的行归入标注的页面，其后没有标注的行沿用该页码；"## 第X页"形式的标题切换当前页面。
+    每行按内容归入文字、公式、图表或要点，标注之前的总体性描述不归入任何页面。
+    
+    Args:
+        analysis: analyze_multiple_images 的分析结果
+        first_page: 分析范围的第一页
+        last_page: 分析范围的最后一页
+    
+    Returns:
+        页码到笔记的映射，每页为 {'text', 'formulas', 'figures', 'key_points'} 四个字符串列表
+    """
+    notes: Dict[int, Dict[str, List[str]]] = {}
+    current_pages: List[int] = []
+    section = ''
+    
+    for raw_line in analysis.splitlines():
+        line = raw_line.strip()
+        if not line:
+            continue
+        
+        tag_pages = []
+        tags = list(_PAGE_TAG_PATTERN.finditer(line))
+        for match in tags:
+            tag_pages.extend(page for page in _page_range(match, first_page, last_page) if page not in tag_pages)
+        
+        heading = _HEADING_PATTERN.match(line)
+        if heading:
+            title = _PAGE_TAG_PATTERN.sub('', heading.group(1)).strip(' *：:')
+            page_heading = _PAGE_HEADING_PATTERN.match(title)
+            if page_heading:
+                current_pages = _page_range(page_heading, first_page, last_page)
+                section = ''
+            else:
+                section = title
+                if tag_pages:
+                    current_pages = tag_pages
+            continue
+        
+        # 以页码标注开头的行之后的内容都属于该页
+        if tag_pages and _PAGE_TAG_PATTERN.match(line.lstrip('-*+>0123456789. ')):
+            current_pages = tag_pages
+        
+        # 标注的页码都不在分析范围内时丢弃该行
+        if tags and not tag_pages:
+            continue
+        
+        pages = tag_pages or current_pages
+        content = _PAGE_TAG_PATTERN.sub('', line).strip()
+        content = re.sub(r'^(?:[-*+>]\s+|\d+[.、)]\s*)', '', content).strip(' ：:')
+        if not pages or not content or content in ('**', '---'):
+            continue
+        
+        category = _categorize(content, section)
+        for page in pages:
+            page_notes = notes.setdefault(page, {key: [] for key, _ in NOTE_CATEGORIES})
+            if content not in page_notes[category]:
+                page_notes[category].append(content)
+    
+    return notes
+
+def notes_cover_page(page_notes: Dict[str, List[str]]) -> bool:
+    """笔记是否足以代替页面图片：描述了图表或公式，或内容达到一定字数
+    
+    Args:
+        page_notes: split_page_notes 返回的单页笔记
+    
+    Returns:
+        是否可以不再发送该页图片
+    """
+    if page_notes.get('figures') or page_notes.get('formulas'):
+        return True
+    return sum(len(item) for items in page_notes.values() for item in items) >= NOTES_MIN_CHARS
+
+def format_page_notes(page_number: int, page_notes: Dict[str, List[str]]) -> str:
+    """把一页的笔记格式化为问答上下文
+    
+    Args:
+        page_number: 页码
+        page_notes: split_page_notes 返回的单页笔记
+    
+    Returns:
+        带页码标题的笔记文本
+    """
+    parts = [f"[第{page_number}页]（页面分析笔记）"]
+    for key, title in NOTE_CATEGORIES:
+        items = page_notes.get(key) or []
+        if items:
+            parts.append(f"【{title}】\n" + "\n".join(f"- {item}" for item in items))
+    return "\n".join(parts)
+
+def page_notes_path(artifact_id: str, text_dir: str = None) -> str:
+    """页面笔记文件路径：与文字层放在同一目录，随产物一起删除"""
+    return os.path.join(text_dir or os.path.join(Config.DATA_FOLDER, 'text'), artifact_id, 'notes.json')
+
+def save_page_notes(artifact_id: str, notes: Dict[int, Dict[str, List[str]]]):
+    """保存产物的页面笔记（覆盖已有笔记）
+    
+    Args:
+        artifact_id: 产物ID
+        notes: 页码到笔记的映射
+    """
+    notes_path = page_notes_path(artifact_id)
+    try:
+        os.makedirs(os.path.dirname(notes_path), exist_ok=True)
+        with open(f'{notes_path}.tmp', 'w', encoding='utf-8') as f:
+            json.dump({str(page): page_notes for page, page_notes in sorted(notes.items())}, f, ensure_ascii=False)
+        os.replace(f'{notes_path}.tmp', notes_path)
+        print(f"已保存 {len(notes)} 页的页面分析笔记")
+    except Exception as e:
+        print(f"保存页面笔记失败: {e}")
+
+def load_page_notes(notes_path: str, page_numbers: Optional[List[int]] = None) -> Dict[int, Dict[str, List[str]]]:
+    """读取页面笔记
+    
+    Args:
+        notes_path: 笔记文件路径
+        page_numbers: 页码列表，为空时返回所有页面
+    
+    Returns:
+        页码到笔记的映射，没有笔记的页面不包含在内
+    """
+    try:
+        with open(notes_path, 'r', encoding='utf-8') as f:
+            notes = {int(page): page_notes for page, page_notes in json.load(f).items()}
+    except (OSError, ValueError):
+        return {}
+    
+    if page_numbers is None:
+        return notes
+    return {page: notes[page] for page in page_numbers if page in notes}
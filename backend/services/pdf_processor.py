@@ -1,11 +1,130 @@
 import os
 import uuid
+import time
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from typing import List, Dict, Any
-from pdf2image import convert_from_path
 from PIL import Image
 import json
 from datetime import datetime
 from config import Config
+from backend.services.rasterizers import open_rasterized_document
+from backend.services.text_layer import extract_text_layer
+from backend.services.page_notes import load_page_notes, page_notes_path
+from backend.utils.artifact_store import artifact_store
+from backend.services.semantic_cache import semantic_cache
+from backend.utils.cancellation import check_cancelled
+
+# 页面图片的最大尺寸
+MAX_PAGE_WIDTH = 1200
+MAX_PAGE_HEIGHT = 1600
+
+# 编码进程池（所有PDFProcessor实例共享）
+_encode_executor = None
+_encode_executor_lock = threading.Lock()
+
+def _get_encode_workers() -> int:
+    """获取页面编码并行数"""
+    return Config.PDF_ENCODE_WORKERS or os.cpu_count() or 1
+
+def _get_encode_executor():
+    """获取共享的页面编码执行器，单工作者时返回None表示在当前线程编码"""
+    global _encode_executor
+    
+    workers = _get_encode_workers()
+    if workers <= 1:
+        return None
+    
+    with _encode_executor_lock:
+        if _encode_executor is None:
+            if Config.PDF_ENCODE_EXECUTOR == 'thread':
+                # Pillow在缩放和zlib压缩时会释放GIL，线程池同样能利用多核
+                _encode_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='page-encoder')
+            else:
+                _encode_executor = ProcessPoolExecutor(max_workers=workers)
+        return _encode_executor
+
+def _optimize_page_image(image: Image.Image) -> Image.Image:
+    """优化图片质量和大小
+    
+    Args:
+        image: PIL图片对象
+        
+    Returns:
+        优化后的图片对象
+    """
+    # 获取原始尺寸
+    width, height = image.size
+    
+    # 计算缩放比例
+    scale_w = MAX_PAGE_WIDTH / width if width > MAX_PAGE_WIDTH else 1
+    scale_h = MAX_PAGE_HEIGHT / height if height > MAX_PAGE_HEIGHT else 1
+    scale = min(scale_w, scale_h)
+    
+    # 如果需要缩放
+    if scale < 1:
+        new_width = int(width * scale)
+        new_height = int(height * scale)
+        image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+    
+    # 转换为RGB模式（如果不是的话）
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    
+    return image
+
+def _encode_page_image(rendered_path: str, image_path: str) -> str:
+    """优化并保存单页图片（在编码工作者中执行）
+    
+    Args:
+        rendered_path: poppler渲染出的临时图片路径
+        image_path: 最终PNG图片路径
+        
+    Returns:
+        最终PNG图片路径
+    """
+    # 先写临时文件再替换，读取方不会看到写了一半的图片
+    temp_path = f'{image_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with Image.open(rendered_path) as image:
+        optimized_image = _optimize_page_image(image)
+        optimized_image.save(temp_path, 'PNG', optimize=True)
+        optimized_image.close()
+    os.replace(temp_path, image_path)
+    if rendered_path != image_path:
+        os.remove(rendered_path)
+    return image_path
+
+def _needs_post_processing(image_path: str) -> bool:
+    """检查poppler直接输出的图片是否还需要PIL处理（只读取文件头）
+    
+    Args:
+        image_path: 图片路径
+        
+    Returns:
+        尺寸超限或不是RGB模式时返回True
+    """
+    with Image.open(image_path) as image:
+        width, height = image.size
+        return width > MAX_PAGE_WIDTH or height > MAX_PAGE_HEIGHT or image.mode != 'RGB'
+
+# 懒加载渲染的页面锁：(产物ID, 页码) -> 锁
+_page_render_locks = {}
+_page_render_locks_guard = threading.Lock()
+
+def _get_page_render_lock(artifact_id: str, page_number: int) -> threading.Lock:
+    """获取单页渲染锁，保证同一页面只渲染一次"""
+    with _page_render_locks_guard:
+        key = (artifact_id, page_number)
+        if key not in _page_render_locks:
+            _page_render_locks[key] = threading.Lock()
+        return _page_render_locks[key]
+
+def _release_page_render_lock(artifact_id: str, page_number: int):
+    """页面图片写入后移除锁（之后的请求直接命中文件）"""
+    with _page_render_locks_guard:
+        _page_render_locks.pop((artifact_id, page_number), None)
 
 class PDFProcessor:
     """PDF处理服务"""
@@ -14,67 +133,148 @@ class PDFProcessor:
         self.upload_dir = Config.UPLOAD_FOLDER
         self.data_dir = Config.DATA_FOLDER
         self.images_dir = os.path.join(self.data_dir, 'images')
+        self.figures_dir = os.path.join(self.data_dir, 'figures')
+        self.text_dir = os.path.join(self.data_dir, 'text')
+        self.render_dpi = Config.PDF_RENDER_DPI
+        self.render_batch_size = Config.PDF_RENDER_BATCH_SIZE
+        self.render_threads = Config.PDF_RENDER_THREADS
+        self.rasterizer = Config.PDF_RASTERIZER
+        self.render_at_target_size = Config.PDF_RENDER_AT_TARGET_SIZE
+        self.native_output = Config.PDF_NATIVE_OUTPUT
+        self.render_mode = Config.PDF_RENDER_MODE
+        self.lazy_warmup = Config.PDF_LAZY_WARMUP
+        self.extract_text = Config.PDF_EXTRACT_TEXT
+        self._artifact_ids = {}  # 文档ID -> 产物ID（文档创建后不变）
         
         # 确保目录存在
         os.makedirs(self.upload_dir, exist_ok=True)
         os.makedirs(self.data_dir, exist_ok=True)
         os.makedirs(self.images_dir, exist_ok=True)
     
-    def process_pdf(self, pdf_path: str, filename: str, progress_callback=None) -> Dict[str, Any]:
+    def process_pdf(self, pdf_path: str, filename: str, progress_callback=None,
+                    document_id: str = None, content_hash: str = None) -> Dict[str, Any]:
         """处理PDF文件
         
+        页面按固定大小的窗口流式渲染，渲染出的页面交给编码工作者并行优化、保存。
+        进行中的页面数有上限，内存与临时文件占用与总页数无关；进度按页面顺序回报。
+        渲染由 Config.PDF_RASTERIZER 指定的后端完成。已知页面尺寸时直接按最终像素尺寸渲染，
+        支持的后端（poppler）会把PNG直接写入文档图片目录，常见页面不经过PIL解码和重新编码。
+        
+        懒加载模式（Config.PDF_RENDER_MODE='lazy'）只记录页数和页面尺寸，
+        页面在首次通过 get_page_image_path 访问时才渲染。
+        
+        页面渲染后用pdftotext提取每页文字层和单词坐标，供问答直接使用文字内容。
+        
+        提供内容哈希且相同内容的PDF已处理过时，新文档直接引用已有的页面图片、
+        总结和Figure截图，不再渲染。
+        
         Args:
             pdf_path: PDF文件路径
             filename: 原始文件名
             progress_callback: 进度回调函数
+            document_id: 文档ID（为空时自动生成）
+            content_hash: PDF内容的SHA-256（可选，用于去重）
             
         Returns:
             处理结果信息
         """
         try:
             # 生成文档ID
-            document_id = str(uuid.uuid4())
+            document_id = document_id or str(uuid.uuid4())
+            
+            # 相同内容的PDF已处理过时直接复用
+            if content_hash:
+                artifact = artifact_store.acquire_by_hash(content_hash, document_id)
+                if artifact:
+                    return self._link_artifact(artifact, pdf_path, filename, document_id, progress_callback)
             
             if progress_callback:
                 progress_callback(document_id, 10, "开始转换PDF为图片...")
             
-            # 转换PDF为图片
-            images = convert_from_path(
-                pdf_path,
-                dpi=200,  # 设置DPI以获得清晰图片
-                fmt='PNG',
-                thread_count=2
-            )
-            
-            if progress_callback:
-                progress_callback(document_id, 30, f"PDF转换完成，共{len(images)}页，开始保存图片...")
+            # 打开渲染后端，读取页数后按窗口渲染
+            rasterized_document = open_rasterized_document(pdf_path, self.rasterizer, self.render_threads)
+            total_pages = rasterized_document.page_count
+            lazy_render = self.render_mode == 'lazy'
+            page_sizes = rasterized_document.get_page_sizes() if (self.render_at_target_size or lazy_render) else {}
             
             # 保存图片并记录信息
             page_info = []
             doc_images_dir = os.path.join(self.images_dir, document_id)
             os.makedirs(doc_images_dir, exist_ok=True)
             
-            total_pages = len(images)
-            for i, image in enumerate(images):
-                page_number = i + 1
-                image_filename = f'page_{page_number}.png'
-                image_path = os.path.join(doc_images_dir, image_filename)
-                
-                # 优化图片质量和大小
-                optimized_image = self._optimize_image(image)
-                optimized_image.save(image_path, 'PNG', optimize=True)
-                
-                page_info.append({
-                    'page_number': page_number,
-                    'image_path': image_path,
-                    'image_filename': image_filename
-                })
+            started_at = time.perf_counter()
+            
+            if lazy_render:
+                # 懒加载：只记录页面几何信息，页面在首次使用时渲染
+                for page_number in range(1, total_pages + 1):
+                    page_info.append(self._build_page_entry(document_id, page_number, page_sizes.get(page_number)))
+            
+            if progress_callback and not lazy_render:
+                progress_callback(document_id, 30, f"PDF共{total_pages}页，开始逐页转换并保存图片...")
+            
+            encode_workers = _get_encode_workers()
+            executor = _get_encode_executor()
+            max_in_flight = max(self.render_batch_size, 2 * encode_workers)
+            pending = deque()  # (页码, Future)，按页码顺序排列
+            
+            def complete_oldest():
+                """等待最早提交的页面完成并按顺序回报进度"""
+                page_number, future = pending.popleft()
+                future.result()
+                check_cancelled()  # 页面之间检查任务是否已取消
+                page_info.append(self._build_page_entry(document_id, page_number, page_sizes.get(page_number)))
                 
                 # 更新进度
                 if progress_callback:
-                    progress = 30 + int((i + 1) / total_pages * 60)  # 30-90%
+                    progress = 30 + int(page_number / total_pages * 60)  # 30-90%
                     progress_callback(document_id, progress, f"正在保存第{page_number}/{total_pages}页...")
             
+            with rasterized_document, tempfile.TemporaryDirectory(prefix='pdf_render_') as temp_dir:
+                try:
+                    render_windows = [] if lazy_render else self._iter_render_windows(total_pages, page_sizes)
+                    for first_page, last_page, target_size in render_windows:
+                        check_cancelled()
+                        for page_number, future in self._render_window(
+                                rasterized_document, first_page, last_page, target_size,
+                                doc_images_dir, temp_dir, executor):
+                            pending.append((page_number, future))
+                        
+                        # 控制进行中的页面数，避免临时文件堆积
+                        while len(pending) > max_in_flight:
+                            complete_oldest()
+                    
+                    while pending:
+                        complete_oldest()
+                finally:
+                    # 出错时等待已提交的页面结束，再清理临时目录
+                    for _, future in pending:
+                        future.cancel()
+                        try:
+                            future.result()
+                        except Exception:
+                            pass
+            
+            elapsed = time.perf_counter() - started_at
+            rendered_pages = 0 if lazy_render else len(page_info)
+            pages_per_second = rendered_pages / elapsed if elapsed > 0 else 0.0
+            if lazy_render:
+                print(f"文档 {document_id} 已记录{len(page_info)}页（懒加载渲染），耗时{elapsed:.2f}秒")
+            else:
+                print(f"文档 {document_id} 渲染完成: {len(page_info)}页, 耗时{elapsed:.2f}秒, {pages_per_second:.2f}页/秒")
+            
+            # 提取文字层（与页面图片一样按产物保存）
+            text_seconds = 0.0
+            check_cancelled()
+            if self.extract_text:
+                if progress_callback:
+                    progress_callback(document_id, 92, "正在提取文字层...")
+                text_started_at = time.perf_counter()
+                page_texts = self._save_text_layer(document_id, pdf_path)
+                text_seconds = time.perf_counter() - text_started_at
+                for page_entry in page_info:
+                    page_entry['text_chars'] = len(page_texts.get(page_entry['page_number'], ''))
+                print(f"文档 {document_id} 文字层提取完成: {len(page_texts)}页有文字, 耗时{text_seconds:.2f}秒")
+            
             if progress_callback:
                 progress_callback(document_id, 95, "正在保存文档元数据...")
             
@@ -87,10 +287,19 @@ class PDFProcessor:
                 'filename': filename,
                 'original_path': pdf_path,
                 'file_size': file_size,
-                'total_pages': len(images),
+                'total_pages': len(page_info),
                 'created_at': datetime.now().isoformat(),
                 'status': 'processed',
                 'pages': page_info,
+                'render_mode': self.render_mode,
+                'artifact_id': document_id,  # 首个文档的ID即产物ID
+                'content_hash': content_hash,
+                'ingest_stats': {
+                    'elapsed_seconds': round(elapsed, 3),
+                    'pages_per_second': round(pages_per_second, 2),
+                    'encode_workers': encode_workers,
+                    'text_seconds': round(text_seconds, 3)
+                },
                 'summary': None,  # 将在后续生成
                 'conversations': []  # 对话历史
             }
@@ -100,56 +309,341 @@ class PDFProcessor:
             with open(metadata_path, 'w', encoding='utf-8') as f:
                 json.dump(document_data, f, ensure_ascii=False, indent=2)
             
+            # 登记产物，之后相同内容的上传直接复用
+            if content_hash:
+                artifact_store.register(document_id, content_hash, document_id, {
+                    'pdf_path': pdf_path,
+                    'file_size': file_size,
+                    'total_pages': len(page_info),
+                    'pages': page_info,
+                    'render_mode': self.render_mode,
+                    'summary': None
+                })
+            
+            if lazy_render and self.lazy_warmup:
+                self._start_warmup(document_id, total_pages)
+            
             if progress_callback:
                 progress_callback(document_id, 100, "PDF处理完成！")
             
             return {
                 'success': True,
                 'document_id': document_id,
-                'total_pages': len(images),
-                'file_size': file_size
+                'total_pages': len(page_info),
+                'file_size': file_size,
+                'pages_per_second': round(pages_per_second, 2)
             }
             
         except Exception as e:
             if progress_callback:
-                progress_callback(document_id if 'document_id' in locals() else None, -1, f"处理失败: {str(e)}")
+                progress_callback(document_id, -1, f"处理失败: {str(e)}")
             return {
                 'success': False,
                 'error': f'PDF处理失败: {str(e)}'
             }
     
-    def _optimize_image(self, image: Image.Image) -> Image.Image:
-        """优化图片质量和大小
+    def _link_artifact(self, artifact: Dict[str, Any], pdf_path: str, filename: str,
+                       document_id: str, progress_callback=None) -> Dict[str, Any]:
+        """基于已有产物创建文档元数据
         
         Args:
-            image: PIL图片对象
+            artifact: 产物记录
+            pdf_path: 本次上传的PDF路径（与产物内容相同，将被删除）
+            filename: 原始文件名
+            document_id: 新文档ID
+            progress_callback: 进度回调函数
             
         Returns:
-            优化后的图片对象
+            处理结果信息
         """
-        # 设置最大尺寸
-        max_width = 1200
-        max_height = 1600
+        artifact_id = artifact['artifact_id']
+        print(f"文档 {document_id} 与产物 {artifact_id} 内容相同，复用已有页面和总结")
         
-        # 获取原始尺寸
-        width, height = image.size
+        try:
+            if progress_callback:
+                progress_callback(document_id, 50, "检测到相同文件，复用已有解析结果...")
+            
+            # 重复的上传文件不再需要，统一使用产物中的PDF
+            if os.path.abspath(pdf_path) != os.path.abspath(artifact['pdf_path']) and os.path.exists(pdf_path):
+                os.remove(pdf_path)
+            
+            document_data = {
+                'id': document_id,
+                'filename': filename,
+                'original_path': artifact['pdf_path'],
+                'file_size': artifact['file_size'],
+                'total_pages': artifact['total_pages'],
+                'created_at': datetime.now().isoformat(),
+                'status': 'processed',
+                'pages': artifact['pages'],
+                'render_mode': artifact.get('render_mode', self.render_mode),
+                'artifact_id': artifact_id,
+                'content_hash': artifact['content_hash'],
+                'ingest_stats': {
+                    'deduplicated': True
+                },
+                'summary': artifact.get('summary'),
+                'conversations': []
+            }
+            if document_data['summary']:
+                document_data['summary_generated_at'] = datetime.now().isoformat()
+            
+            metadata_path = os.path.join(self.data_dir, f'{document_id}.json')
+            with open(metadata_path, 'w', encoding='utf-8') as f:
+                json.dump(document_data, f, ensure_ascii=False, indent=2)
+            
+        except Exception:
+            artifact_store.release(artifact_id, document_id)
+            raise
+        
+        if progress_callback:
+            progress_callback(document_id, 100, "PDF处理完成（复用已有解析结果）！")
+        
+        return {
+            'success': True,
+            'document_id': document_id,
+            'total_pages': artifact['total_pages'],
+            'file_size': artifact['file_size'],
+            'deduplicated': True
+        }
+    
+    def _save_text_layer(self, artifact_id: str, pdf_path: str) -> Dict[int, str]:
+        """提取并保存文字层
+        
+        每页文字保存在 text/<产物ID>/pages.json，单词坐标单独保存在 words.json，
+        读取文字时不需要加载坐标数据。
+        
+        Args:
+            artifact_id: 产物ID
+            pdf_path: PDF文件路径
+            
+        Returns:
+            页码到文字内容的映射（只包含有文字的页面）
+        """
+        text_layer = extract_text_layer(pdf_path)
+        if not text_layer:
+            return {}
+        
+        artifact_text_dir = os.path.join(self.text_dir, artifact_id)
+        os.makedirs(artifact_text_dir, exist_ok=True)
+        
+        page_texts = {page_number: page['text'] for page_number, page in text_layer.items() if page['text'].strip()}
+        page_words = {page_number: {'width': page['width'], 'height': page['height'], 'words': page['words']}
+                      for page_number, page in text_layer.items()}
+        
+        for filename, data in (('pages.json', page_texts), ('words.json', page_words)):
+            file_path = os.path.join(artifact_text_dir, filename)
+            with open(f'{file_path}.tmp', 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(f'{file_path}.tmp', file_path)
+        
+        return page_texts
+    
+    def _build_page_entry(self, document_id: str, page_number: int, page_size: tuple = None) -> Dict[str, Any]:
+        """构建页面元数据
+        
+        Args:
+            document_id: 文档ID
+            page_number: 页码
+            page_size: 页面 (宽, 高)，单位为点
+            
+        Returns:
+            页面信息
+        """
+        image_filename = f'page_{page_number}.png'
+        page_entry = {
+            'page_number': page_number,
+            'image_path': os.path.join(self.images_dir, document_id, image_filename),
+            'image_filename': image_filename
+        }
+        if page_size:
+            page_entry['page_size'] = [round(page_size[0], 2), round(page_size[1], 2)]
+        return page_entry
+    
+    def _render_window(self, rasterized_document, first_page: int, last_page: int, target_size,
+                       doc_images_dir: str, temp_dir: str, executor=None) -> List[tuple]:
+        """渲染一个窗口并提交编码
+        
+        Args:
+            rasterized_document: 已打开的渲染文档
+            first_page: 起始页
+            last_page: 结束页（包含）
+            target_size: 目标像素尺寸
+            doc_images_dir: 文档图片目录
+            temp_dir: 临时目录
+            executor: 编码执行器，为空时在当前线程编码
+            
+        Returns:
+            按页码排列的 (页码, Future) 列表
+        """
+        # 已知最终尺寸时由后端直接写出PNG，Python只记录元数据
+        native_output = (self.native_output and target_size is not None and
+                         rasterized_document.supports_native_output)
+        
+        # 已知页面尺寸时直接按最终像素尺寸渲染，省去缩放
+        rendered_paths = rasterized_document.render_window(
+            first_page,
+            last_page,
+            doc_images_dir if native_output else temp_dir,
+            dpi=self.render_dpi,  # 设置DPI以获得清晰图片
+            size=target_size,
+            native_output=native_output
+        )
+        
+        submitted = []
+        for offset, rendered_path in enumerate(rendered_paths):
+            page_number = first_page + offset
+            image_path = os.path.join(doc_images_dir, f'page_{page_number}.png')
+            
+            if native_output and not _needs_post_processing(rendered_path):
+                os.replace(rendered_path, image_path)
+                future = Future()
+                future.set_result(image_path)
+            elif executor:
+                # 非直接输出或尺寸超限等情况由PIL处理
+                future = executor.submit(_encode_page_image, rendered_path, image_path)
+            else:
+                future = Future()
+                future.set_result(_encode_page_image(rendered_path, image_path))
+            submitted.append((page_number, future))
+        
+        return submitted
+    
+    def render_page(self, document_id: str, page_number: int) -> bool:
+        """按需渲染单页（懒加载模式下页面首次被使用时调用）
+        
+        Args:
+            document_id: 文档ID
+            page_number: 页码
+            
+        Returns:
+            页面图片是否可用
+        """
+        artifact_id = self.get_artifact_id(document_id)
+        image_path = os.path.join(self.images_dir, artifact_id, f'page_{page_number}.png')
+        if os.path.exists(image_path):
+            return True
+        
+        with _get_page_render_lock(artifact_id, page_number):
+            if os.path.exists(image_path):
+                return True
+            
+            try:
+                check_cancelled()
+                
+                metadata_path = os.path.join(self.data_dir, f'{document_id}.json')
+                if not os.path.exists(metadata_path):
+                    return False
+                
+                with open(metadata_path, 'r', encoding='utf-8') as f:
+                    document_data = json.load(f)
+                
+                total_pages = document_data.get('total_pages', 0)
+                original_path = document_data.get('original_path')
+                if not (1 <= page_number <= total_pages) or not original_path or not os.path.exists(original_path):
+                    return False
+                
+                page_size = document_data['pages'][page_number - 1].get('page_size')
+                target_size = self._get_target_size(page_size) if self.render_at_target_size else None
+                
+                doc_images_dir = os.path.join(self.images_dir, artifact_id)
+                os.makedirs(doc_images_dir, exist_ok=True)
+                
+                started_at = time.perf_counter()
+                with open_rasterized_document(original_path, self.rasterizer, self.render_threads,
+                                              page_count=total_pages) as rasterized_document, \
+                        tempfile.TemporaryDirectory(prefix='pdf_render_') as temp_dir:
+                    for _, future in self._render_window(rasterized_document, page_number, page_number,
+                                                         target_size, doc_images_dir, temp_dir):
+                        future.result()
+                
+                print(f"按需渲染文档 {document_id} 第{page_number}页，耗时{time.perf_counter() - started_at:.2f}秒")
+                return True
+                
+            except Exception as e:
+                print(f"按需渲染第{page_number}页失败: {e}")
+                return False
+            finally:
+                _release_page_render_lock(artifact_id, page_number)
+    
+    def _start_warmup(self, document_id: str, total_pages: int):
+        """后台预热：依次渲染尚未渲染的页面
         
-        # 计算缩放比例
-        scale_w = max_width / width if width > max_width else 1
-        scale_h = max_height / height if height > max_height else 1
-        scale = min(scale_w, scale_h)
+        Args:
+            document_id: 文档ID
+            total_pages: 总页数
+        """
+        def warmup():
+            for page_number in range(1, total_pages + 1):
+                if not os.path.exists(os.path.join(self.data_dir, f'{document_id}.json')):
+                    return  # 文档已删除
+                self.render_page(document_id, page_number)
+            print(f"文档 {document_id} 后台预热完成")
         
-        # 如果需要缩放
-        if scale < 1:
-            new_width = int(width * scale)
-            new_height = int(height * scale)
-            image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+        threading.Thread(target=warmup, daemon=True).start()
+    
+    def _get_target_size(self, page_size: tuple):
+        """计算页面的最终渲染像素尺寸
+        
+        按渲染DPI计算原始像素尺寸，超过最大尺寸时等比缩小，只约束一条边，
+        另一条边交给poppler按页面比例计算。
+        
+        Args:
+            page_size: 页面 (宽, 高)，单位为点
+            
+        Returns:
+            pdf2image的size参数，未知尺寸时返回None（按DPI渲染）
+        """
+        if not page_size:
+            return None
         
-        # 转换为RGB模式（如果不是的话）
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+        width_pts, height_pts = page_size
+        if width_pts <= 0 or height_pts <= 0:
+            return None
         
-        return image
+        native_width = width_pts * self.render_dpi / 72
+        native_height = height_pts * self.render_dpi / 72
+        scale = min(1, MAX_PAGE_WIDTH / native_width, MAX_PAGE_HEIGHT / native_height)
+        
+        if native_width / native_height >= MAX_PAGE_WIDTH / MAX_PAGE_HEIGHT:
+            return (max(1, int(native_width * scale)), None)
+        return (None, max(1, int(native_height * scale)))
+    
+    def _iter_render_windows(self, total_pages: int, page_sizes: Dict[int, tuple] = None):
+        """按渲染窗口切分页码范围
+        
+        同一窗口内的页面具有相同的目标尺寸，窗口大小不超过渲染批大小。
+        
+        Args:
+            total_pages: 总页数
+            page_sizes: 页码到页面尺寸的映射
+            
+        Returns:
+            (起始页, 结束页, 目标尺寸) 迭代器，页码从1开始且包含结束页
+        """
+        page_sizes = page_sizes or {}
+        batch_size = max(1, self.render_batch_size)
+        
+        first_page = 1
+        while first_page <= total_pages:
+            target_size = self._get_target_size(page_sizes.get(first_page))
+            last_page = first_page
+            while (last_page < total_pages and last_page - first_page + 1 < batch_size and
+                   self._get_target_size(page_sizes.get(last_page + 1)) == target_size):
+                last_page += 1
+            yield first_page, last_page, target_size
+            first_page = last_page + 1
+    
+    def _optimize_image(self, image: Image.Image) -> Image.Image:
+        """优化图片质量和大小
+        
+        Args:
+            image: PIL图片对象
+            
+        Returns:
+            优化后的图片对象
+        """
+        return _optimize_page_image(image)
     
     def get_document_info(self, document_id: str) -> Dict[str, Any]:
         """获取文档信息
@@ -228,6 +722,72 @@ class PDFProcessor:
                 'error': f'获取文档列表失败: {str(e)}'
             }
     
+    def get_artifact_id(self, document_id: str) -> str:
+        """获取文档使用的产物ID（重复上传的文档共享首个文档的页面和Figure目录）
+        
+        Args:
+            document_id: 文档ID
+            
+        Returns:
+            产物ID，文档不存在时返回文档ID本身
+        """
+        if document_id in self._artifact_ids:
+            return self._artifact_ids[document_id]
+        
+        metadata_path = os.path.join(self.data_dir, f'{document_id}.json')
+        try:
+            with open(metadata_path, 'r', encoding='utf-8') as f:
+                artifact_id = json.load(f).get('artifact_id') or document_id
+        except (OSError, ValueError):
+            return document_id
+        
+        self._artifact_ids[document_id] = artifact_id
+        return artifact_id
+    
+    def get_figures_dir(self, document_id: str) -> str:
+        """获取文档的Figure截图目录
+        
+        Args:
+            document_id: 文档ID
+            
+        Returns:
+            Figure目录路径
+        """
+        return os.path.join(self.figures_dir, self.get_artifact_id(document_id))
+    
+    def get_page_texts(self, document_id: str, page_numbers: List[int] = None) -> Dict[int, str]:
+        """获取页面文字层
+        
+        Args:
+            document_id: 文档ID
+            page_numbers: 页码列表，为空时返回所有页面
+            
+        Returns:
+            页码到文字内容的映射，没有文字层的页面不包含在内
+        """
+        text_path = os.path.join(self.text_dir, self.get_artifact_id(document_id), 'pages.json')
+        try:
+            with open(text_path, 'r', encoding='utf-8') as f:
+                page_texts = {int(page_number): text for page_number, text in json.load(f).items()}
+        except (OSError, ValueError):
+            return {}
+        
+        if page_numbers is None:
+            return page_texts
+        return {page_number: page_texts[page_number] for page_number in page_numbers if page_number in page_texts}
+    
+    def get_page_notes(self, document_id: str, page_numbers: List[int] = None) -> Dict[int, Dict[str, List[str]]]:
+        """获取页面分析笔记（生成文档总结时由分块分析结果拆分得到）
+        
+        Args:
+            document_id: 文档ID
+            page_numbers: 页码列表，为空时返回所有页面
+            
+        Returns:
+            页码到笔记的映射，没有笔记的页面不包含在内
+        """
+        return load_page_notes(page_notes_path(self.get_artifact_id(document_id), self.text_dir), page_numbers)
+    
     def get_page_image_path(self, document_id: str, page_number: int) -> str:
         """获取页面图片路径
         
@@ -238,9 +798,15 @@ class PDFProcessor:
         Returns:
             图片文件路径
         """
-        doc_images_dir = os.path.join(self.images_dir, document_id)
+        doc_images_dir = os.path.join(self.images_dir, self.get_artifact_id(document_id))
         image_filename = f'page_{page_number}.png'
-        return os.path.join(doc_images_dir, image_filename)
+        image_path = os.path.join(doc_images_dir, image_filename)
+        
+        # 懒加载模式下页面首次被访问时渲染
+        if not os.path.exists(image_path):
+            self.render_page(document_id, page_number)
+        
+        return image_path
     
     def update_document_summary(self, document_id: str, summary: str) -> bool:
         """更新文档总结
@@ -267,12 +833,46 @@ class PDFProcessor:
             with open(metadata_path, 'w', encoding='utf-8') as f:
                 json.dump(document_data, f, ensure_ascii=False, indent=2)
             
+            # 同步给共享产物的其他文档，之后的重复上传也直接复用
+            artifact_id = document_data.get('artifact_id')
+            if artifact_id:
+                for sibling_id in artifact_store.update_summary(artifact_id, summary):
+                    if sibling_id != document_id:
+                        self._fill_missing_summary(sibling_id, summary)
+            
             return True
             
         except Exception as e:
             print(f"更新文档总结失败: {e}")
             return False
     
+    def _fill_missing_summary(self, document_id: str, summary: str):
+        """为尚无总结的文档填入共享总结
+        
+        Args:
+            document_id: 文档ID
+            summary: 总结内容
+        """
+        try:
+            metadata_path = os.path.join(self.data_dir, f'{document_id}.json')
+            if not os.path.exists(metadata_path):
+                return
+            
+            with open(metadata_path, 'r', encoding='utf-8') as f:
+                document_data = json.load(f)
+            
+            if document_data.get('summary'):
+                return
+            
+            document_data['summary'] = summary
+            document_data['summary_generated_at'] = datetime.now().isoformat()
+            
+            with open(metadata_path, 'w', encoding='utf-8') as f:
+                json.dump(document_data, f, ensure_ascii=False, indent=2)
+                
+        except Exception as e:
+            print(f"同步文档 {document_id} 总结失败: {e}")
+    
     def add_conversation(self, document_id: str, question: str, answer: str, 
                         source_pages: List[int] = None) -> bool:
         """添加对话记录
@@ -341,6 +941,37 @@ class PDFProcessor:
             print(f"获取对话历史失败: {e}")
             return []
     
+    def delete_document(self, document_id: str) -> bool:
+        """删除文档，并释放其对共享产物的引用
+        
+        Args:
+            document_id: 文档ID
+            
+        Returns:
+            是否成功
+        """
+        try:
+            metadata_path = os.path.join(self.data_dir, f'{document_id}.json')
+            if not os.path.exists(metadata_path):
+                return False
+            
+            with open(metadata_path, 'r', encoding='utf-8') as f:
+                document_data = json.load(f)
+            
+            # 删除元数据文件
+            os.remove(metadata_path)
+            self._artifact_ids.pop(document_id, None)
+            semantic_cache.invalidate(document_id)
+            
+            # 最后一个引用释放时才删除页面图片、Figure和原始PDF
+            artifact_store.release(document_data.get('artifact_id') or document_id, document_id,
+                                   document_data.get('original_path'))
+            return True
+            
+        except Exception as e:
+            print(f"删除文档 {document_id} 失败: {e}")
+            return False
+    
     def cleanup_old_files(self, days: int = 30) -> None:
         """清理旧文件
         
@@ -362,21 +993,8 @@ class PDFProcessor:
                         created_at = datetime.fromisoformat(doc_data['created_at'])
                         
                         if created_at < cutoff_date:
-                            # 删除文档文件
-                            document_id = doc_data['id']
-                            
-                            # 删除图片目录
-                            doc_images_dir = os.path.join(self.images_dir, document_id)
-                            if os.path.exists(doc_images_dir):
-                                import shutil
-                                shutil.rmtree(doc_images_dir)
-                            
-                            # 删除原始PDF文件
-                            if os.path.exists(doc_data['original_path']):
-                                os.remove(doc_data['original_path'])
-                            
-                            # 删除元数据文件
-                            os.remove(filepath)
+                            # 删除文档文件（共享的产物在最后一个引用释放时删除）
+                            self.delete_document(doc_data['id'])
                             
                             print(f"已清理过期文档: {doc_data['filename']}")
                             
@@ -1,6 +1,8 @@
 import re
 import jieba
 from typing import List, Dict, Any, Tuple
+from config import Config
+from backend.services.page_notes import format_page_notes
 
 class QuestionAnalyzer:
     """问题分析器"""
@@ -427,9 +429,25 @@ class PageSelector:
             # 如果没有关键词，返回默认页面
             return self._get_default_pages(total_pages, max_pages)
         
-        # 这里可以实现更复杂的内容匹配逻辑
-        # 目前简化为返回前几页
-        return self._get_default_pages(total_pages, max_pages)
+        # 按关键词在页面文字层中的出现次数排序（没有文字层的页面使用页面笔记）
+        page_texts = self.pdf_processor.get_page_texts(document_id)
+        for page_number, page_notes in self.pdf_processor.get_page_notes(document_id).items():
+            if page_number not in page_texts:
+                page_texts[page_number] = format_page_notes(page_number, page_notes)
+        lowered_keywords = [keyword.lower() for keyword in keywords]
+        page_scores = []
+        for page_number, text in page_texts.items():
+            lowered_text = text.lower()
+            score = sum(lowered_text.count(keyword) for keyword in lowered_keywords)
+            if score > 0:
+                page_scores.append((score, page_number))
+        
+        if not page_scores:
+            # 没有文字层或没有匹配时返回默认页面
+            return self._get_default_pages(total_pages, max_pages)
+        
+        page_scores.sort(key=lambda item: (-item[0], item[1]))
+        return sorted(page_number for _, page_number in page_scores[:max_pages])
     
     def _get_default_pages(self, total_pages: int, max_pages: int) -> List[int]:
         """获取默认页面
@@ -450,6 +468,9 @@ class PageSelector:
     def get_page_content(self, document_id: str, page_numbers: List[int]) -> List[str]:
         """获取页面内容
         
+        使用文字层原文，有页面笔记时附在原文之后（笔记包含图表、公式等视觉内容的描述），
+        没有文字层的页面只使用笔记。
+        
         Args:
             document_id: 文档ID
             page_numbers: 页面号列表
@@ -457,6 +478,27 @@ class PageSelector:
         Returns:
             页面内容列表
         """
-        # 这里应该返回已经通过Qwen分析的页面内容
-        # 目前返回空列表，实际实现中需要从缓存或重新分析获取
-        return []
\ No newline at end of file
+        page_notes = self.pdf_processor.get_page_notes(document_id, page_numbers)
+        page_texts = self.pdf_processor.get_page_texts(document_id, page_numbers)
+        
+        # 按页面顺序拼接，总长度不超过上下文限制
+        page_contents = []
+        remaining_chars = Config.PAGE_TEXT_CONTEXT_CHARS
+        for page_number in page_numbers:
+            if remaining_chars <= 0:
+                break
+            
+            parts = []
+            text = page_texts.get(page_number, '').strip()
+            if text:
+                parts.append(f"[第{page_number}页]\n{text}")
+            if page_number in page_notes:
+                parts.append(format_page_notes(page_number, page_notes[page_number]))
+            if not parts:
+                continue
+            
+            content = "\n\n".join(parts)[:remaining_chars]
+            remaining_chars -= len(content)
+            page_contents.append(content)
+        
+        return page_contents
@@ -1,9 +1,66 @@
-import requests
 import json
-import base64
 import os
-from typing import List, Dict, Optional, Any
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Any, Iterator, Tuple
 from backend.utils.api_manager import api_manager
+from backend.services.qwen_transport import qwen_transport
+from backend.services.image_payload_cache import image_payload_cache
+from backend.services.image_budget import ImageTokenBudgeter
+from backend.services.llm_scheduler import llm_priority, PRIORITY_BACKGROUND
+
+# 使用默认提示词时为提示词和消息格式预留的token数
+PROMPT_TOKEN_RESERVE = 2000
+
+def format_page_numbers(page_numbers: List[int]) -> str:
+    """页码列表的显示文本：连续页面如 第3-5页，不连续时如 第3、7、12页"""
+    first_page, last_page = page_numbers[0], page_numbers[-1]
+    if first_page == last_page:
+        return f"第{first_page}页"
+    if page_numbers == list(range(first_page, last_page + 1)):
+        return f"第{first_page}-{last_page}页"
+    return "第" + "、".join(str(page) for page in page_numbers) + "页"
+
+def document_summary_prompt(document_analysis: str) -> str:
+    """生成最终文档总结的提示词
+    
+    Args:
+        document_analysis: 按页面顺序组织的文档分析结果
+        
+    Returns:
+        提示词
+    """
+    return f"""作为专业的学术文档分析专家，请基于提供给你的PDF文档（已经按照PDF的顺序分割成顺序的图片）的完整分析结果，生成一个全面深入的文档总结：
+
+【文档概览】
+- 文档类型、主题和研究目的
+- 作者信息和发表背景（如有）
+- 文档的学术价值和意义
+
+【核心内容分析】
+- 主要研究问题和假设
+- 研究方法和技术路线
+- 关键发现和实验结果
+- 重要的数据、图表、公式
+- 创新点和贡献
+
+【结构化要点】
+- 各章节的主要内容
+- 重要概念和术语定义
+- 关键结论和建议
+- 局限性和未来工作方向
+
+【实用信息】
+- 可能被用户询问的重点内容
+- 重要信息的页面位置提示
+- 相关的参考文献和引用
+
+请用中文提供结构化、详细且易于理解的总结，帮助用户快速掌握文档精髓，并且你需要确保文字结构的美观与完整性。
+
+【文档分析结果】
+{document_analysis}
+
+请基于以上完整分析，生成专业的文档总结："""
 
 class QwenClient:
     """Qwen API客户端"""
@@ -23,6 +80,12 @@ class QwenClient:
             raise ValueError("Qwen API配置无效，请检查API密钥和配置")
         
         self.headers = api_manager.get_api_headers('qwen')
+        self.transport = qwen_transport  # 共享连接池
+        self.image_budgeter = ImageTokenBudgeter(
+            self.config['image_token_budget'],
+            self.config['image_min_pixels'],
+            self.config['image_max_pixels']
+        )
     
     def analyze_document_image(self, image_path: str, prompt: str = None, analysis_type: str = 'comprehensive') -> str:
         """分析文档图片
@@ -252,14 +315,9 @@ class QwenClient:
         
         try:
             print("正在读取图片文件...")
-            with open(image_path, 'rb') as f:
-                image_data = f.read()
+            image_url, image_size = image_payload_cache.get_data_url(image_path)
             
-            print(f"图片文件大小: {len(image_data)} 字节")
-            
-            # 将图片转换为base64
-            import base64
-            image_base64 = base64.b64encode(image_data).decode('utf-8')
+            print(f"图片文件大小: {image_size} 字节")
             
             payload = {
                 'model': self.vision_model,  # 使用最优视觉模型
@@ -274,7 +332,7 @@ class QwenClient:
                             {
                                 'type': 'image_url',
                                 'image_url': {
-                                    'url': f'data:image/jpeg;base64,{image_base64}'
+                                    'url': image_url
                                 }
                             }
                         ]
@@ -285,12 +343,7 @@ class QwenClient:
             }
             
             print("正在调用Figure检测API...")
-            response = requests.post(
-                f'{self.base_url}/chat/completions',
-                headers=self.headers,
-                json=payload,
-                timeout=self.timeout
-            )
+            response = self.transport.post('/chat/completions', payload, call_type='figure_detection')
             
             print(f"API响应状态码: {response.status_code}")
             
@@ -433,19 +486,14 @@ class QwenClient:
             for i, figure_info in enumerate(figure_images):
                 image_path = figure_info.get('image_path')
                 if image_path and os.path.exists(image_path):
-                    with open(image_path, 'rb') as f:
-                        image_data = f.read()
+                    image_url, image_size = image_payload_cache.get_data_url(image_path)
                     
-                    print(f"图片{i+1}: {image_path}, 大小: {len(image_data)} 字节")
-                    
-                    # 将图片转换为base64
-                    import base64
-                    image_base64 = base64.b64encode(image_data).decode('utf-8')
+                    print(f"图片{i+1}: {image_path}, 大小: {image_size} 字节")
                     
                     content.append({
                         'type': 'image_url',
                         'image_url': {
-                            'url': f'data:image/jpeg;base64,{image_base64}'
+                            'url': image_url
                         }
                     })
                 else:
@@ -464,12 +512,7 @@ class QwenClient:
             }
             
             print("正在调用大模型进行Figure审查...")
-            response = requests.post(
-                f'{self.base_url}/chat/completions',
-                headers=self.headers,
-                json=payload,
-                timeout=self.timeout
-            )
+            response = self.transport.post('/chat/completions', payload, call_type='figure_review')
             
             print(f"API响应状态码: {response.status_code}")
             
@@ -539,17 +582,151 @@ class QwenClient:
                 'error': f'Figure审查失败: {str(e)}'
             }
     
-    def analyze_multiple_images(self, image_paths: List[str], prompt: str = None, analysis_type: str = 'comprehensive') -> str:
+    def analyze_multiple_images(self, image_paths: List[str], prompt: str = None, analysis_type: str = 'comprehensive',
+                                use_cache: bool = True, first_page: int = 1, total_pages: int = None,
+                                page_numbers: List[int] = None) -> str:
         """批量分析多张文档图片
         
+        图片按像素尺寸估算的token数超过单次请求预算时，按页面顺序分批并发分析后合并结果。
+        
         Args:
             image_paths: 图片文件路径列表
             prompt: 自定义提示词
             analysis_type: 分析类型 ('comprehensive', 'ocr', 'visual')
+            use_cache: 是否使用响应缓存
+            first_page: 第一张图片在文档中的页码（只分析文档的一部分连续页面时使用）
+            total_pages: 文档总页数，为空时等于最后一张图片的页码（指定page_numbers时不在提示词中说明）
+            page_numbers: 每张图片在文档中的页码（页面不连续时使用，如问答的相关页面），优先于first_page
             
         Returns:
             分析结果文本
         """
+        if page_numbers:
+            page_numbers = list(page_numbers)
+        else:
+            page_numbers = list(range(first_page, first_page + len(image_paths)))
+            total_pages = total_pages or page_numbers[-1]
+        
+        # 自定义提示词按每字约1个token估计
+        reserved_tokens = len(prompt) if prompt else PROMPT_TOKEN_RESERVE
+        batches = self.image_budgeter.plan_batches(image_paths, reserved_tokens)
+        if len(batches) > 1:
+            return self._analyze_image_batches(image_paths, batches, prompt, analysis_type, use_cache,
+                                               page_numbers, total_pages)
+        
+        payload = self._build_image_analysis_payload(image_paths, prompt, analysis_type,
+                                                     self._page_note(page_numbers, total_pages))
+        return self._request_image_analysis(payload, use_cache)
+    
+    def _page_note(self, page_numbers: List[int], total_pages: int = None) -> str:
+        """图片不是文档从第1页开始的全部页面时，追加到提示词的页码说明（否则为空）"""
+        if page_numbers == list(range(1, (total_pages or page_numbers[-1]) + 1)):
+            return ''
+        return self._page_range_note(page_numbers, total_pages)
+    
+    def _page_range_note(self, page_numbers: List[int], total_pages: int = None) -> str:
+        """只分析部分页面时追加到提示词的页码说明，保证[第X页]标注使用文档中的实际页码"""
+        first_page, last_page = page_numbers[0], page_numbers[-1]
+        total_note = f"文档共{total_pages}页，" if total_pages else ''
+        if page_numbers == list(range(first_page, last_page + 1)):
+            return f"""
+
+【分批说明】
+- {total_note}本次提供的是{format_page_numbers(page_numbers)}，其余页面会单独分析后合并
+- 标注页面位置时请使用文档中的实际页码：本次的第1张图片是第{first_page}页"""
+        
+        image_pages = "，".join(f"第{index}张图片是第{page}页" for index, page in enumerate(page_numbers, start=1))
+        return f"""
+
+【页码说明】
+- {total_note}本次提供的是{format_page_numbers(page_numbers)}，这些页面在文档中并不相邻
+- 标注页面位置时请使用文档中的实际页码：{image_pages}"""
+    
+    def _analyze_image_batches(self, image_paths: List[str], batches: List[Dict], prompt: str,
+                               analysis_type: str, use_cache: bool, page_numbers: List[int],
+                               total_pages: int = None) -> str:
+        """分批并发分析超出token预算的多张图片，并按页面顺序合并结果
+        
+        Args:
+            image_paths: 图片文件路径列表
+            batches: ImageTokenBudgeter.plan_batches 返回的批次
+            prompt: 自定义提示词
+            analysis_type: 分析类型
+            use_cache: 是否使用响应缓存
+            page_numbers: 每张图片在文档中的页码
+            total_pages: 文档总页数
+            
+        Returns:
+            按页面顺序合并的分析结果文本
+        """
+        total_tokens = sum(batch['tokens'] for batch in batches)
+        print(f"页面图片预计 {total_tokens} tokens，超过单次请求预算 {self.image_budgeter.token_budget}，"
+              f"分为 {len(batches)} 批并发分析")
+        
+        def analyze_batch(batch: Dict) -> str:
+            payload = self._build_image_analysis_payload(
+                [image_paths[index] for index in batch['indices']], prompt, analysis_type,
+                self._page_range_note([page_numbers[index] for index in batch['indices']], total_pages)
+            )
+            return self._request_image_analysis(payload, use_cache)
+        
+        # 每个批次在调用方上下文的副本中执行，取消令牌随之传递
+        max_workers = min(len(batches), self.config['max_concurrency'])
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='qwen-batch') as executor:
+            futures = [executor.submit(contextvars.copy_context().run, analyze_batch, batch) for batch in batches]
+            try:
+                results = [future.result() for future in futures]
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+        
+        sections = []
+        for batch, result in zip(batches, results):
+            page_range = format_page_numbers([page_numbers[index] for index in batch['indices']])
+            sections.append(f"## {page_range}\n\n{result}")
+        print(f"=== {len(batches)} 批图片分析完成，已按页面顺序合并 ===\n")
+        return "\n\n".join(sections)
+    
+    def _request_image_analysis(self, payload: Dict, use_cache: bool) -> str:
+        """发送图片分析请求并返回结果文本"""
+        try:
+            print("正在调用大模型API...")
+            response = self.transport.post('/chat/completions', payload,
+                                           call_type='image_analysis', use_cache=use_cache)
+            
+            print(f"API响应状态码: {response.status_code}")
+            
+            if response.status_code == 200:
+                result = response.json()
+                analysis_result = result['choices'][0]['message']['content']
+                print(f"分析结果长度: {len(analysis_result)} 字符")
+                print(f"分析结果预览: {analysis_result[:200]}{'...' if len(analysis_result) > 200 else ''}")
+                print("=== 批量文档图片分析完成 ===\n")
+                return analysis_result
+            else:
+                print(f"API请求失败: {response.status_code} - {response.text}")
+                print("=== 批量文档图片分析失败 ===\n")
+                raise Exception(f"API请求失败: {response.status_code} - {response.text}")
+                
+        except Exception as e:
+            print(f"批量分析图片失败: {str(e)}")
+            print("=== 批量文档图片分析异常 ===\n")
+            raise Exception(f"批量分析图片失败: {str(e)}")
+    
+    def _build_image_analysis_payload(self, image_paths: List[str], prompt: str = None,
+                                      analysis_type: str = 'comprehensive', prompt_suffix: str = '') -> Dict:
+        """构建批量图片分析的请求体
+        
+        Args:
+            image_paths: 图片文件路径列表
+            prompt: 自定义提示词
+            analysis_type: 分析类型 ('comprehensive', 'ocr', 'visual')
+            prompt_suffix: 追加到提示词末尾的说明（如分批分析时的页码范围）
+            
+        Returns:
+            对话补全接口的请求体
+        """
         print(f"\n=== 大模型批量文档图片分析请求 ===")
         print(f"图片数量: {len(image_paths)}")
         print(f"分析类型: {analysis_type}")
@@ -652,78 +829,48 @@ class QwenClient:
         
         if not prompt:
             prompt = default_prompt
+        prompt += prompt_suffix
         
         print(f"使用模型: {model}")
         print(f"提示词长度: {len(prompt)} 字符")
         
-        try:
-            print("正在读取图片文件...")
-            # 构建消息内容
-            content = [{
-                'type': 'text',
-                'text': prompt
-            }]
-            
-            # 添加所有图片
-            total_size = 0
-            for i, image_path in enumerate(valid_image_paths):
-                with open(image_path, 'rb') as f:
-                    image_data = f.read()
-                
-                total_size += len(image_data)
-                print(f"图片{i+1}文件大小: {len(image_data)} 字节")
-                
-                # 将图片转换为base64
-                import base64
-                image_base64 = base64.b64encode(image_data).decode('utf-8')
-                
-                content.append({
-                    'type': 'image_url',
-                    'image_url': {
-                        'url': f'data:image/jpeg;base64,{image_base64}'
-                    }
-                })
-            
-            print(f"所有图片总大小: {total_size} 字节")
-            
-            payload = {
-                'model': model,
-                'messages': [
-                    {
-                        'role': 'user',
-                        'content': content
-                    }
-                ],
-                'max_tokens': 8000,  # 增加最大token数以支持多图片分析
-                'temperature': 0.1
-            }
-            
-            print("正在调用大模型API...")
-            response = requests.post(
-                f'{self.base_url}/chat/completions',
-                headers=self.headers,
-                json=payload,
-                timeout=self.timeout  # 使用配置的超时时间
-            )
+        print("正在读取图片文件...")
+        # 构建消息内容
+        content = [{
+            'type': 'text',
+            'text': prompt
+        }]
+        
+        # 添加所有图片
+        total_size = 0
+        for i, image_path in enumerate(valid_image_paths):
+            image_url, image_size = image_payload_cache.get_data_url(image_path)
             
-            print(f"API响应状态码: {response.status_code}")
+            total_size += image_size
+            print(f"图片{i+1}文件大小: {image_size} 字节")
             
-            if response.status_code == 200:
-                result = response.json()
-                analysis_result = result['choices'][0]['message']['content']
-                print(f"分析结果长度: {len(analysis_result)} 字符")
-                print(f"分析结果预览: {analysis_result[:200]}{'...' if len(analysis_result) > 200 else ''}")
-                print("=== 批量文档图片分析完成 ===\n")
-                return analysis_result
-            else:
-                print(f"API请求失败: {response.status_code} - {response.text}")
-                print("=== 批量文档图片分析失败 ===\n")
-                raise Exception(f"API请求失败: {response.status_code} - {response.text}")
-                
-        except Exception as e:
-            print(f"批量分析图片失败: {str(e)}")
-            print("=== 批量文档图片分析异常 ===\n")
-            raise Exception(f"批量分析图片失败: {str(e)}")
+            content.append({
+                'type': 'image_url',
+                'image_url': {
+                    'url': image_url
+                }
+            })
+        
+        print(f"所有图片总大小: {total_size} 字节")
+        
+        payload = {
+            'model': model,
+            'messages': [
+                {
+                    'role': 'user',
+                    'content': content
+                }
+            ],
+            'max_tokens': 8000,  # 增加最大token数以支持多图片分析
+            'temperature': 0.1
+        }
+        
+        return payload
     
     def generate_document_summary_from_images(self, image_paths: List[str]) -> str:
         """直接从图片生成文档总结
@@ -738,44 +885,15 @@ class QwenClient:
         print(f"图片数量: {len(image_paths)}")
         
         try:
-            # 使用批量图片分析
-            batch_analysis = self.analyze_multiple_images(
-                image_paths, 
-                analysis_type='comprehensive'
-            )
+            # 使用批量图片分析（后台优先级，不与交互式问答争抢调用名额）
+            with llm_priority(PRIORITY_BACKGROUND):
+                batch_analysis = self.analyze_multiple_images(
+                    image_paths, 
+                    analysis_type='comprehensive'
+                )
             
             # 生成专门的总结提示词
-            summary_prompt = f"""作为专业的学术文档分析专家，请基于提供给你的PDF文档（已经按照PDF的顺序分割成顺序的图片）的完整分析结果，生成一个全面深入的文档总结：
-
-【文档概览】
-- 文档类型、主题和研究目的
-- 作者信息和发表背景（如有）
-- 文档的学术价值和意义
-
-【核心内容分析】
-- 主要研究问题和假设
-- 研究方法和技术路线
-- 关键发现和实验结果
-- 重要的数据、图表、公式
-- 创新点和贡献
-
-【结构化要点】
-- 各章节的主要内容
-- 重要概念和术语定义
-- 关键结论和建议
-- 局限性和未来工作方向
-
-【实用信息】
-- 可能被用户询问的重点内容
-- 重要信息的页面位置提示
-- 相关的参考文献和引用
-
-请用中文提供结构化、详细且易于理解的总结，帮助用户快速掌握文档精髓，并且你需要确保文字结构的美观与完整性。
-
-【文档分析结果】
-{batch_analysis}
-
-请基于以上完整分析，生成专业的文档总结："""
+            summary_prompt = document_summary_prompt(batch_analysis)
             
             print("正在生成最终文档总结...")
             
@@ -791,12 +909,7 @@ class QwenClient:
                 'temperature': 0.2
             }
             
-            response = requests.post(
-                f'{self.base_url}/chat/completions',
-                headers=self.headers,
-                json=payload,
-                timeout=self.timeout
-            )
+            response = self.transport.post('/chat/completions', payload, call_type='summary')
             
             if response.status_code == 200:
                 result = response.json()
@@ -815,6 +928,39 @@ class QwenClient:
             print("=== 文档总结生成异常 ===\n")
             raise Exception(f"从图片生成文档总结失败: {str(e)}")
     
+    def generate_text(self, prompt: str, max_tokens: int = 4000, temperature: float = 0.2,
+                      call_type: str = 'summary') -> str:
+        """使用文本模型根据提示词生成内容
+        
+        Args:
+            prompt: 提示词
+            max_tokens: 最大输出token数
+            temperature: 采样温度
+            call_type: 调用类型（用于响应缓存和调度优先级）
+            
+        Returns:
+            生成的文本
+        
+        Raises:
+            Exception: API请求失败
+        """
+        payload = {
+            'model': self.text_model,
+            'messages': [
+                {
+                    'role': 'user',
+                    'content': prompt
+                }
+            ],
+            'max_tokens': max_tokens,
+            'temperature': temperature
+        }
+        
+        response = self.transport.post('/chat/completions', payload, call_type=call_type)
+        if response.status_code != 200:
+            raise Exception(f"API请求失败: {response.status_code} - {response.text}")
+        return response.json()['choices'][0]['message']['content']
+    
     def generate_summary(self, page_contents: List[str]) -> str:
         """生成文档总结
         
@@ -878,12 +1024,7 @@ class QwenClient:
                 'temperature': 0.2
             }
             
-            response = requests.post(
-                f'{self.base_url}/chat/completions',
-                headers=self.headers,
-                json=payload,
-                timeout=self.timeout
-            )
+            response = self.transport.post('/chat/completions', payload, call_type='summary')
             
             if response.status_code == 200:
                 result = response.json()
@@ -896,31 +1037,33 @@ class QwenClient:
     
     def answer_question(self, question: str, relevant_pages: List[str], 
                        conversation_history: List[Dict] = None, 
-                       page_images: List[str] = None) -> Dict:
+                       page_images: List[str] = None, use_cache: bool = True,
+                       page_numbers: List[int] = None) -> Dict:
         """回答关于文档的问题
         
         Args:
             question: 用户问题
-            relevant_pages: 相关页面内容
+            relevant_pages: 相关页面内容（文字层，附带页面笔记）
             conversation_history: 对话历史
-            page_images: 相关页面图片路径列表
+            page_images: 需要模型直接查看的页面图片（页面笔记足以覆盖的页面无需提供）
+            use_cache: 是否使用响应缓存（客户端要求重新生成时为False）
+            page_numbers: page_images 各图片在文档中的页码
             
         Returns:
             包含回答内容和相关信息的字典
         """
-        # 检测是否是图表相关问题
-        is_figure_question = self._analyze_question_type(question)
-        
-        # 如果没有相关页面内容，检查是否可以通过图片分析来回答图表问题
+        # 没有文字层内容（如扫描件）时，使用页面图片回答
         if not relevant_pages:
-            if is_figure_question and page_images:
-                print("检测到图表问题且无文字内容，使用图片进行分析...")
+            if page_images:
+                print("无文字内容，使用页面图片进行分析...")
                 try:
-                    # 使用图片分析来回答图表问题
+                    prompt, analysis_type = self._image_answer_prompt(question)
                     image_analysis = self.analyze_multiple_images(
                         page_images, 
-                        prompt=f"请专门针对用户问题'{question}'进行分析，重点关注相关的图表、图像和视觉元素。",
-                        analysis_type='visual'
+                        prompt=prompt,
+                        analysis_type=analysis_type,
+                        use_cache=use_cache,
+                        page_numbers=page_numbers
                     )
                     return {
                         'answer': image_analysis,
@@ -944,6 +1087,171 @@ class QwenClient:
                     'confidence': 0.0
                 }
         
+        payload = self._build_answer_payload(question, relevant_pages, conversation_history, page_images)
+        model = payload['model']
+        context = "\n\n".join(relevant_pages)
+        
+        try:
+            response = self.transport.post('/chat/completions', payload,
+                                           call_type='answer', use_cache=use_cache)
+            
+            if response.status_code == 200:
+                result = response.json()
+                answer_content = result['choices'][0]['message']['content']
+                
+                # 分析回答类型和置信度
+                answer_type = self._determine_answer_type(answer_content, question)
+                confidence = self._calculate_confidence(answer_content, context)
+                
+                return {
+                    'answer': answer_content,
+                    'answer_type': answer_type,
+                    'source_images': page_images if page_images else [],
+                    'confidence': confidence,
+                    'model_used': model
+                }
+            else:
+                raise Exception(f"API请求失败: {response.status_code} - {response.text}")
+                
+        except Exception as e:
+            return {
+                'answer': f"回答问题失败: {str(e)}",
+                'answer_type': 'error',
+                'source_images': [],
+                'confidence': 0.0
+            }
+    
+    def answer_question_stream(self, question: str, relevant_pages: List[str],
+                               conversation_history: List[Dict] = None,
+                               page_images: List[str] = None,
+                               page_numbers: List[int] = None) -> Iterator[Dict]:
+        """流式回答关于文档的问题
+        
+        Args:
+            question: 用户问题
+            relevant_pages: 相关页面内容
+            conversation_history: 对话历史
+            page_images: 相关页面图片路径列表
+            page_numbers: page_images 各图片在文档中的页码
+            
+        Returns:
+            事件迭代器：若干 {'type': 'delta', 'content'}，最后是一个
+            {'type': 'done', 'answer', 'answer_type', 'confidence', 'model_used', 'source_images'}
+        """
+        if relevant_pages:
+            payload = self._build_answer_payload(question, relevant_pages, conversation_history, page_images)
+            context = "\n\n".join(relevant_pages)
+        elif page_images:
+            print("无文字内容，使用页面图片进行分析...")
+            prompt, analysis_type = self._image_answer_prompt(question)
+            if len(self.image_budgeter.plan_batches(page_images, len(prompt))) > 1:
+                # 超出单次请求的token预算时与非流式问答一样分批分析，合并结果作为一次增量返回
+                answer = self.analyze_multiple_images(page_images, prompt=prompt, analysis_type=analysis_type,
+                                                      page_numbers=page_numbers)
+                yield {'type': 'delta', 'content': answer}
+                yield {
+                    'type': 'done',
+                    'answer': answer,
+                    'answer_type': 'visual_analysis',
+                    'confidence': 0.8,
+                    'model_used': self.vision_model,
+                    'source_images': page_images
+                }
+                return
+            page_note = self._page_note(page_numbers, None) if page_numbers else ''
+            payload = self._build_image_analysis_payload(page_images, prompt, analysis_type, page_note)
+            context = None
+        else:
+            answer = "抱歉，没有找到相关的文档内容来回答您的问题。"
+            yield {'type': 'delta', 'content': answer}
+            yield {
+                'type': 'done',
+                'answer': answer,
+                'answer_type': 'text',
+                'confidence': 0.0,
+                'model_used': None,
+                'source_images': []
+            }
+            return
+        
+        parts = []
+        for delta in self.stream_completion(payload):
+            parts.append(delta)
+            yield {'type': 'delta', 'content': delta}
+        answer = ''.join(parts)
+        
+        yield {
+            'type': 'done',
+            'answer': answer,
+            'answer_type': self._determine_answer_type(answer, question) if context is not None else 'visual_analysis',
+            'confidence': self._calculate_confidence(answer, context) if context is not None else 0.8,
+            'model_used': payload['model'],
+            'source_images': page_images if page_images else []
+        }
+    
+    def stream_completion(self, payload: Dict) -> Iterator[str]:
+        """以流式方式调用对话补全接口（SSE）
+        
+        请求最后一个数据块附带token用量，读取结束后按实际用量修正限流器的token桶。
+        
+        Args:
+            payload: 请求体（自动加上 stream: true）
+            
+        Returns:
+            增量文本迭代器
+        """
+        response = self.transport.post(
+            '/chat/completions',
+            {**payload, 'stream': True, 'stream_options': {'include_usage': True}},
+            stream=True
+        )
+        total_tokens = None
+        try:
+            if response.status_code != 200:
+                raise Exception(f"API请求失败: {response.status_code} - {response.text}")
+            
+            response.encoding = 'utf-8'
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                
+                chunk = json.loads(data)
+                usage = chunk.get('usage') or {}
+                if isinstance(usage.get('total_tokens'), (int, float)):
+                    total_tokens = int(usage['total_tokens'])
+                choices = chunk.get('choices') or []
+                if not choices:
+                    continue
+                delta = (choices[0].get('delta') or {}).get('content')
+                if delta:
+                    yield delta
+        finally:
+            response.close()
+            self.transport.settle_stream(response, total_tokens)
+    
+    def _image_answer_prompt(self, question: str) -> Tuple[str, str]:
+        """没有文字层时基于页面图片回答问题的提示词和分析类型"""
+        if self._analyze_question_type(question):
+            return f"请专门针对用户问题'{question}'进行分析，重点关注相关的图表、图像和视觉元素。", 'visual'
+        return f"请基于页面内容准确、详细地回答用户问题'{question}'，并指出相关内容所在的页面。", 'comprehensive'
+    
+    def _build_answer_payload(self, question: str, relevant_pages: List[str],
+                              conversation_history: List[Dict] = None,
+                              page_images: List[str] = None) -> Dict:
+        """构建文档问答的请求体
+        
+        Args:
+            question: 用户问题
+            relevant_pages: 相关页面内容
+            conversation_history: 对话历史
+            page_images: 相关页面图片路径列表
+            
+        Returns:
+            对话补全接口的请求体
+        """
         # 构建上下文
         context = "\n\n".join(relevant_pages)
         
@@ -1083,49 +1391,15 @@ class QwenClient:
             'content': user_content
         })
         
-        try:
-            # 根据问题类型选择合适的模型
-            model = self.vision_model if (needs_visual and page_images) else self.text_model
-            
-            payload = {
-                'model': model,
-                'messages': messages,
-                'max_tokens': 3000,
-                'temperature': 0.1
-            }
-            
-            response = requests.post(
-                f'{self.base_url}/chat/completions',
-                headers=self.headers,
-                json=payload,
-                timeout=self.timeout
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                answer_content = result['choices'][0]['message']['content']
-                
-                # 分析回答类型和置信度
-                answer_type = self._determine_answer_type(answer_content, question)
-                confidence = self._calculate_confidence(answer_content, context)
-                
-                return {
-                    'answer': answer_content,
-                    'answer_type': answer_type,
-                    'source_images': page_images if page_images else [],
-                    'confidence': confidence,
-                    'model_used': model
-                }
-            else:
-                raise Exception(f"API请求失败: {response.status_code} - {response.text}")
-                
-        except Exception as e:
-            return {
-                'answer': f"回答问题失败: {str(e)}",
-                'answer_type': 'error',
-                'source_images': [],
-                'confidence': 0.0
-            }
+        # 根据问题类型选择合适的模型
+        model = self.vision_model if (needs_visual and page_images) else self.text_model
+        
+        return {
+            'model': model,
+            'messages': messages,
+            'max_tokens': 3000,
+            'temperature': 0.1
+        }
     
     def _analyze_question_type(self, question: str) -> bool:
         """分析问题类型，判断是否需要视觉支持
@@ -1251,58 +1525,13 @@ class QwenClient:
             print(f"用户问题: {message}")
             print(f"对话历史条数: {len(conversation_history) if conversation_history else 0}")
             
-            # 构建消息列表
-            messages = []
-            
-            # 系统提示
-            system_prompt = """你是一个专攻于AI领域文献分析的智能助手，能够回答用户上传的文献中的各种相关问题。请用中文回答用户的问题，保持友好、专业的语调。
-            
-如果用户询问关于PDF文档分析的问题，请提醒用户可以上传PDF文档来获得更专业的文档分析服务。"""
-            
-            messages.append({
-                'role': 'system',
-                'content': system_prompt
-            })
-            
-            # 添加对话历史（最近5轮）
-            if conversation_history:
-                recent_history = conversation_history[-5:]
-                print(f"使用最近 {len(recent_history)} 轮对话历史")
-                for conv in recent_history:
-                    if 'question' in conv and 'answer' in conv:
-                        messages.append({
-                            'role': 'user',
-                            'content': conv['question']
-                        })
-                        messages.append({
-                            'role': 'assistant',
-                            'content': conv['answer']
-                        })
-            
-            # 添加当前用户消息
-            messages.append({
-                'role': 'user',
-                'content': message
-            })
-            
-            print(f"发送给大模型的消息数量: {len(messages)}")
-            
-            payload = {
-                'model': self.text_model,
-                'messages': messages,
-                'max_tokens': 2000,
-                'temperature': 0.7
-            }
+            payload = self._build_chat_payload(message, conversation_history)
+            print(f"发送给大模型的消息数量: {len(payload['messages'])}")
             
             print(f"使用模型: {self.text_model}")
             print("正在调用大模型API...")
             
-            response = requests.post(
-                f'{self.base_url}/chat/completions',
-                headers=self.headers,
-                json=payload,
-                timeout=self.timeout
-            )
+            response = self.transport.post('/chat/completions', payload, call_type='chat')
             
             print(f"API响应状态码: {response.status_code}")
             
@@ -1323,6 +1552,71 @@ class QwenClient:
             print("=== 聊天请求异常 ===\n")
             return f"抱歉，处理您的消息时出现错误: {str(e)}"
     
+    def chat_stream(self, message: str, conversation_history: List[Dict] = None) -> Iterator[str]:
+        """流式通用聊天
+        
+        Args:
+            message: 用户消息
+            conversation_history: 对话历史
+            
+        Returns:
+            增量文本迭代器
+        """
+        print(f"\n=== 大模型流式聊天请求 ===")
+        print(f"用户问题: {message}")
+        return self.stream_completion(self._build_chat_payload(message, conversation_history))
+    
+    def _build_chat_payload(self, message: str, conversation_history: List[Dict] = None) -> Dict:
+        """构建通用聊天的请求体
+        
+        Args:
+            message: 用户消息
+            conversation_history: 对话历史
+            
+        Returns:
+            对话补全接口的请求体
+        """
+        # 构建消息列表
+        messages = []
+        
+        # 系统提示
+        system_prompt = """你是一个专攻于AI领域文献分析的智能助手，能够回答用户上传的文献中的各种相关问题。请用中文回答用户的问题，保持友好、专业的语调。
+        
+如果用户询问关于PDF文档分析的问题，请提醒用户可以上传PDF文档来获得更专业的文档分析服务。"""
+        
+        messages.append({
+            'role': 'system',
+            'content': system_prompt
+        })
+        
+        # 添加对话历史（最近5轮）
+        if conversation_history:
+            recent_history = conversation_history[-5:]
+            print(f"使用最近 {len(recent_history)} 轮对话历史")
+            for conv in recent_history:
+                if 'question' in conv and 'answer' in conv:
+                    messages.append({
+                        'role': 'user',
+                        'content': conv['question']
+                    })
+                    messages.append({
+                        'role': 'assistant',
+                        'content': conv['answer']
+                    })
+        
+        # 添加当前用户消息
+        messages.append({
+            'role': 'user',
+            'content': message
+        })
+        
+        return {
+            'model': self.text_model,
+            'messages': messages,
+            'max_tokens': 2000,
+            'temperature': 0.7
+        }
+    
     def test_connection(self) -> bool:
         """测试API连接
         
@@ -1341,12 +1635,7 @@ class QwenClient:
                 'max_tokens': 10
             }
             
-            response = requests.post(
-                f'{self.base_url}/chat/completions',
-                headers=self.headers,
-                json=payload,
-                timeout=self.timeout
-            )
+            response = self.transport.post('/chat/completions', payload)
             
             return response.status_code == 200
             
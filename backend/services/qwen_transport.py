@@ -0,0 +1,372 @@
+import time
+import random
+import socket
+import threading
+import requests
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from backend.utils.api_manager import api_manager
+from backend.utils.cancellation import check_cancelled, sleep_cancellable
+from backend.utils.metrics import metrics
+from backend.services.response_cache import canonical_request_key, create_response_cache
+from backend.services.rate_limiter import create_rate_limiter, estimate_payload_tokens, response_total_tokens
+from backend.services.llm_scheduler import PriorityScheduler, resolve_priority, PRIORITY_CLASSES
+
+# 可重试的HTTP状态码（限流和服务端临时错误）
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# 非幂等请求只在服务端明确表示未处理时重试
+NON_IDEMPOTENT_RETRYABLE_STATUS_CODES = {429, 503}
+
+class _KeepAliveAdapter(HTTPAdapter):
+    """开启TCP keep-alive探测的连接池适配器，避免空闲连接被中间网络设备断开"""
+    
+    def __init__(self, keepalive_idle: int = 60, **kwargs):
+        self.keepalive_idle = keepalive_idle
+        super().__init__(**kwargs)
+    
+    def init_poolmanager(self, *args, **kwargs):
+        socket_options = list(HTTPConnection.default_socket_options)
+        socket_options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+            socket_options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, self.keepalive_idle))
+        if hasattr(socket, 'TCP_KEEPINTVL'):
+            socket_options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, max(1, self.keepalive_idle // 4)))
+        kwargs['socket_options'] = socket_options
+        super().init_poolmanager(*args, **kwargs)
+
+class RetryBudget:
+    """进程级重试预算 - 限制重试占请求总量的比例，防止故障期间重试风暴放大流量
+    
+    每次新请求存入ratio个令牌，每次重试取出1个令牌；令牌不超过max_tokens。
+    初始令牌数为min_tokens，保证低流量时也能重试。
+    """
+    
+    def __init__(self, ratio: float = 0.2, min_tokens: int = 10):
+        self.ratio = ratio
+        self.max_tokens = max(float(min_tokens), 100.0)
+        self._tokens = float(min_tokens)
+        self._lock = threading.Lock()
+    
+    def deposit(self):
+        """记录一次新请求"""
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+    
+    def withdraw(self) -> bool:
+        """尝试取出一次重试的令牌
+        
+        Returns:
+            预算是否充足
+        """
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+    
+    @property
+    def available(self) -> float:
+        """剩余令牌数"""
+        with self._lock:
+            return round(self._tokens, 2)
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析Retry-After响应头
+    
+    Args:
+        value: 秒数或HTTP日期
+    
+    Returns:
+        需要等待的秒数，无法解析时返回None
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+class QwenTransport:
+    """Qwen HTTP传输层 - 所有QwenClient共享的长连接池
+    
+    连接池由一个HTTPAdapter持有（urllib3连接池本身是线程安全的），
+    每个线程使用自己的Session挂载该适配器，避免多线程共享Session的Cookie等状态。
+    """
+    
+    def __init__(self, config: Dict = None):
+        """初始化传输层
+        
+        Args:
+            config: Qwen配置，为空时从api_manager读取
+        """
+        config = config or api_manager.get_qwen_config()
+        self.base_url = config['base_url']
+        self.headers = api_manager.get_api_headers('qwen')
+        self.connect_timeout = config['connect_timeout']
+        self.read_timeout = config['read_timeout']
+        self.keepalive = config['keepalive']
+        self.pool_size = config['pool_size']
+        self.max_retries = config['max_retries']
+        self.backoff_base = config['retry_backoff_base']
+        self.backoff_max = config['retry_backoff_max']
+        self.retry_after_max = config['retry_after_max']
+        self.retry_budget = RetryBudget(config['retry_budget_ratio'], config['retry_budget_min'])
+        self.response_cache = create_response_cache(config)
+        self.rate_limiter = create_rate_limiter(config)
+        self.scheduler = PriorityScheduler(
+            config['scheduler_slots'],
+            {priority: config[f'scheduler_cap_{priority}'] for priority in PRIORITY_CLASSES}
+        )
+        self.image_tokens = config['image_max_pixels'] // (28 * 28)  # 限流时每张图片按最大token数预估
+        
+        if not self.keepalive:
+            self.headers['Connection'] = 'close'
+        
+        self.adapter = _KeepAliveAdapter(
+            keepalive_idle=config['keepalive_idle'],
+            pool_connections=config['pool_connections'],
+            pool_maxsize=self.pool_size,
+            pool_block=config['pool_block']
+        )
+        
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._calls = 0
+        self._requests = 0
+        self._errors = 0
+        self._retries: Dict[str, int] = {}  # 重试原因 -> 次数
+        self._retry_after_honoured = 0
+        self._budget_exhausted = 0
+        self._gave_up = 0
+        self._backoff_seconds = 0.0
+    
+    def _get_session(self) -> requests.Session:
+        """获取当前线程的Session（共享同一个连接池）"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('https://', self.adapter)
+            session.mount('http://', self.adapter)
+            self._local.session = session
+        return session
+    
+    def post(self, path: str, payload: Dict, timeout: float = None, idempotent: bool = True,
+             stream: bool = False, call_type: str = None, use_cache: bool = True) -> requests.Response:
+        """发送POST请求，遇到限流、服务端临时错误和网络错误时按指数退避重试
+        
+        启用缓存的调用类型先查响应缓存，命中时直接返回CachedResponse，成功的响应写入缓存。
+        每次实际发出请求前先按优先级取得调用名额，再通过限流器取得请求数和token数配额。
+        
+        Args:
+            path: 接口路径（如 /chat/completions）
+            payload: 请求体
+            timeout: 读取超时时间（秒），为空时使用配置值
+            idempotent: 请求是否可安全重发（对话补全接口没有副作用，默认可以）
+            stream: 是否流式读取响应体（只在收到响应头之前重试，不缓存）
+            call_type: 调用类型（如 figure_detection、summary），用于响应缓存和确定优先级
+            use_cache: 是否使用响应缓存（客户端要求重新生成时为False）
+        
+        Returns:
+            响应对象（重试用尽时返回最后一次的错误响应）
+        
+        Raises:
+            requests.exceptions.RequestException: 网络错误且无法重试
+        """
+        cache_key = None
+        if not stream and use_cache and self.response_cache.is_enabled(call_type):
+            check_cancelled()
+            cache_key = canonical_request_key(path, payload)
+            cached = self.response_cache.get(cache_key, call_type)
+            if cached is not None:
+                return cached
+        
+        response = self._post_with_retries(path, payload, timeout, idempotent, stream, resolve_priority(call_type))
+        if cache_key and response.status_code == 200:
+            self.response_cache.put(cache_key, call_type, response.content)
+        return response
+    
+    def _post_with_retries(self, path: str, payload: Dict, timeout: float, idempotent: bool,
+                           stream: bool, priority: str) -> requests.Response:
+        """发送请求并按策略重试（参数同post，priority为调度优先级）"""
+        with self._stats_lock:
+            self._calls += 1
+        self.retry_budget.deposit()
+        estimated_tokens = estimate_payload_tokens(payload, self.image_tokens) if self.rate_limiter.is_enabled() else 0
+        
+        attempt = 0
+        while True:
+            check_cancelled()  # 任务已取消时不再调用大模型
+            
+            with self._stats_lock:
+                self._requests += 1
+            charged = False
+            try:
+                # 名额只在请求期间占用（流式响应到响应头为止），退避等待时归还
+                with self.scheduler.slot(priority):
+                    if self.rate_limiter.is_enabled():
+                        metrics.observe('qwen_rate_limit_wait', self.rate_limiter.acquire(estimated_tokens))
+                        charged = True
+                    response = self._get_session().post(
+                        f'{self.base_url}{path}',
+                        headers=self.headers,
+                        json=payload,
+                        timeout=(self.connect_timeout, timeout or self.read_timeout),
+                        stream=stream
+                    )
+            except requests.exceptions.RequestException as e:
+                if charged:
+                    # 超时、连接重置等没有得到响应的请求退还预扣的token数
+                    self.rate_limiter.settle(estimated_tokens, 0)
+                with self._stats_lock:
+                    self._errors += 1
+                reason = type(e).__name__
+                if not self._is_retryable_error(e, idempotent) or not self._acquire_retry(attempt, reason):
+                    raise
+                delay = self._backoff_delay(attempt)
+            else:
+                if response.status_code == 429:
+                    self.rate_limiter.throttled()
+                if response.status_code != 200:
+                    # 失败的请求不计用量，退还预扣的token数
+                    self.rate_limiter.settle(estimated_tokens, 0)
+                elif stream:
+                    # 流式响应的用量在读完响应体后由 settle_stream 修正
+                    response.estimated_tokens = estimated_tokens
+                else:
+                    # 按实际用量修正token桶
+                    self.rate_limiter.settle(estimated_tokens, response_total_tokens(response))
+                if not self._is_retryable_status(response.status_code, idempotent):
+                    return response
+                
+                reason = str(response.status_code)
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                if retry_after is not None and retry_after > self.retry_after_max:
+                    print(f"Qwen请求返回 {reason}，Retry-After {retry_after:.0f}秒超过上限，不再重试")
+                    with self._stats_lock:
+                        self._gave_up += 1
+                    return response
+                if not self._acquire_retry(attempt, reason):
+                    return response
+                
+                if retry_after is not None:
+                    delay = retry_after
+                    with self._stats_lock:
+                        self._retry_after_honoured += 1
+                else:
+                    delay = self._backoff_delay(attempt)
+                response.close()
+            
+            attempt += 1
+            print(f"Qwen请求失败（{reason}），{delay:.1f}秒后进行第{attempt}/{self.max_retries}次重试")
+            with self._stats_lock:
+                self._backoff_seconds += delay
+            sleep_cancellable(delay)
+    
+    def settle_stream(self, response: requests.Response, actual_tokens: Optional[int]):
+        """流式响应读取结束后按实际用量修正token桶
+        
+        Args:
+            response: post(stream=True) 返回的响应
+            actual_tokens: 最后一个数据块中的 usage.total_tokens，没有时退还预扣的token数
+        """
+        estimated_tokens = getattr(response, 'estimated_tokens', 0)
+        if estimated_tokens:
+            response.estimated_tokens = 0  # 每个响应只修正一次
+            self.rate_limiter.settle(estimated_tokens, actual_tokens or 0)
+    
+    def _is_retryable_status(self, status_code: int, idempotent: bool) -> bool:
+        """响应状态码是否可以重试"""
+        if idempotent:
+            return status_code in RETRYABLE_STATUS_CODES
+        return status_code in NON_IDEMPOTENT_RETRYABLE_STATUS_CODES
+    
+    def _is_retryable_error(self, error: Exception, idempotent: bool) -> bool:
+        """网络错误是否可以重试（非幂等请求只在连接未建立时重试）"""
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        if not idempotent:
+            return False
+        return isinstance(error, (requests.exceptions.ConnectionError,
+                                  requests.exceptions.Timeout,
+                                  requests.exceptions.ChunkedEncodingError))
+    
+    def _acquire_retry(self, attempt: int, reason: str) -> bool:
+        """检查重试次数和重试预算，允许重试时记录统计"""
+        if attempt >= self.max_retries:
+            with self._stats_lock:
+                self._gave_up += 1
+            return False
+        if not self.retry_budget.withdraw():
+            print(f"Qwen重试预算已耗尽，放弃重试（{reason}）")
+            with self._stats_lock:
+                self._budget_exhausted += 1
+                self._gave_up += 1
+            return False
+        with self._stats_lock:
+            self._retries[reason] = self._retries.get(reason, 0) + 1
+        return True
+    
+    def _backoff_delay(self, attempt: int) -> float:
+        """指数退避时间（full jitter）"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+    
+    def get_stats(self) -> Dict:
+        """获取连接复用和重试统计
+        
+        Returns:
+            调用数、实际请求数（含重试）、新建连接数、复用率和重试统计
+        """
+        new_connections = 0
+        pooled_requests = 0
+        idle_connections = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            new_connections += pool.num_connections
+            pooled_requests += pool.num_requests
+            if pool.pool:
+                # 连接池队列中预填了None占位
+                idle_connections += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        
+        with self._stats_lock:
+            retry_stats = {
+                'total': sum(self._retries.values()),
+                'by_reason': dict(self._retries),
+                'retry_after_honoured': self._retry_after_honoured,
+                'budget_exhausted': self._budget_exhausted,
+                'gave_up': self._gave_up,
+                'backoff_seconds': round(self._backoff_seconds, 2),
+                'budget_available': self.retry_budget.available,
+                'max_retries': self.max_retries
+            }
+            calls = self._calls
+            total_requests = self._requests
+            errors = self._errors
+        
+        reused = max(0, pooled_requests - new_connections)
+        return {
+            'calls': calls,
+            'requests': total_requests,
+            'errors': errors,
+            'new_connections': new_connections,
+            'reused_connections': reused,
+            'reuse_ratio': round(reused / pooled_requests, 3) if pooled_requests else 0.0,
+            'idle_connections': idle_connections,
+            'pool_size': self.pool_size,
+            'keepalive': self.keepalive,
+            'retries': retry_stats,
+            'response_cache': self.response_cache.get_stats(),
+            'rate_limit': self.rate_limiter.get_stats(),
+            'scheduler': self.scheduler.get_stats()
+        }
+
+# 全局传输层实例（所有QwenClient共享连接池）
+qwen_transport = QwenTransport()
@@ -0,0 +1,203 @@
+import os
+import re
+import uuid
+import threading
+from typing import List, Dict
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+# pdfium不是线程安全的，所有调用必须串行
+_pdfium_lock = threading.Lock()
+
+class RasterizedDocument:
+    """已打开的待渲染PDF文档"""
+    
+    # 是否支持直接输出最终格式的PNG（无需PIL重新编码）
+    supports_native_output = False
+    
+    def __init__(self, pdf_path: str):
+        self.pdf_path = pdf_path
+    
+    @property
+    def page_count(self) -> int:
+        """总页数"""
+        raise NotImplementedError
+    
+    def get_page_sizes(self) -> Dict[int, tuple]:
+        """获取每页的尺寸（单位：点，已考虑页面旋转）
+        
+        Returns:
+            页码到 (宽, 高) 的映射，无法读取时返回空字典
+        """
+        return {}
+    
+    def render_window(self, first_page: int, last_page: int, output_folder: str,
+                      dpi: int, size: tuple = None, native_output: bool = False) -> List[str]:
+        """渲染一个窗口内的页面到文件
+        
+        Args:
+            first_page: 起始页（从1开始）
+            last_page: 结束页（包含）
+            output_folder: 输出目录
+            dpi: 渲染DPI（size为空时使用）
+            size: 目标像素尺寸 (宽, 高)，其中一条边可以为None表示按比例计算
+            native_output: 是否直接输出最终PNG
+        
+        Returns:
+            按页码顺序排列的图片文件路径
+        """
+        raise NotImplementedError
+    
+    def close(self):
+        """释放文档资源"""
+        pass
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class Pdf2ImageDocument(RasterizedDocument):
+    """基于pdf2image/poppler的渲染（每个窗口启动一次pdftoppm子进程）"""
+    
+    supports_native_output = True
+    
+    def __init__(self, pdf_path: str, render_threads: int = 2, page_count: int = None):
+        super().__init__(pdf_path)
+        self.render_threads = render_threads
+        # 已知页数时跳过pdfinfo调用
+        self._page_count = page_count or int(pdfinfo_from_path(pdf_path)['Pages'])
+    
+    @property
+    def page_count(self) -> int:
+        return self._page_count
+    
+    def get_page_sizes(self) -> Dict[int, tuple]:
+        try:
+            pdf_info = pdfinfo_from_path(self.pdf_path, first_page=1, last_page=self._page_count)
+        except Exception as e:
+            print(f"读取页面尺寸失败，使用固定DPI渲染: {e}")
+            return {}
+        
+        page_sizes = {}
+        rotations = {}
+        for key, value in pdf_info.items():
+            key_match = re.match(r'Page\s+(\d+)\s+(size|rot)$', key)
+            if not key_match:
+                continue
+            page_number = int(key_match.group(1))
+            if key_match.group(2) == 'rot':
+                rotations[page_number] = int(float(value or 0)) % 180
+                continue
+            size_match = re.match(r'([\d.]+)\s*x\s*([\d.]+)\s*pts', str(value))
+            if size_match:
+                page_sizes[page_number] = (float(size_match.group(1)), float(size_match.group(2)))
+        
+        for page_number, rotation in rotations.items():
+            if rotation == 90 and page_number in page_sizes:
+                width, height = page_sizes[page_number]
+                page_sizes[page_number] = (height, width)
+        
+        return page_sizes
+    
+    def render_window(self, first_page: int, last_page: int, output_folder: str,
+                      dpi: int, size: tuple = None, native_output: bool = False) -> List[str]:
+        # 仅返回路径，窗口内的页面不会同时驻留内存
+        return convert_from_path(
+            self.pdf_path,
+            dpi=dpi,
+            size=size,
+            fmt='png' if native_output else 'ppm',
+            first_page=first_page,
+            last_page=last_page,
+            thread_count=self.render_threads,
+            output_folder=output_folder,
+            output_file=f'render_{uuid.uuid4().hex}_',
+            paths_only=True
+        )
+
+class PdfiumDocument(RasterizedDocument):
+    """基于pypdfium2的进程内渲染（逐页渲染，无子进程开销）"""
+    
+    def __init__(self, pdf_path: str):
+        super().__init__(pdf_path)
+        import pypdfium2 as pdfium
+        
+        with _pdfium_lock:
+            self._document = pdfium.PdfDocument(pdf_path)
+            self._page_count = len(self._document)
+    
+    @property
+    def page_count(self) -> int:
+        return self._page_count
+    
+    def get_page_sizes(self) -> Dict[int, tuple]:
+        page_sizes = {}
+        with _pdfium_lock:
+            for index in range(self._page_count):
+                page = self._document[index]
+                try:
+                    # pdfium返回的尺寸已考虑页面旋转
+                    page_sizes[index + 1] = page.get_size()
+                finally:
+                    page.close()
+        return page_sizes
+    
+    def render_window(self, first_page: int, last_page: int, output_folder: str,
+                      dpi: int, size: tuple = None, native_output: bool = False) -> List[str]:
+        rendered_paths = []
+        prefix = uuid.uuid4().hex
+        
+        for page_number in range(first_page, last_page + 1):
+            with _pdfium_lock:
+                page = self._document[page_number - 1]
+                try:
+                    width, height = page.get_size()
+                    scale = dpi / 72
+                    if size and size[0]:
+                        scale = size[0] / width
+                    elif size and size[1]:
+                        scale = size[1] / height
+                    
+                    bitmap = page.render(scale=scale)
+                    image = bitmap.to_pil()
+                finally:
+                    page.close()
+            
+            # 未压缩的PPM写入很快，PNG压缩交给编码工作者
+            rendered_path = os.path.join(output_folder, f'{prefix}-{page_number}.ppm')
+            image.save(rendered_path, 'PPM')
+            image.close()
+            rendered_paths.append(rendered_path)
+        
+        return rendered_paths
+    
+    def close(self):
+        with _pdfium_lock:
+            self._document.close()
+
+# 已注册的渲染后端
+RASTERIZERS = {
+    'pdf2image': Pdf2ImageDocument,
+    'pdfium': PdfiumDocument,
+}
+
+def open_rasterized_document(pdf_path: str, backend: str = 'pdf2image',
+                             render_threads: int = 2, page_count: int = None) -> RasterizedDocument:
+    """使用指定后端打开PDF文档
+    
+    Args:
+        pdf_path: PDF文件路径
+        backend: 渲染后端名称（pdf2image 或 pdfium）
+        render_threads: poppler渲染线程数
+        page_count: 已知的总页数（可选，避免重复读取）
+    
+    Returns:
+        已打开的文档
+    """
+    if backend not in RASTERIZERS:
+        raise ValueError(f"未知的PDF渲染后端: {backend}")
+    
+    if backend == 'pdf2image':
+        return Pdf2ImageDocument(pdf_path, render_threads, page_count)
+    return RASTERIZERS[backend](pdf_path)
@@ -0,0 +1,258 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, Optional
+from config import Config
+from backend.utils.cancellation import sleep_cancellable
+
+# 无法估算图片大小时每张图片按该token数计（settle时按实际用量修正）
+DEFAULT_IMAGE_TOKENS = 1280
+# 单次等待的最长时间，之后重新检查令牌桶（其他进程可能修改了状态）
+MAX_SLEEP_SECONDS = 1.0
+
+def estimate_payload_tokens(payload: Dict, image_tokens: int = DEFAULT_IMAGE_TOKENS) -> int:
+    """估算对话补全请求的输入token数
+    
+    文字按每字符约1个token计（对中文偏准确，对英文偏保守），图片按固定token数计。
+    
+    Args:
+        payload: 请求体
+        image_tokens: 每张图片计入的token数
+    
+    Returns:
+        估算的输入token数
+    """
+    tokens = 0
+    for message in payload.get('messages', []):
+        content = message.get('content')
+        if isinstance(content, str):
+            tokens += len(content)
+            continue
+        for part in content or []:
+            if part.get('type') == 'text':
+                tokens += len(part.get('text', ''))
+            elif part.get('type') == 'image_url':
+                tokens += image_tokens
+    return tokens
+
+class SharedRateLimiter:
+    """大模型调用限流器 - 请求数和token数两个令牌桶，按每分钟配额匀速补充
+    
+    令牌桶状态保存在SQLite中，同一台机器上的多个worker进程共享同一份配额。
+    每次调用前按估算的输入token数扣减，响应返回后按实际用量修正（不足时记为欠额，后续调用等待补足）。
+    """
+    
+    def __init__(self, db_path: str, requests_per_minute: int, tokens_per_minute: int):
+        """初始化限流器
+        
+        Args:
+            db_path: SQLite数据库路径
+            requests_per_minute: 每分钟请求数上限，0表示不限制
+            tokens_per_minute: 每分钟token数上限，0表示不限制
+        """
+        self.db_path = db_path
+        self.limits = {
+            'requests': requests_per_minute,
+            'tokens': tokens_per_minute
+        }
+        self._lock = threading.Lock()
+        self._initialized = False
+        self._acquired = 0
+        self._waited = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+        self._throttled = 0
+    
+    def is_enabled(self) -> bool:
+        """是否启用限流"""
+        return any(limit > 0 for limit in self.limits.values())
+    
+    def _connect(self) -> sqlite3.Connection:
+        """打开数据库连接（首次使用时建表）"""
+        connection = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        connection.execute('PRAGMA synchronous=NORMAL')  # 令牌桶状态无需每次提交都落盘
+        if not self._initialized:
+            with self._lock:
+                if not self._initialized:
+                    connection.execute('PRAGMA journal_mode=WAL')
+                    connection.execute('''
+                        CREATE TABLE IF NOT EXISTS buckets (
+                            name TEXT PRIMARY KEY,
+                            tokens REAL NOT NULL,
+                            updated_at REAL NOT NULL
+                        )
+                    ''')
+                    self._initialized = True
+        return connection
+    
+    def _refill(self, connection: sqlite3.Connection, now: float) -> Dict[str, float]:
+        """按经过的时间计算各桶当前的令牌数（需要写回时调用方应持有写事务）"""
+        levels = {}
+        rows = dict((name, (tokens, updated_at)) for name, tokens, updated_at in
+                    connection.execute('SELECT name, tokens, updated_at FROM buckets'))
+        for name, limit in self.limits.items():
+            if limit <= 0:
+                continue
+            if name in rows:
+                tokens, updated_at = rows[name]
+                tokens = min(float(limit), tokens + max(0.0, now - updated_at) * limit / 60)
+            else:
+                tokens = float(limit)
+            levels[name] = tokens
+        return levels
+    
+    def _save(self, connection: sqlite3.Connection, levels: Dict[str, float], now: float):
+        """写回各桶的令牌数（调用方持有写事务）"""
+        for name, tokens in levels.items():
+            connection.execute('INSERT OR REPLACE INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?)',
+                               (name, tokens, now))
+    
+    def acquire(self, estimated_tokens: int) -> float:
+        """等待直到请求数和token数配额都足够，然后扣减
+        
+        Args:
+            estimated_tokens: 估算的token数（超过每分钟上限时按上限计）
+        
+        Returns:
+            排队等待的秒数
+        """
+        if not self.is_enabled():
+            return 0.0
+        
+        cost = {
+            'requests': 1.0,
+            'tokens': float(min(estimated_tokens, self.limits['tokens'])) if self.limits['tokens'] > 0 else 0.0
+        }
+        started_at = time.time()
+        slept = False
+        
+        while True:
+            now = time.time()
+            connection = self._connect()
+            try:
+                connection.execute('BEGIN IMMEDIATE')
+                levels = self._refill(connection, now)
+                # 各桶补足所需的时间，取最长者
+                wait = max((cost[name] - tokens) * 60 / self.limits[name]
+                           for name, tokens in levels.items())
+                if wait <= 0:
+                    for name in levels:
+                        levels[name] -= cost[name]
+                self._save(connection, levels, now)
+                connection.execute('COMMIT')
+            finally:
+                connection.close()  # 未提交的事务随连接关闭回滚
+            
+            if wait <= 0:
+                break
+            sleep_cancellable(min(wait, MAX_SLEEP_SECONDS))
+            slept = True
+        
+        waited = time.time() - started_at
+        with self._lock:
+            self._acquired += 1
+            if slept:
+                self._waited += 1
+                self._wait_seconds += waited
+                self._max_wait_seconds = max(self._max_wait_seconds, waited)
+        if waited >= 1:
+            print(f"大模型调用限流，排队等待 {waited:.1f} 秒")
+        return waited
+    
+    def settle(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """按实际token用量修正token桶（多退少补，可以变为负数）
+        
+        Args:
+            estimated_tokens: acquire时扣减的估算值
+            actual_tokens: 响应中的实际用量，未知时不修正
+        """
+        if actual_tokens is None or self.limits['tokens'] <= 0:
+            return
+        charged = min(estimated_tokens, self.limits['tokens'])
+        self._adjust('tokens', charged - actual_tokens)
+    
+    def throttled(self):
+        """服务端返回限流（429）时清空请求桶，让所有worker一起放慢"""
+        with self._lock:
+            self._throttled += 1
+        if self.limits['requests'] > 0:
+            self._adjust('requests', None)
+    
+    def _adjust(self, name: str, delta: Optional[float]):
+        """调整一个桶的令牌数，delta为None时清空"""
+        now = time.time()
+        try:
+            connection = self._connect()
+            try:
+                connection.execute('BEGIN IMMEDIATE')
+                levels = self._refill(connection, now)
+                if name in levels:
+                    levels[name] = min(0.0, levels[name]) if delta is None else \
+                        min(float(self.limits[name]), levels[name] + delta)
+                self._save(connection, levels, now)
+                connection.execute('COMMIT')
+            finally:
+                connection.close()
+        except sqlite3.Error as e:
+            print(f"更新限流状态失败: {e}")
+    
+    def get_stats(self) -> Dict:
+        """获取限流统计"""
+        levels = {}
+        if self.is_enabled() and os.path.exists(self.db_path):
+            try:
+                connection = self._connect()
+                try:
+                    levels = self._refill(connection, time.time())
+                finally:
+                    connection.close()
+            except sqlite3.Error as e:
+                print(f"读取限流状态失败: {e}")
+        
+        with self._lock:
+            return {
+                'enabled': self.is_enabled(),
+                'requests_per_minute': self.limits['requests'],
+                'tokens_per_minute': self.limits['tokens'],
+                'available': {name: round(tokens, 1) for name, tokens in levels.items()},
+                'acquired': self._acquired,
+                'waited': self._waited,
+                'wait_seconds': round(self._wait_seconds, 2),
+                'max_wait_seconds': round(self._max_wait_seconds, 2),
+                'throttled_by_server': self._throttled
+            }
+
+def response_total_tokens(response) -> Optional[int]:
+    """读取对话补全响应中的实际token用量
+    
+    Args:
+        response: 响应对象（非流式）
+    
+    Returns:
+        usage.total_tokens，没有时返回None
+    """
+    try:
+        usage = json.loads(response.content).get('usage') or {}
+    except (ValueError, AttributeError):
+        return None
+    total = usage.get('total_tokens')
+    return int(total) if isinstance(total, (int, float)) else None
+
+def create_rate_limiter(config: Dict) -> SharedRateLimiter:
+    """根据Qwen配置创建限流器
+    
+    Args:
+        config: api_manager中的Qwen配置
+    
+    Returns:
+        限流器实例
+    """
+    cache_dir = os.path.join(Config.DATA_FOLDER, 'cache')
+    os.makedirs(cache_dir, exist_ok=True)
+    return SharedRateLimiter(
+        os.path.join(cache_dir, 'rate_limit.sqlite3'),
+        requests_per_minute=config['rate_limit_rpm'],
+        tokens_per_minute=config['rate_limit_tpm']
+    )
@@ -0,0 +1,245 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Iterable, Optional
+from config import Config
+
+class CachedResponse:
+    """缓存命中时代替requests.Response返回的响应对象"""
+    
+    def __init__(self, content: bytes):
+        self.status_code = 200
+        self.content = content
+        self.headers = {'X-Cache': 'HIT'}
+        self.from_cache = True
+    
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8')
+    
+    def json(self):
+        return json.loads(self.content)
+    
+    def close(self):
+        pass
+
+def canonical_request_key(path: str, payload: Dict) -> str:
+    """计算请求的规范化哈希
+    
+    字典按键排序序列化；data URL图片替换为其内容的SHA-256，避免把几MB的base64写入键。
+    
+    Args:
+        path: 接口路径
+        payload: 请求体
+    
+    Returns:
+        十六进制SHA-256
+    """
+    def normalize(value):
+        if isinstance(value, dict):
+            return {key: normalize(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [normalize(item) for item in value]
+        if isinstance(value, str) and value.startswith('data:') and ';base64,' in value:
+            return 'sha256:' + hashlib.sha256(value.encode('utf-8')).hexdigest()
+        return value
+    
+    canonical = json.dumps({'path': path, 'payload': normalize(payload)},
+                           sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """大模型响应缓存 - 以SQLite持久化，按规范化请求哈希命中
+    
+    条目超过TTL后失效，总大小超过上限时按最近访问时间淘汰。
+    只缓存启用的调用类型（如Figure检测、文档总结），通用聊天等默认不缓存。
+    """
+    
+    def __init__(self, db_path: str, ttl_seconds: int, max_bytes: int, call_types: Iterable[str]):
+        """初始化响应缓存
+        
+        Args:
+            db_path: SQLite数据库路径
+            ttl_seconds: 条目有效期（秒）
+            max_bytes: 缓存响应的总字节数上限，0表示禁用缓存
+            call_types: 启用缓存的调用类型
+        """
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.call_types = set(call_types)
+        self._lock = threading.Lock()
+        self._initialized = False
+        self._hits: Dict[str, int] = {}
+        self._misses: Dict[str, int] = {}
+        self._stores = 0
+        self._evictions = 0
+        self._expired = 0
+    
+    def is_enabled(self, call_type: Optional[str]) -> bool:
+        """该调用类型是否启用缓存"""
+        return self.max_bytes > 0 and call_type in self.call_types
+    
+    def _connect(self) -> sqlite3.Connection:
+        """打开数据库连接（首次使用时建表）"""
+        connection = sqlite3.connect(self.db_path, timeout=10)
+        if not self._initialized:
+            with self._lock:
+                if not self._initialized:
+                    connection.execute('PRAGMA journal_mode=WAL')
+                    connection.execute('''
+                        CREATE TABLE IF NOT EXISTS responses (
+                            key TEXT PRIMARY KEY,
+                            call_type TEXT,
+                            body BLOB NOT NULL,
+                            size INTEGER NOT NULL,
+                            created_at REAL NOT NULL,
+                            last_access REAL NOT NULL
+                        )
+                    ''')
+                    connection.execute('CREATE INDEX IF NOT EXISTS idx_responses_access ON responses (last_access)')
+                    connection.commit()
+                    self._initialized = True
+        return connection
+    
+    def get(self, key: str, call_type: str) -> Optional[CachedResponse]:
+        """查找缓存
+        
+        Args:
+            key: 规范化请求哈希
+            call_type: 调用类型
+        
+        Returns:
+            命中时返回CachedResponse，否则返回None
+        """
+        now = time.time()
+        try:
+            connection = self._connect()
+            try:
+                row = connection.execute('SELECT body, created_at FROM responses WHERE key = ?', (key,)).fetchone()
+                if row and now - row[1] > self.ttl_seconds:
+                    connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+                    connection.commit()
+                    with self._lock:
+                        self._expired += 1
+                    row = None
+                if row:
+                    connection.execute('UPDATE responses SET last_access = ? WHERE key = ?', (now, key))
+                    connection.commit()
+            finally:
+                connection.close()
+        except sqlite3.Error as e:
+            print(f"读取响应缓存失败: {e}")
+            return None
+        
+        with self._lock:
+            counter = self._hits if row else self._misses
+            counter[call_type] = counter.get(call_type, 0) + 1
+        if row:
+            print(f"响应缓存命中（{call_type}）")
+            return CachedResponse(bytes(row[0]))
+        return None
+    
+    def put(self, key: str, call_type: str, body: bytes):
+        """写入缓存并按大小上限淘汰
+        
+        Args:
+            key: 规范化请求哈希
+            call_type: 调用类型
+            body: 响应体
+        """
+        if len(body) > self.max_bytes:
+            return
+        
+        now = time.time()
+        try:
+            connection = self._connect()
+            try:
+                connection.execute(
+                    'INSERT OR REPLACE INTO responses (key, call_type, body, size, created_at, last_access) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (key, call_type, sqlite3.Binary(body), len(body), now, now)
+                )
+                evicted = self._evict(connection)
+                connection.commit()
+            finally:
+                connection.close()
+        except sqlite3.Error as e:
+            print(f"写入响应缓存失败: {e}")
+            return
+        
+        with self._lock:
+            self._stores += 1
+            self._evictions += evicted
+    
+    def _evict(self, connection: sqlite3.Connection) -> int:
+        """删除过期条目，并按最近访问时间淘汰直到总大小不超过上限"""
+        connection.execute('DELETE FROM responses WHERE created_at < ?', (time.time() - self.ttl_seconds,))
+        
+        total_bytes = connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        evicted = 0
+        if total_bytes <= self.max_bytes:
+            return evicted
+        
+        for key, size in connection.execute('SELECT key, size FROM responses ORDER BY last_access').fetchall():
+            connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+            evicted += 1
+            total_bytes -= size
+            if total_bytes <= self.max_bytes:
+                break
+        return evicted
+    
+    def get_stats(self) -> Dict:
+        """获取缓存统计"""
+        entries, total_bytes = 0, 0
+        if self.max_bytes > 0 and os.path.exists(self.db_path):
+            try:
+                connection = self._connect()
+                try:
+                    entries, total_bytes = connection.execute(
+                        'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses'
+                    ).fetchone()
+                finally:
+                    connection.close()
+            except sqlite3.Error as e:
+                print(f"读取响应缓存统计失败: {e}")
+        
+        with self._lock:
+            hits = sum(self._hits.values())
+            misses = sum(self._misses.values())
+            return {
+                'enabled_call_types': sorted(self.call_types) if self.max_bytes > 0 else [],
+                'entries': entries,
+                'bytes': total_bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': hits,
+                'misses': misses,
+                'hit_ratio': round(hits / (hits + misses), 3) if hits + misses else 0.0,
+                'hits_by_call_type': dict(self._hits),
+                'stores': self._stores,
+                'evictions': self._evictions,
+                'expired': self._expired
+            }
+
+def create_response_cache(config: Dict) -> ResponseCache:
+    """根据Qwen配置创建响应缓存
+    
+    Args:
+        config: api_manager中的Qwen配置
+    
+    Returns:
+        响应缓存实例
+    """
+    cache_dir = os.path.join(Config.DATA_FOLDER, 'cache')
+    os.makedirs(cache_dir, exist_ok=True)
+    call_types = [item.strip() for item in config['cache_call_types'].split(',') if item.strip()]
+    return ResponseCache(
+        os.path.join(cache_dir, 'responses.sqlite3'),
+        ttl_seconds=config['cache_ttl'],
+        max_bytes=config['cache_max_mb'] * 1024 * 1024,
+        call_types=call_types
+    )
@@ -0,0 +1,199 @@
+import re
+import math
+import time
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional
+from config import Config
+from backend.services.question_analyzer import QuestionAnalyzer
+
+# 构造字符二元组时忽略的虚词
+STOP_CHARS = set('的了吗呢吧啊是有什么哪些这篇该本请问一下')
+
+# 否定词：只差一个否定词的问题相似度很高但含义相反，否定词必须完全一致
+NEGATION_PATTERN = re.compile(r'[不没未非无否]|\b(?:not|no|never|none|without)\b|n\'t\b', re.I)
+
+class SemanticQuestionCache:
+    """文档问题语义缓存 - 相似的问题直接复用之前的回答，不再调用大模型
+    
+    问题表示为jieba关键词和字符二元组的TF-IDF向量（IDF按同一文档已缓存的问题计算），
+    与同一文档的历史问题做余弦相似度比较，超过阈值即命中。
+    问题中的数字（页码、章节号等）和否定词必须完全一致，Figure查询不参与缓存。
+    """
+    
+    def __init__(self, threshold: float, max_entries_per_document: int, max_documents: int):
+        """初始化语义缓存
+        
+        Args:
+            threshold: 命中所需的最低余弦相似度
+            max_entries_per_document: 每个文档保留的问题数
+            max_documents: 保留缓存的文档数，超出时淘汰最久未使用的文档
+        """
+        self.threshold = threshold
+        self.max_entries_per_document = max_entries_per_document
+        self.max_documents = max_documents
+        self.question_analyzer = QuestionAnalyzer()
+        self._documents: OrderedDict = OrderedDict()  # 文档ID -> 条目列表
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._stores = 0
+    
+    def is_enabled(self) -> bool:
+        """是否启用语义缓存"""
+        return self.max_entries_per_document > 0 and 0 < self.threshold <= 1
+    
+    def is_cacheable(self, question_analysis: Dict) -> bool:
+        """问题是否可以使用缓存（Figure查询需要重新检测和截图）"""
+        return not question_analysis['figure_info']['has_figure_request']
+    
+    def _features(self, question: str, keywords: List[str]) -> Counter:
+        """提取问题的词项：关键词和去除虚词后的字符二元组"""
+        features = Counter(f'w:{keyword.lower()}' for keyword in keywords)
+        chars = [char for char in re.sub(r'[\W_]+', '', question.lower()) if char not in STOP_CHARS]
+        features.update(f'c:{first}{second}' for first, second in zip(chars, chars[1:]))
+        return features
+    
+    def _numbers(self, question: str) -> frozenset:
+        """提取问题中的数字（页码、Figure编号等）"""
+        return frozenset(re.findall(r'\d+', question))
+    
+    def _negations(self, question: str) -> frozenset:
+        """提取问题中的否定词（不、没、未、not、without等）"""
+        return frozenset(match.lower() for match in NEGATION_PATTERN.findall(question))
+    
+    def _similarity(self, features: Counter, other: Counter, idf: Dict[str, float]) -> float:
+        """计算两个问题TF-IDF向量的余弦相似度"""
+        weighted = {term: count * idf.get(term, 1.0) for term, count in features.items()}
+        other_weighted = {term: count * idf.get(term, 1.0) for term, count in other.items()}
+        dot = sum(weight * other_weighted.get(term, 0.0) for term, weight in weighted.items())
+        norm = math.sqrt(sum(weight * weight for weight in weighted.values()))
+        other_norm = math.sqrt(sum(weight * weight for weight in other_weighted.values()))
+        if not norm or not other_norm:
+            return 0.0
+        return dot / (norm * other_norm)
+    
+    def lookup(self, document_id: str, question: str, question_analysis: Dict = None) -> Optional[Dict]:
+        """查找相似问题的缓存回答
+        
+        Args:
+            document_id: 文档ID
+            question: 用户问题
+            question_analysis: 问题分析结果，为空时重新分析
+        
+        Returns:
+            命中时返回 {'response', 'matched_question', 'similarity'}，否则返回None
+        """
+        if not self.is_enabled():
+            return None
+        
+        question_analysis = question_analysis or self.question_analyzer.analyze_question(question)
+        if not self.is_cacheable(question_analysis):
+            return None
+        
+        features = self._features(question, question_analysis['keywords'])
+        numbers = self._numbers(question)
+        negations = self._negations(question)
+        
+        with self._lock:
+            entries = list(self._documents.get(document_id, []))
+            if entries:
+                self._documents.move_to_end(document_id)
+        
+        best_entry, best_similarity = None, 0.0
+        if entries:
+            document_frequency = Counter(term for entry in entries for term in entry['features'])
+            total = len(entries) + 1
+            idf = {term: math.log((total + 1) / (frequency + 1)) + 1
+                   for term, frequency in document_frequency.items()}
+            
+            for entry in entries:
+                if (entry['numbers'] != numbers or entry['negations'] != negations or
+                        entry['question_type'] != question_analysis['question_type']):
+                    continue
+                similarity = self._similarity(features, entry['features'], idf)
+                if similarity > best_similarity:
+                    best_entry, best_similarity = entry, similarity
+        
+        with self._lock:
+            if best_entry is not None and best_similarity >= self.threshold:
+                self._hits += 1
+                best_entry['hits'] += 1
+            else:
+                self._misses += 1
+                best_entry = None
+        
+        if best_entry is None:
+            return None
+        
+        print(f"语义缓存命中: 「{question}」≈「{best_entry['question']}」（相似度 {best_similarity:.2f}）")
+        return {
+            'response': best_entry['response'],
+            'matched_question': best_entry['question'],
+            'similarity': round(best_similarity, 3)
+        }
+    
+    def store(self, document_id: str, question: str, response: Dict, question_analysis: Dict = None):
+        """缓存问题的回答
+        
+        Args:
+            document_id: 文档ID
+            question: 用户问题
+            response: 返回给客户端的回答数据
+            question_analysis: 问题分析结果，为空时重新分析
+        """
+        if not self.is_enabled():
+            return
+        
+        question_analysis = question_analysis or self.question_analyzer.analyze_question(question)
+        if not self.is_cacheable(question_analysis):
+            return
+        
+        entry = {
+            'question': question,
+            'features': self._features(question, question_analysis['keywords']),
+            'numbers': self._numbers(question),
+            'negations': self._negations(question),
+            'question_type': question_analysis['question_type'],
+            'response': response,
+            'created_at': time.time(),
+            'hits': 0
+        }
+        
+        with self._lock:
+            entries = self._documents.setdefault(document_id, [])
+            self._documents.move_to_end(document_id)
+            entries[:] = [item for item in entries if item['question'] != question]
+            entries.append(entry)
+            del entries[:-self.max_entries_per_document]
+            self._stores += 1
+            
+            while len(self._documents) > self.max_documents:
+                self._documents.popitem(last=False)
+    
+    def invalidate(self, document_id: str):
+        """清除文档的缓存（文档删除时调用）"""
+        with self._lock:
+            self._documents.pop(document_id, None)
+    
+    def get_stats(self) -> Dict:
+        """获取缓存统计"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'enabled': self.is_enabled(),
+                'threshold': self.threshold,
+                'documents': len(self._documents),
+                'entries': sum(len(entries) for entries in self._documents.values()),
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': round(self._hits / lookups, 3) if lookups else 0.0,
+                'stores': self._stores
+            }
+
+# 全局语义缓存
+semantic_cache = SemanticQuestionCache(
+    threshold=Config.SEMANTIC_CACHE_THRESHOLD if Config.SEMANTIC_CACHE_ENABLED else 0,
+    max_entries_per_document=Config.SEMANTIC_CACHE_MAX_ENTRIES,
+    max_documents=Config.SEMANTIC_CACHE_MAX_DOCUMENTS
+)
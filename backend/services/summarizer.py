@@ -0,0 +1,315 @@
+import os
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from config import Config
+from backend.services.qwen_client import document_summary_prompt
+from backend.services.async_qwen_client import AsyncQwenClient
+from backend.services.llm_scheduler import llm_priority, PRIORITY_BACKGROUND
+from backend.services.page_notes import split_page_notes, save_page_notes
+from backend.services.summary_progress import summary_progress
+from backend.services.summary_checkpoints import (
+    SummaryCheckpoint, summary_checkpoints, content_hash, file_hashes, CHECKPOINT_VERSION
+)
+from backend.utils.api_manager import api_manager
+from backend.utils.event_loop import event_loop_thread
+from backend.utils.single_flight import SingleFlight
+from backend.utils.metrics import metrics
+
+def format_page_range(first_page: int, last_page: int) -> str:
+    """页码范围的显示文本"""
+    return f"第{first_page}页" if first_page == last_page else f"第{first_page}-{last_page}页"
+
+def format_sections(sections: List[Dict]) -> str:
+    """把分段结果按页面顺序拼接为带页码标题的文本"""
+    return "\n\n".join(f"## {format_page_range(section['first_page'], section['last_page'])}\n\n{section['text']}"
+                       for section in sections)
+
+def reduce_prompt(sections: List[Dict]) -> str:
+    """生成合并若干分段分析结果的提示词
+    
+    Args:
+        sections: 按页面顺序排列的分段结果
+    
+    Returns:
+        提示词
+    """
+    page_range = format_page_range(sections[0]['first_page'], sections[-1]['last_page'])
+    return f"""请将以下PDF文档{page_range}的分段分析结果合并为一份结构化的中间摘要，供后续生成全文总结使用：
+
+【合并要求】
+- 保留研究问题、方法、实验设置、关键结果、重要公式和图表等信息
+- 保留原有的[第X页]页码标注，确保合并后每条重要信息仍能追溯到具体页面
+- 去除重复内容，但不要遗漏任何分段中的关键信息
+- 按页面顺序组织，使用markdown格式输出
+
+【分段分析结果】
+{format_sections(sections)}"""
+
+class DocumentSummarizer:
+    """文档总结生成器 - map-reduce方式
+    
+    map：页面按固定页数分块，各分块的页面图片并发进行多图分析；
+    reduce：分块结果每 fan_in 个合并为一份中间摘要，逐级合并直到不超过 fan_in 个，再生成最终总结。
+    总耗时约为最慢分块的分析时间加上各合并层级的文本调用，每次调用的输入都有上限。
+    指定产物ID时各阶段的输出保存为检查点，失败重试或进程重启后只执行缺失的阶段；
+    分块分析结果同时按页拆分为页面笔记，供后续问答直接使用，不必再次发送页面图片。
+    """
+    
+    def __init__(self, client: AsyncQwenClient = None, chunk_pages: int = None, fan_in: int = None,
+                 max_parallel: int = None):
+        """初始化总结生成器
+        
+        Args:
+            client: 异步Qwen客户端，为空时新建
+            chunk_pages: 每个分块的页数
+            fan_in: 每次合并的分段结果数
+            max_parallel: 同时进行的分析和合并调用数
+        """
+        self.client = client or AsyncQwenClient()
+        self.chunk_pages = max(1, chunk_pages or Config.SUMMARY_CHUNK_PAGES)
+        self.fan_in = max(2, fan_in or Config.SUMMARY_REDUCE_FAN_IN)
+        self.max_parallel = max(1, max_parallel or Config.SUMMARY_MAX_PARALLEL)
+    
+    def plan_chunks(self, pages: List[Tuple[int, str]]) -> List[Dict]:
+        """按页面顺序把页面图片分块
+        
+        分块按实际页码划分，缺失的页面处断开（每个分块内的页码连续），
+        分析提示词、检查点阶段名和页面笔记中的页码都与文档一致。
+        
+        Args:
+            pages: 按页码排列的 (页码, 页面图片路径) 列表
+        
+        Returns:
+            分块列表，每个分块为 {'first_page', 'last_page', 'image_paths'}
+        """
+        chunks = []
+        for page_number, image_path in pages:
+            chunk = chunks[-1] if chunks else None
+            if (chunk is None or page_number != chunk['last_page'] + 1 or
+                    len(chunk['image_paths']) >= self.chunk_pages):
+                chunk = {'first_page': page_number, 'last_page': page_number, 'image_paths': []}
+                chunks.append(chunk)
+            chunk['last_page'] = page_number
+            chunk['image_paths'].append(image_path)
+        return chunks
+    
+    def summarize_once(self, pages: List[Tuple[int, str]], artifact_id: str,
+                       load_summary: Callable[[], Optional[str]], save_summary: Callable[[str], Any],
+                       total_pages: int = None) -> Dict:
+        """生成并保存文档总结，同一产物同一时间只生成一次
+        
+        上传后台线程和总结接口等并发的调用者等待同一次生成并共享结果；
+        其他worker进程通过锁文件排队，获得锁后先检查总结是否已由其他进程保存。
+        
+        Args:
+            pages: 按页码排列的 (页码, 页面图片路径) 列表
+            artifact_id: 产物ID
+            load_summary: 读取已保存的总结
+            save_summary: 保存生成的总结
+            total_pages: 文档总页数，为空时取最后一页的页码
+        
+        Returns:
+            同 summarize，另有 'shared'：总结是否来自其他调用
+        """
+        def generate() -> Dict:
+            existing = load_summary()
+            if existing:
+                summary_progress.finish(artifact_id)
+                return {'summary': existing, 'stages': 0, 'skipped_stages': 0, 'skipped_seconds': 0.0, 'shared': True}
+            
+            # 各阶段的部分结果发布到生成进度中，前端可在最终总结完成前逐段显示
+            summary_progress.begin(artifact_id)
+            try:
+                result = self.summarize(pages, artifact_id, total_pages)
+                save_summary(result['summary'])
+            except BaseException as e:
+                summary_progress.fail(artifact_id, str(e) or type(e).__name__)
+                raise
+            summary_progress.finish(artifact_id)
+            return dict(result, shared=False)
+        
+        result, joined = summary_flights.run(artifact_id, generate)
+        if joined or result['shared']:
+            metrics.increment('summary_single_flight_shared')
+        return dict(result, shared=joined or result['shared'])
+    
+    def summarize(self, pages: List[Tuple[int, str]], artifact_id: str = None, total_pages: int = None) -> Dict:
+        """生成文档总结（在共享事件循环中执行，供同步代码调用）
+        
+        Args:
+            pages: 按页码排列的 (页码, 页面图片路径) 列表
+            artifact_id: 产物ID，指定时启用检查点
+            total_pages: 文档总页数，为空时取最后一页的页码
+        
+        Returns:
+            {'summary': 文档总结, 'stages': 阶段总数, 'skipped_stages': 从检查点恢复的阶段数,
+             'skipped_seconds': 恢复的阶段原先的耗时}
+        """
+        return event_loop_thread.run(self.summarize_async(pages, artifact_id, total_pages))
+    
+    async def summarize_async(self, pages: List[Tuple[int, str]], artifact_id: str = None,
+                              total_pages: int = None) -> Dict:
+        """生成文档总结
+        
+        Args:
+            pages: 按页码排列的 (页码, 页面图片路径) 列表
+            artifact_id: 产物ID，指定时启用检查点
+            total_pages: 文档总页数，为空时取最后一页的页码
+        
+        Returns:
+            同 summarize
+        """
+        if not pages:
+            raise ValueError("没有可用于生成总结的页面图片")
+        
+        started_at = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.max_parallel)
+        chunks = self.plan_chunks(pages)
+        if artifact_id:
+            summary_progress.plan(artifact_id, len(chunks))
+        total_pages = total_pages or pages[-1][0]
+        checkpoint = summary_checkpoints.open(artifact_id) if artifact_id else None
+        report = {'stages': 0, 'skipped_stages': 0, 'skipped_seconds': 0.0}
+        print(f"\n=== 开始生成文档总结（{len(pages)}/{total_pages}页，{len(chunks)}个分块，每块最多{self.chunk_pages}页）===")
+        if checkpoint is not None and len(checkpoint):
+            print(f"发现 {len(checkpoint)} 个阶段的检查点，仅执行缺失的阶段")
+        
+        # 总结是后台工作，不与交互式问答争抢调用名额
+        with llm_priority(PRIORITY_BACKGROUND):
+            sections = await self._gather(
+                self._analyze_chunk(chunk, total_pages, semaphore, checkpoint, report, artifact_id) for chunk in chunks
+            )
+            map_seconds = time.perf_counter() - started_at
+            metrics.observe('summary_map', map_seconds)
+            print(f"分块分析完成，耗时 {map_seconds:.1f} 秒")
+            
+            if artifact_id:
+                page_notes = {}
+                for section in sections:
+                    page_notes.update(split_page_notes(section['text'], section['first_page'], section['last_page']))
+                save_page_notes(artifact_id, page_notes)
+            
+            level = 0
+            while len(sections) > self.fan_in:
+                level += 1
+                groups = [sections[start:start + self.fan_in] for start in range(0, len(sections), self.fan_in)]
+                sections = await self._gather(self._reduce_group(group, level, semaphore, checkpoint, report,
+                                                                 artifact_id) for group in groups)
+                print(f"第{level}级合并完成，剩余 {len(sections)} 份中间摘要")
+            
+            prompt = document_summary_prompt(format_sections(sections))
+            summary = await self._run_stage(
+                'final', self._text_hash(prompt), lambda: self._generate_text(prompt, semaphore), checkpoint, report
+            )
+        
+        total_seconds = time.perf_counter() - started_at
+        metrics.observe('summary_total', total_seconds)
+        metrics.increment('summary_stages_run', report['stages'] - report['skipped_stages'])
+        metrics.increment('summary_stages_skipped', report['skipped_stages'])
+        report['skipped_seconds'] = round(report['skipped_seconds'], 1)
+        if report['skipped_stages']:
+            print(f"从检查点恢复 {report['skipped_stages']}/{report['stages']} 个阶段，"
+                  f"省去约 {report['skipped_seconds']:.1f} 秒的大模型调用")
+        print(f"=== 文档总结生成完成，{len(chunks)}个分块，{level}级合并，总耗时 {total_seconds:.1f} 秒 ===\n")
+        return dict(report, summary=summary)
+    
+    async def _run_stage(self, stage: str, input_hash: str, produce: Callable[[], Awaitable[str]],
+                         checkpoint: Optional[SummaryCheckpoint], report: Dict) -> str:
+        """执行一个阶段：检查点中有相同输入的输出时直接复用，否则调用大模型并保存
+        
+        Args:
+            stage: 阶段名称
+            input_hash: 阶段输入的内容哈希
+            produce: 生成阶段输出的协程函数
+            checkpoint: 检查点，为空时不保存
+            report: 阶段统计，原地更新
+        
+        Returns:
+            阶段输出
+        """
+        report['stages'] += 1
+        entry = checkpoint.get(stage, input_hash) if checkpoint is not None else None
+        if entry:
+            report['skipped_stages'] += 1
+            report['skipped_seconds'] += entry.get('seconds', 0.0)
+            return entry['text']
+        
+        started_at = time.perf_counter()
+        text = await produce()
+        if checkpoint is not None:
+            checkpoint.put(stage, input_hash, text, time.perf_counter() - started_at)
+        return text
+    
+    def _text_hash(self, prompt: str) -> str:
+        """文本调用的输入哈希：模型和完整提示词"""
+        return content_hash(str(CHECKPOINT_VERSION), api_manager.get_qwen_text_model(), prompt)
+    
+    async def _generate_text(self, prompt: str, semaphore: asyncio.Semaphore) -> str:
+        """占用并发名额执行一次文本调用"""
+        async with semaphore:
+            return await self.client.generate_text(prompt)
+    
+    async def _analyze_chunk(self, chunk: Dict, total_pages: int, semaphore: asyncio.Semaphore,
+                             checkpoint: Optional[SummaryCheckpoint], report: Dict, artifact_id: str = None) -> Dict:
+        """分析一个分块的页面图片"""
+        input_hash = ''
+        if checkpoint is not None:
+            # 输入哈希：模型、页码范围和各页图片的内容（重新渲染出相同图片时仍可复用）
+            image_hashes = await asyncio.get_running_loop().run_in_executor(None, file_hashes, chunk['image_paths'])
+            input_hash = content_hash(str(CHECKPOINT_VERSION), api_manager.get_qwen_vision_model(),
+                                      f"{chunk['first_page']}-{chunk['last_page']}/{total_pages}", *image_hashes)
+        
+        async def analyze():
+            async with semaphore:
+                return await self.client.analyze_multiple_images(
+                    chunk['image_paths'],
+                    analysis_type='comprehensive',
+                    first_page=chunk['first_page'],
+                    total_pages=total_pages
+                )
+        
+        text = await self._run_stage(f"map:{chunk['first_page']}-{chunk['last_page']}", input_hash,
+                                     analyze, checkpoint, report)
+        section = {
+            'first_page': chunk['first_page'],
+            'last_page': chunk['last_page'],
+            'text': text
+        }
+        if artifact_id:
+            summary_progress.publish(artifact_id, dict(section, level=0))
+        return section
+    
+    async def _reduce_group(self, sections: List[Dict], level: int, semaphore: asyncio.Semaphore,
+                            checkpoint: Optional[SummaryCheckpoint], report: Dict, artifact_id: str = None) -> Dict:
+        """把一组相邻的分段结果合并为一份中间摘要"""
+        if len(sections) == 1:
+            return sections[0]
+        prompt = reduce_prompt(sections)
+        first_page, last_page = sections[0]['first_page'], sections[-1]['last_page']
+        text = await self._run_stage(f"reduce:{level}:{first_page}-{last_page}", self._text_hash(prompt),
+                                     lambda: self._generate_text(prompt, semaphore), checkpoint, report)
+        section = {
+            'first_page': first_page,
+            'last_page': last_page,
+            'text': text
+        }
+        if artifact_id:
+            summary_progress.publish(artifact_id, dict(section, level=level))
+        return section
+    
+    async def _gather(self, coroutines) -> List:
+        """并发执行并按顺序返回结果；任一失败时取消其余尚未完成的调用"""
+        tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+        try:
+            return list(await asyncio.gather(*tasks))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+# 文档总结的单飞协调（锁文件与检查点放在同一目录）
+summary_flights = SingleFlight(os.path.join(Config.DATA_FOLDER, 'checkpoints'), 'summary')
+
+# 全局文档总结生成器
+document_summarizer = DocumentSummarizer()
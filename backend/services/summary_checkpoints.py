@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Dict, List, Optional
+from config import Config
+
+# 检查点文件格式版本，提示词或分块方式不兼容地变更时递增
+CHECKPOINT_VERSION = 1
+
+def content_hash(*parts: str) -> str:
+    """计算若干文本片段的SHA-256（片段之间以分隔符隔开）"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+def file_hashes(paths: List[str]) -> List[str]:
+    """计算文件内容的SHA-256列表"""
+    hashes = []
+    for path in paths:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        hashes.append(digest.hexdigest())
+    return hashes
+
+class SummaryCheckpoint:
+    """一个文档的总结检查点 - 记录各阶段（分块分析、逐级合并、最终总结）的输出
+    
+    每个阶段以其输入的内容哈希（页面图片内容、提示词和模型）为键，输入不变时直接复用输出，
+    输出另存文本哈希用于校验。每完成一个阶段立即写盘，进程重启后也能从断点继续。
+    """
+    
+    def __init__(self, path: str):
+        """加载检查点文件
+        
+        Args:
+            path: 检查点文件路径
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Dict] = {}
+        
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == CHECKPOINT_VERSION:
+                    self._stages = data.get('stages', {})
+            except Exception as e:
+                print(f"读取总结检查点失败，将重新生成: {e}")
+    
+    def __len__(self) -> int:
+        return len(self._stages)
+    
+    def get(self, stage: str, input_hash: str) -> Optional[Dict]:
+        """读取阶段输出
+        
+        Args:
+            stage: 阶段名称（如 map:1-8、reduce:1:1-32、final）
+            input_hash: 阶段输入的内容哈希
+        
+        Returns:
+            输入哈希一致且输出校验通过时返回 {'text', 'seconds', ...}，否则返回None
+        """
+        with self._lock:
+            entry = self._stages.get(stage)
+        if not entry or entry.get('input_hash') != input_hash:
+            return None
+        if entry.get('output_hash') != content_hash(entry.get('text', '')):
+            print(f"总结检查点 {stage} 校验失败，将重新生成")
+            return None
+        return entry
+    
+    def put(self, stage: str, input_hash: str, text: str, seconds: float):
+        """保存阶段输出并写盘
+        
+        Args:
+            stage: 阶段名称
+            input_hash: 阶段输入的内容哈希
+            text: 阶段输出
+            seconds: 生成该输出的耗时（恢复时用于统计节省的时间）
+        """
+        with self._lock:
+            self._stages[stage] = {
+                'input_hash': input_hash,
+                'output_hash': content_hash(text),
+                'text': text,
+                'seconds': round(seconds, 3),
+                'created_at': time.time()
+            }
+            self._write()
+    
+    def _write(self):
+        """原子写入检查点文件（调用方持有锁）"""
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temp_path = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': CHECKPOINT_VERSION, 'stages': self._stages}, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            print(f"保存总结检查点失败: {e}")
+
+class SummaryCheckpointStore:
+    """总结检查点目录 - 每个产物一个子目录，随产物的页面图片等一起删除"""
+    
+    def __init__(self, root_dir: str):
+        """初始化检查点目录
+        
+        Args:
+            root_dir: 检查点根目录
+        """
+        self.root_dir = root_dir
+    
+    def _path(self, artifact_id: str) -> str:
+        return os.path.join(self.root_dir, artifact_id, 'summary.json')
+    
+    def open(self, artifact_id: str) -> SummaryCheckpoint:
+        """打开产物的总结检查点（不存在时为空）"""
+        return SummaryCheckpoint(self._path(artifact_id))
+
+# 全局总结检查点目录
+summary_checkpoints = SummaryCheckpointStore(os.path.join(Config.DATA_FOLDER, 'checkpoints'))
@@ -0,0 +1,91 @@
+import time
+import threading
+from typing import Dict
+
+class SummaryProgress:
+    """文档总结的生成进度 - 记录已完成的分块分析和中间摘要，供前端按游标增量获取
+    
+    每个产物一条记录：生成开始时创建，各阶段完成时追加部分结果，
+    总结保存后删除（之后直接返回保存的总结），失败时保留错误信息。
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict] = {}
+    
+    def begin(self, key: str):
+        """开始一次新的生成（清空之前的部分结果和错误）
+        
+        Args:
+            key: 产物ID
+        """
+        with self._lock:
+            self._entries[key] = {
+                'status': 'running',
+                'parts': [],
+                'total_chunks': None,
+                'error': None,
+                'started_at': time.time()
+            }
+    
+    def plan(self, key: str, total_chunks: int):
+        """记录分块数（前端据此显示进度）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                entry['total_chunks'] = total_chunks
+    
+    def publish(self, key: str, part: Dict):
+        """追加一份部分结果
+        
+        Args:
+            key: 产物ID
+            part: {'level': 0为分块分析、n为第n级合并, 'first_page', 'last_page', 'text'}
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry['status'] == 'running':
+                entry['parts'].append(part)
+    
+    def finish(self, key: str):
+        """总结已保存，删除进度记录"""
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def fail(self, key: str, error: str):
+        """记录生成失败"""
+        with self._lock:
+            entry = self._entries.setdefault(key, {'parts': [], 'total_chunks': None, 'started_at': time.time()})
+            entry['status'] = 'failed'
+            entry['error'] = error
+    
+    def get(self, key: str, cursor: int = 0) -> Dict:
+        """获取游标之后的部分结果
+        
+        Args:
+            key: 产物ID
+            cursor: 客户端已收到的部分结果数
+        
+        Returns:
+            {'status': idle/running/failed, 'parts': 新增的部分结果, 'cursor': 新的游标,
+             'total_chunks', 'error', 'reset': 游标超出范围（生成已重新开始），客户端应丢弃已收到的结果}
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return {'status': 'idle', 'parts': [], 'cursor': cursor, 'total_chunks': None,
+                        'error': None, 'reset': False}
+            
+            reset = cursor > len(entry['parts'])
+            start = 0 if reset else max(0, cursor)
+            return {
+                'status': entry['status'],
+                'parts': entry['parts'][start:],
+                'cursor': len(entry['parts']),
+                'total_chunks': entry['total_chunks'],
+                'error': entry['error'],
+                'reset': reset
+            }
+
+# 全局总结进度
+summary_progress = SummaryProgress()
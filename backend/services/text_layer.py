@@ -0,0 +1,86 @@
+import re
+import html
+import subprocess
+from typing import Dict
+
+# pdftotext -bbox-layout 输出中的元素
+_PAGE_PATTERN = re.compile(r'<page\s+width="([\d.]+)"\s+height="([\d.]+)">(.*?)</page>', re.S)
+_BLOCK_PATTERN = re.compile(r'<block\b[^>]*>(.*?)</block>', re.S)
+_LINE_PATTERN = re.compile(r'<line\b[^>]*>(.*?)</line>', re.S)
+_WORD_PATTERN = re.compile(
+    r'<word\s+xMin="([\d.]+)"\s+yMin="([\d.]+)"\s+xMax="([\d.]+)"\s+yMax="([\d.]+)">(.*?)</word>', re.S
+)
+
+# 中日韩字符之间不加空格
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+
+def extract_text_layer(pdf_path: str, timeout: int = 120) -> Dict[int, Dict]:
+    """使用poppler的pdftotext提取每页文字层和单词坐标
+    
+    Args:
+        pdf_path: PDF文件路径
+        timeout: pdftotext超时时间（秒）
+    
+    Returns:
+        页码到页面文字信息的映射：{'width', 'height', 'text', 'words'}，
+        words为 [xMin, yMin, xMax, yMax, 单词] 列表（单位：点）。
+        pdftotext不可用或失败时返回空字典
+    """
+    try:
+        completed = subprocess.run(
+            ['pdftotext', '-bbox-layout', '-enc', 'UTF-8', pdf_path, '-'],
+            capture_output=True, timeout=timeout, check=True
+        )
+    except FileNotFoundError:
+        print("未找到pdftotext（poppler-utils），跳过文字层提取")
+        return {}
+    except Exception as e:
+        print(f"提取文字层失败: {e}")
+        return {}
+    
+    return parse_bbox_layout(completed.stdout.decode('utf-8', errors='replace'))
+
+def parse_bbox_layout(bbox_html: str) -> Dict[int, Dict]:
+    """解析 pdftotext -bbox-layout 的输出
+    
+    Args:
+        bbox_html: pdftotext输出的XHTML
+    
+    Returns:
+        页码到页面文字信息的映射
+    """
+    pages = {}
+    for page_number, page_match in enumerate(_PAGE_PATTERN.finditer(bbox_html), start=1):
+        words = []
+        blocks = []
+        for block_match in _BLOCK_PATTERN.finditer(page_match.group(3)):
+            lines = []
+            for line_match in _LINE_PATTERN.finditer(block_match.group(1)):
+                line_words = []
+                for word_match in _WORD_PATTERN.finditer(line_match.group(1)):
+                    word = html.unescape(word_match.group(5))
+                    words.append([round(float(word_match.group(i)), 2) for i in range(1, 5)] + [word])
+                    line_words.append(word)
+                if line_words:
+                    lines.append(_join_words(line_words))
+            if lines:
+                blocks.append('\n'.join(lines))
+        
+        pages[page_number] = {
+            'width': float(page_match.group(1)),
+            'height': float(page_match.group(2)),
+            'text': '\n\n'.join(blocks),
+            'words': words
+        }
+    
+    return pages
+
+def _join_words(words: list) -> str:
+    """拼接一行中的单词，中文等字符之间不插入空格"""
+    line = words[0]
+    for word in words[1:]:
+        if _CJK_PATTERN.match(line[-1]) and _CJK_PATTERN.match(word[0]):
+            line += word
+        else:
+            line += ' ' + word
+    return line
@@ -29,7 +29,39 @@ class APIManager:
             'ocr_model': os.environ.get('QWEN_OCR_MODEL', 'qwen-vl-ocr'),      # 最优文字提取模型
             'text_model': os.environ.get('QWEN_TEXT_MODEL', 'qwen-max'),       # 最优文本理解模型
             'timeout': int(os.environ.get('QWEN_TIMEOUT', '300')),  # 增加到5分钟
-            'max_retries': int(os.environ.get('QWEN_MAX_RETRIES', '3'))
+            'max_retries': int(os.environ.get('QWEN_MAX_RETRIES', '3')),
+            'max_concurrency': int(os.environ.get('QWEN_MAX_CONCURRENCY', '4')),  # 异步客户端的最大并发调用数
+            # 多图请求的token预算（超出时按页面顺序分批并发分析）
+            'image_token_budget': int(os.environ.get('QWEN_IMAGE_TOKEN_BUDGET', '24000')),  # 单次请求的输入token预算
+            'image_min_pixels': int(os.environ.get('QWEN_IMAGE_MIN_PIXELS', str(4 * 28 * 28))),
+            'image_max_pixels': int(os.environ.get('QWEN_IMAGE_MAX_PIXELS', str(1280 * 28 * 28))),  # 模型缩放上限，单图最多约1280个token
+            # 重试配置（限流、5xx和网络错误按指数退避重试）
+            'retry_backoff_base': float(os.environ.get('QWEN_RETRY_BACKOFF_BASE', '1')),     # 首次退避上限（秒）
+            'retry_backoff_max': float(os.environ.get('QWEN_RETRY_BACKOFF_MAX', '30')),      # 单次退避上限（秒）
+            'retry_after_max': float(os.environ.get('QWEN_RETRY_AFTER_MAX', '120')),         # 超过该值的Retry-After不再等待
+            'retry_budget_ratio': float(os.environ.get('QWEN_RETRY_BUDGET_RATIO', '0.2')),   # 重试占请求量的最大比例
+            'retry_budget_min': int(os.environ.get('QWEN_RETRY_BUDGET_MIN', '10')),          # 低流量时的保底重试次数
+            # HTTP连接池配置（所有QwenClient共享长连接，避免每次调用重新握手）
+            'pool_connections': int(os.environ.get('QWEN_POOL_CONNECTIONS', '4')),  # 缓存的主机连接池数量
+            'pool_size': int(os.environ.get('QWEN_POOL_SIZE', '10')),               # 每个主机的最大连接数
+            'pool_block': os.environ.get('QWEN_POOL_BLOCK', 'False').lower() == 'true',  # 连接用尽时是否等待
+            'keepalive': os.environ.get('QWEN_KEEPALIVE', 'True').lower() == 'true',
+            'keepalive_idle': int(os.environ.get('QWEN_KEEPALIVE_IDLE', '60')),     # TCP keep-alive探测间隔（秒）
+            'connect_timeout': float(os.environ.get('QWEN_CONNECT_TIMEOUT', '10')),
+            'read_timeout': float(os.environ.get('QWEN_READ_TIMEOUT', os.environ.get('QWEN_TIMEOUT', '300'))),
+            # 响应缓存配置（相同请求直接返回已缓存的结果）
+            'cache_call_types': os.environ.get('QWEN_CACHE_CALL_TYPES',
+                                               'figure_detection,figure_review,image_analysis,summary,answer'),
+            'cache_ttl': int(os.environ.get('QWEN_CACHE_TTL', str(7 * 24 * 3600))),  # 有效期（秒）
+            'cache_max_mb': int(os.environ.get('QWEN_CACHE_MAX_MB', '200')),         # 0表示禁用
+            # 限流配置（同一台机器上的所有worker进程共享配额，应与账号的限额一致）
+            'rate_limit_rpm': int(os.environ.get('QWEN_RATE_LIMIT_RPM', '600')),        # 每分钟请求数，0表示不限制
+            'rate_limit_tpm': int(os.environ.get('QWEN_RATE_LIMIT_TPM', '1000000')),    # 每分钟token数，0表示不限制
+            # 优先级调度配置（交互式问答 > Figure检测 > 后台总结，各优先级另有并发上限）
+            'scheduler_slots': int(os.environ.get('QWEN_SCHEDULER_SLOTS', '10')),                # 同时进行的调用总数
+            'scheduler_cap_interactive': int(os.environ.get('QWEN_SCHEDULER_CAP_INTERACTIVE', '10')),
+            'scheduler_cap_figure': int(os.environ.get('QWEN_SCHEDULER_CAP_FIGURE', '4')),
+            'scheduler_cap_background': int(os.environ.get('QWEN_SCHEDULER_CAP_BACKGROUND', '4'))
         }
         
         # 其他API配置（预留扩展）
@@ -110,6 +142,11 @@ class APIManager:
                 'text_model': self.qwen_config['text_model'],
                 'timeout': self.qwen_config['timeout'],
                 'max_retries': self.qwen_config['max_retries'],
+                'max_concurrency': self.qwen_config['max_concurrency'],
+                'pool_size': self.qwen_config['pool_size'],
+                'keepalive': self.qwen_config['keepalive'],
+                'connect_timeout': self.qwen_config['connect_timeout'],
+                'read_timeout': self.qwen_config['read_timeout'],
                 'is_valid': self.validate_qwen_config()
             }
         }
@@ -126,6 +163,10 @@ QWEN_OCR_MODEL=qwen-vl-ocr-latest
 QWEN_TEXT_MODEL=qwen-max-latest
 QWEN_TIMEOUT=60
 QWEN_MAX_RETRIES=3
+QWEN_POOL_SIZE=10
+QWEN_KEEPALIVE=True
+QWEN_CONNECT_TIMEOUT=10
+QWEN_READ_TIMEOUT=60
 
 # 应用配置
 FLASK_ENV=development
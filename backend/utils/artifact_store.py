@@ -0,0 +1,180 @@
+import os
+import json
+import shutil
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from config import Config
+from backend.utils.file_lock import locked_file
+
+class ArtifactRegistryError(Exception):
+    """产物登记表损坏或无法读取（此时不能判断共享文件是否仍被引用）"""
+
+class ArtifactStore:
+    """文档产物登记表 - 按PDF内容哈希共享渲染页面、总结和Figure截图
+    
+    每个产物记录引用它的文档ID集合，最后一个文档释放后才删除共享文件。
+    登记表的读取-修改-写入在锁文件内进行，多个worker进程同时修改时不会丢失引用。
+    """
+    
+    def __init__(self):
+        self.artifacts_dir = os.path.join(Config.DATA_FOLDER, 'artifacts')
+        self.registry_path = os.path.join(self.artifacts_dir, 'registry.json')
+        self.lock_path = os.path.join(self.artifacts_dir, 'registry.lock')
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def _locked(self):
+        """同时持有线程锁和登记表的锁文件（跨worker进程互斥）"""
+        with self._lock, locked_file(self.lock_path):
+            yield
+    
+    def _load(self) -> Dict[str, Dict]:
+        """读取登记表（artifact_id -> 产物记录）
+        
+        只有登记表文件不存在时才视为空表；文件损坏时不能当作空表覆盖写回，
+        否则所有引用计数丢失，释放时会删除其他文档仍在使用的共享文件。
+        
+        Raises:
+            ArtifactRegistryError: 登记表存在但无法读取或解析
+        """
+        if not os.path.exists(self.registry_path):
+            return {}
+        try:
+            with open(self.registry_path, 'r', encoding='utf-8') as f:
+                registry = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"读取产物登记表失败: {e}")
+            raise ArtifactRegistryError(f"产物登记表无法读取: {e}") from e
+        if not isinstance(registry, dict):
+            raise ArtifactRegistryError("产物登记表格式错误")
+        return registry
+    
+    def _save(self, registry: Dict[str, Dict]):
+        """原子写入登记表"""
+        os.makedirs(self.artifacts_dir, exist_ok=True)
+        temp_path = f'{self.registry_path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(registry, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.registry_path)
+    
+    def reset(self):
+        """清空登记表（启动清理历史数据时调用）"""
+        with self._lock:
+            if os.path.exists(self.artifacts_dir):
+                shutil.rmtree(self.artifacts_dir, ignore_errors=True)
+    
+    def register(self, artifact_id: str, content_hash: str, document_id: str, record: Dict) -> None:
+        """登记新处理完成的产物
+        
+        Args:
+            artifact_id: 产物ID（首个文档的ID）
+            content_hash: PDF内容的SHA-256
+            document_id: 引用该产物的文档ID
+            record: 产物信息（pdf_path、total_pages、pages等）
+        """
+        with self._locked():
+            registry = self._load()
+            registry[artifact_id] = {
+                **record,
+                'content_hash': content_hash,
+                'documents': [document_id],
+                'created_at': datetime.now().isoformat()
+            }
+            self._save(registry)
+    
+    def acquire_by_hash(self, content_hash: str, document_id: str) -> Optional[Dict]:
+        """按内容哈希查找产物并增加引用
+        
+        Args:
+            content_hash: PDF内容的SHA-256
+            document_id: 新文档ID
+        
+        Returns:
+            产物记录（包含artifact_id），未找到时返回None
+        """
+        with self._locked():
+            registry = self._load()
+            for artifact_id, record in registry.items():
+                if record.get('content_hash') != content_hash:
+                    continue
+                if not os.path.exists(record.get('pdf_path', '')):
+                    continue
+                
+                if document_id not in record['documents']:
+                    record['documents'].append(document_id)
+                    self._save(registry)
+                return {**record, 'artifact_id': artifact_id}
+        return None
+    
+    def update_summary(self, artifact_id: str, summary: str) -> List[str]:
+        """记录产物的文档总结
+        
+        Args:
+            artifact_id: 产物ID
+            summary: 总结内容
+        
+        Returns:
+            引用该产物的所有文档ID
+        """
+        with self._locked():
+            registry = self._load()
+            record = registry.get(artifact_id)
+            if not record:
+                return []
+            
+            record['summary'] = summary
+            self._save(registry)
+            return list(record['documents'])
+    
+    def release(self, artifact_id: str, document_id: str, pdf_path: str = None) -> bool:
+        """释放文档对产物的引用，没有引用时删除共享文件
+        
+        未登记的产物（如处理失败的文档）视为独占，直接删除；
+        登记表无法读取时抛出异常，不删除任何文件。
+        
+        Args:
+            artifact_id: 产物ID
+            document_id: 文档ID
+            pdf_path: 原始PDF路径（未登记时使用）
+        
+        Returns:
+            共享文件是否已被删除
+        
+        Raises:
+            ArtifactRegistryError: 登记表无法读取
+        """
+        with self._locked():
+            registry = self._load()
+            record = registry.get(artifact_id)
+            
+            if record:
+                if document_id in record['documents']:
+                    record['documents'].remove(document_id)
+                if record['documents']:
+                    self._save(registry)
+                    print(f"产物 {artifact_id} 仍被 {len(record['documents'])} 个文档引用，保留共享文件")
+                    return False
+                
+                pdf_path = record.get('pdf_path')
+                del registry[artifact_id]
+                self._save(registry)
+            
+            self._delete_files(artifact_id, pdf_path)
+            return True
+    
+    def _delete_files(self, artifact_id: str, pdf_path: str = None):
+        """删除产物的所有文件"""
+        if pdf_path and os.path.exists(pdf_path):
+            os.remove(pdf_path)
+            print(f"已删除原始文件: {pdf_path}")
+        
+        for subdir in ('images', 'figures', 'text', 'checkpoints'):
+            artifact_dir = os.path.join(Config.DATA_FOLDER, subdir, artifact_id)
+            if os.path.exists(artifact_dir):
+                shutil.rmtree(artifact_dir)
+                print(f"已删除{subdir}目录: {artifact_dir}")
+
+# 全局产物登记表实例
+artifact_store = ArtifactStore()
@@ -0,0 +1,165 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+class CancelledError(BaseException):
+    """任务已被取消
+    
+    继承BaseException，避免被各处的 except Exception 吞掉而继续执行后续步骤。
+    """
+
+class CancellationToken:
+    """取消令牌 - 长时间运行的任务在页面之间、调用大模型之前检查"""
+    
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks: List[Callable] = []
+        self._lock = threading.Lock()
+        self.reason = None
+    
+    @property
+    def cancelled(self) -> bool:
+        """是否已取消"""
+        return self._event.is_set()
+    
+    def cancel(self, reason: str = '任务已取消'):
+        """取消任务
+        
+        Args:
+            reason: 取消原因
+        """
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks = list(self._callbacks)
+        
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"执行取消回调失败: {e}")
+    
+    def on_cancel(self, callback: Callable):
+        """注册取消时执行的回调（已取消时立即执行）"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+    
+    def raise_if_cancelled(self):
+        """已取消时抛出CancelledError"""
+        if self._event.is_set():
+            raise CancelledError(self.reason)
+    
+    def wait(self, timeout: float) -> bool:
+        """等待指定时间，期间被取消则提前返回
+        
+        Returns:
+            是否已取消
+        """
+        return self._event.wait(timeout)
+
+# 当前上下文（线程）中正在执行的任务的取消令牌
+_current_token: contextvars.ContextVar = contextvars.ContextVar('cancellation_token', default=None)
+
+def get_current_token() -> Optional[CancellationToken]:
+    """获取当前上下文的取消令牌"""
+    return _current_token.get()
+
+def check_cancelled():
+    """检查当前任务是否已取消，已取消时抛出CancelledError"""
+    token = _current_token.get()
+    if token is not None:
+        token.raise_if_cancelled()
+
+def sleep_cancellable(seconds: float):
+    """可被取消的等待（如重试退避），取消时抛出CancelledError"""
+    token = _current_token.get()
+    if token is None:
+        time.sleep(seconds)
+        return
+    if token.wait(seconds):
+        token.raise_if_cancelled()
+
+@contextmanager
+def use_token(token: CancellationToken):
+    """在当前上下文中使用指定的取消令牌"""
+    reset_token = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset_token)
+
+class CancellationRegistry:
+    """取消令牌登记表 - 按任务ID或文档ID取消进行中的工作"""
+    
+    def __init__(self):
+        self._tokens: Dict[str, List[CancellationToken]] = {}
+        self._lock = threading.Lock()
+    
+    def register(self, key: str, token: CancellationToken):
+        """登记令牌
+        
+        Args:
+            key: 任务ID或文档ID
+            token: 取消令牌
+        """
+        with self._lock:
+            self._tokens.setdefault(key, []).append(token)
+    
+    def unregister(self, key: str, token: CancellationToken):
+        """移除令牌"""
+        with self._lock:
+            tokens = self._tokens.get(key, [])
+            if token in tokens:
+                tokens.remove(token)
+            if not tokens:
+                self._tokens.pop(key, None)
+    
+    def cancel(self, key: str, reason: str = '任务已取消') -> int:
+        """取消指定键下的所有工作
+        
+        Args:
+            key: 任务ID或文档ID
+            reason: 取消原因
+        
+        Returns:
+            被取消的令牌数
+        """
+        with self._lock:
+            tokens = [token for token in self._tokens.get(key, []) if not token.cancelled]
+        
+        for token in tokens:
+            token.cancel(reason)
+        if tokens:
+            print(f"已取消 {key} 的 {len(tokens)} 个进行中任务: {reason}")
+        return len(tokens)
+    
+    def is_active(self, key: str) -> bool:
+        """是否有进行中的工作"""
+        with self._lock:
+            return any(not token.cancelled for token in self._tokens.get(key, []))
+
+@contextmanager
+def cancellable(key: str, token: CancellationToken = None):
+    """登记一个可按键取消的工作，并在当前上下文中使用其令牌
+    
+    Args:
+        key: 任务ID或文档ID
+        token: 已有的令牌，为空时新建
+    """
+    token = token or CancellationToken()
+    cancellation_registry.register(key, token)
+    try:
+        with use_token(token):
+            yield token
+    finally:
+        cancellation_registry.unregister(key, token)
+
+# 全局取消令牌登记表
+cancellation_registry = CancellationRegistry()
@@ -0,0 +1,68 @@
+import asyncio
+import threading
+import contextvars
+import concurrent.futures
+from typing import Any, Coroutine
+
+class EventLoopThread:
+    """共享事件循环线程 - 让同步的Flask路由也能驱动协程
+    
+    协程在调用方的上下文副本中执行，取消令牌等上下文变量会随之传递。
+    """
+    
+    def __init__(self, name: str = 'asyncio-loop'):
+        self.name = name
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+    
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        """首次使用时启动事件循环线程"""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name=self.name, daemon=True)
+                self._thread.start()
+            return self._loop
+    
+    def run(self, coroutine: Coroutine, timeout: float = None) -> Any:
+        """在事件循环线程中执行协程并等待结果
+        
+        Args:
+            coroutine: 协程对象
+            timeout: 超时时间（秒）
+        
+        Returns:
+            协程的返回值
+        """
+        loop = self._ensure_started()
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("不能在事件循环线程中同步等待协程")
+        
+        result = concurrent.futures.Future()
+        tasks = []
+        
+        def on_done(task: asyncio.Task):
+            if task.cancelled():
+                result.cancel()
+            elif task.exception() is not None:
+                result.set_exception(task.exception())
+            else:
+                result.set_result(task.result())
+        
+        def start():
+            # 在调用方上下文中创建任务，任务会复制该上下文
+            task = loop.create_task(coroutine)
+            task.add_done_callback(on_done)
+            tasks.append(task)
+        
+        loop.call_soon_threadsafe(start, context=contextvars.copy_context())
+        try:
+            return result.result(timeout)
+        except concurrent.futures.TimeoutError:
+            if tasks:
+                loop.call_soon_threadsafe(tasks[0].cancel)
+            raise
+
+# 全局事件循环线程
+event_loop_thread = EventLoopThread()
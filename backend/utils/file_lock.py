@@ -0,0 +1,48 @@
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# 阻塞等待文件锁时的轮询间隔（秒）
+LOCK_POLL_INTERVAL = 0.02
+
+def try_lock_file(file) -> bool:
+    """尝试以非阻塞方式锁定文件（进程退出时由操作系统自动释放）"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+def unlock_file(file):
+    """释放文件锁"""
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+    else:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+@contextmanager
+def locked_file(lock_path: str):
+    """持有锁文件执行一段短小的临界区（跨worker进程互斥，其他进程持有时等待）
+    
+    Args:
+        lock_path: 锁文件路径，不存在时创建
+    """
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, 'a+b') as lock_file:
+        while not try_lock_file(lock_file):
+            time.sleep(LOCK_POLL_INTERVAL)
+        try:
+            yield
+        finally:
+            unlock_file(lock_file)
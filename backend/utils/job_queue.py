@@ -0,0 +1,404 @@
+import os
+import json
+import math
+import time
+import heapq
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from backend.utils.cancellation import CancellationToken, CancelledError, cancellation_registry, use_token
+from backend.utils.file_lock import try_lock_file, unlock_file
+
+# 任务优先级（数值越小越先执行）
+JOB_PRIORITIES = {
+    'high': 0,
+    'normal': 1,
+    'low': 2
+}
+
+class QueueFullError(Exception):
+    """任务队列已满"""
+    
+    def __init__(self, retry_after: int):
+        super().__init__(f"任务队列已满，请在{retry_after}秒后重试")
+        self.retry_after = retry_after
+
+def load_journal(journal_dir: str) -> List[Dict]:
+    """读取任务日志中尚未完成的任务
+    
+    Args:
+        journal_dir: 任务日志目录
+    
+    Returns:
+        任务记录列表，按提交顺序排列
+    """
+    jobs = []
+    if not os.path.exists(journal_dir):
+        return jobs
+    
+    for filename in os.listdir(journal_dir):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(journal_dir, filename), 'r', encoding='utf-8') as f:
+                jobs.append(json.load(f))
+        except Exception as e:
+            print(f"读取任务日志 {filename} 失败: {e}")
+    
+    jobs.sort(key=lambda job: job.get('seq', 0))
+    return jobs
+
+class JobQueue:
+    """有界任务队列 - 固定数量的工作线程按FIFO或优先级顺序执行任务
+    
+    每个任务在执行完成前都记录在日志目录中，服务重启后重新入队。
+    提交或恢复任务的进程在任务完成前一直持有该任务的锁文件，多个worker进程共用日志目录时，
+    只重放持有者已退出的任务，每个任务只由一个进程执行。
+    每个任务持有一个以任务ID登记的取消令牌：排队中的任务取消后直接出队，
+    执行中的任务在下一个检查点抛出CancelledError。
+    """
+    
+    def __init__(self, name: str, handler: Callable, workers: int = 2, max_depth: int = 20,
+                 policy: str = 'fifo', journal_dir: str = None, default_retry_after: int = 30,
+                 cancel_handler: Callable = None):
+        """初始化任务队列
+        
+        Args:
+            name: 队列名称
+            handler: 任务处理函数，以任务参数作为关键字参数调用
+            cancel_handler: 排队中的任务被取消时的清理函数（参数同handler，另加reason）
+            workers: 工作线程数
+            max_depth: 最大排队任务数（不含执行中的任务）
+            policy: 排序策略，fifo 或 priority
+            journal_dir: 任务日志目录，为空时不持久化
+            default_retry_after: 没有历史耗时数据时建议的重试等待秒数
+        """
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_depth = max_depth
+        self.policy = policy
+        self.journal_dir = journal_dir
+        self.default_retry_after = default_retry_after
+        self.cancel_handler = cancel_handler
+        
+        self._heap = []  # (优先级, 序号, 任务ID)
+        self._jobs: Dict[str, Dict] = {}  # 任务ID -> 任务记录
+        self._done_events: Dict[str, threading.Event] = {}
+        self._tokens: Dict[str, CancellationToken] = {}
+        self._claims: Dict[str, object] = {}  # 任务ID -> 持有锁的锁文件
+        self._running = set()
+        self._seq = 0
+        self._avg_job_seconds = None
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._cancelled = 0
+        self._condition = threading.Condition()
+        self._lock_claims = threading.Lock()
+        self._threads = []
+    
+    def start(self):
+        """重放任务日志并启动工作线程"""
+        with self._condition:
+            if self._threads:
+                return
+            
+            if self.journal_dir:
+                os.makedirs(self.journal_dir, exist_ok=True)
+                for job in load_journal(self.journal_dir):
+                    self._seq = max(self._seq, job.get('seq', 0))
+                    # 其他存活的进程持有锁的任务由该进程执行
+                    if not self._claim(job['id']):
+                        continue
+                    # 取得锁前持有者可能刚好完成并删除了日志
+                    if not os.path.exists(self._journal_path(job['id'])):
+                        self._release_claim(job['id'])
+                        continue
+                    self._enqueue(job)
+                if self._jobs:
+                    print(f"任务队列 {self.name} 从日志恢复了 {len(self._jobs)} 个未完成任务")
+            
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop, name=f'{self.name}-worker-{index + 1}',
+                                          daemon=True)
+                thread.start()
+                self._threads.append(thread)
+    
+    def submit(self, job_id: str, payload: Dict, priority: int = JOB_PRIORITIES['normal']) -> int:
+        """提交任务
+        
+        Args:
+            job_id: 任务ID
+            payload: 任务参数（需可JSON序列化）
+            priority: 优先级，仅在priority策略下生效
+        
+        Returns:
+            排队位置（从1开始）
+        
+        Raises:
+            QueueFullError: 队列已满
+        """
+        with self._condition:
+            if len(self._heap) >= self.max_depth:
+                self._rejected += 1
+                raise QueueFullError(self._estimate_retry_after())
+            
+            self._seq += 1
+            job = {
+                'id': job_id,
+                'payload': payload,
+                'priority': priority,
+                'seq': self._seq,
+                'status': 'queued',
+                'submitted_at': datetime.now().isoformat()
+            }
+            self._claim(job_id)  # 先持有锁再写日志，其他进程重放时不会执行该任务
+            self._write_journal(job)
+            self._enqueue(job)
+            self._condition.notify()
+            return self._get_position_locked(job_id)
+    
+    def check_capacity(self):
+        """检查队列是否还能接收任务（用于在保存上传文件前提前拒绝）
+        
+        Raises:
+            QueueFullError: 队列已满
+        """
+        with self._condition:
+            if len(self._heap) >= self.max_depth:
+                self._rejected += 1
+                raise QueueFullError(self._estimate_retry_after())
+    
+    def get_position(self, job_id: str) -> Optional[int]:
+        """获取任务的排队位置
+        
+        Args:
+            job_id: 任务ID
+        
+        Returns:
+            排队位置（从1开始），执行中返回0，未知任务返回None
+        """
+        with self._condition:
+            return self._get_position_locked(job_id)
+    
+    def cancel(self, job_id: str, reason: str = '任务已取消') -> bool:
+        """取消任务
+        
+        Args:
+            job_id: 任务ID
+            reason: 取消原因
+            
+        Returns:
+            是否找到该任务
+        """
+        with self._condition:
+            token = self._tokens.get(job_id)
+        if token is None:
+            return False
+        token.cancel(reason)
+        return True
+    
+    def wait(self, job_id: str, timeout: float = None) -> bool:
+        """等待任务执行完成
+        
+        Args:
+            job_id: 任务ID
+            timeout: 超时时间（秒）
+        
+        Returns:
+            任务是否已完成
+        """
+        with self._condition:
+            done_event = self._done_events.get(job_id)
+        if done_event is None:
+            return True
+        return done_event.wait(timeout)
+    
+    def get_stats(self) -> Dict:
+        """获取队列状态信息"""
+        with self._condition:
+            return {
+                'name': self.name,
+                'policy': self.policy,
+                'workers': self.workers,
+                'max_depth': self.max_depth,
+                'queued': len(self._heap),
+                'running': len(self._running),
+                'completed': self._completed,
+                'failed': self._failed,
+                'rejected': self._rejected,
+                'cancelled': self._cancelled,
+                'avg_job_seconds': round(self._avg_job_seconds, 2) if self._avg_job_seconds else None
+            }
+    
+    def _enqueue(self, job: Dict):
+        """加入内存队列（调用方持有锁）"""
+        priority = job.get('priority', JOB_PRIORITIES['normal']) if self.policy == 'priority' else 0
+        job['status'] = 'queued'
+        self._jobs[job['id']] = job
+        self._done_events[job['id']] = threading.Event()
+        heapq.heappush(self._heap, (priority, job['seq'], job['id']))
+        
+        token = CancellationToken()
+        self._tokens[job['id']] = token
+        cancellation_registry.register(job['id'], token)
+        token.on_cancel(lambda: self._drop_queued(job['id']))
+    
+    def _drop_queued(self, job_id: str):
+        """移除已取消的排队任务（执行中的任务由检查点处理）"""
+        with self._condition:
+            if job_id in self._running or job_id not in self._jobs:
+                return
+            self._heap = [entry for entry in self._heap if entry[2] != job_id]
+            heapq.heapify(self._heap)
+            job = self._jobs.pop(job_id)
+            done_event = self._done_events.pop(job_id, None)
+            token = self._tokens.pop(job_id, None)
+            self._cancelled += 1
+        
+        cancellation_registry.unregister(job_id, token)
+        self._remove_journal(job_id)
+        self._release_claim(job_id)
+        print(f"排队中的任务 {job_id} 已取消")
+        if self.cancel_handler:
+            try:
+                self.cancel_handler(**job['payload'], reason=token.reason)
+            except Exception as e:
+                print(f"清理已取消任务 {job_id} 失败: {e}")
+        if done_event:
+            done_event.set()
+    
+    def _get_position_locked(self, job_id: str) -> Optional[int]:
+        """获取排队位置（调用方持有锁）"""
+        if job_id in self._running:
+            return 0
+        if job_id not in self._jobs:
+            return None
+        for position, (_, _, queued_id) in enumerate(sorted(self._heap), start=1):
+            if queued_id == job_id:
+                return position
+        return None
+    
+    def _estimate_retry_after(self) -> int:
+        """按平均任务耗时估计等待时间（调用方持有锁）"""
+        if not self._avg_job_seconds:
+            return self.default_retry_after
+        pending_jobs = len(self._heap) + len(self._running)
+        return max(1, math.ceil(self._avg_job_seconds * pending_jobs / self.workers))
+    
+    def _worker_loop(self):
+        """工作线程：按顺序取出任务执行"""
+        while True:
+            with self._condition:
+                while not self._heap:
+                    self._condition.wait()
+                _, _, job_id = heapq.heappop(self._heap)
+                job = self._jobs[job_id]
+                job['status'] = 'running'
+                token = self._tokens[job_id]
+                self._running.add(job_id)
+            self._write_journal(job)
+            
+            started_at = time.perf_counter()
+            outcome = 'completed'
+            try:
+                # 处理函数及其发起的大模型调用通过上下文获取取消令牌
+                with use_token(token):
+                    token.raise_if_cancelled()
+                    self.handler(**job['payload'])
+            except CancelledError:
+                outcome = 'cancelled'
+                print(f"任务 {job_id} 已取消: {token.reason}")
+            except Exception as e:
+                outcome = 'failed'
+                print(f"任务 {job_id} 执行失败: {e}")
+            elapsed = time.perf_counter() - started_at
+            
+            self._remove_journal(job_id)
+            self._release_claim(job_id)
+            cancellation_registry.unregister(job_id, token)
+            with self._condition:
+                self._running.discard(job_id)
+                self._jobs.pop(job_id, None)
+                self._tokens.pop(job_id, None)
+                done_event = self._done_events.pop(job_id, None)
+                if outcome == 'completed':
+                    self._completed += 1
+                elif outcome == 'cancelled':
+                    self._cancelled += 1
+                else:
+                    self._failed += 1
+                # 指数滑动平均，用于估计Retry-After
+                if self._avg_job_seconds is None:
+                    self._avg_job_seconds = elapsed
+                else:
+                    self._avg_job_seconds = 0.8 * self._avg_job_seconds + 0.2 * elapsed
+            if done_event:
+                done_event.set()
+    
+    def _journal_path(self, job_id: str) -> str:
+        """任务日志路径"""
+        return os.path.join(self.journal_dir, f'{job_id}.json')
+    
+    def _claim(self, job_id: str) -> bool:
+        """持有任务的锁文件直到任务完成（进程退出时由操作系统释放）
+        
+        Args:
+            job_id: 任务ID
+        
+        Returns:
+            是否取得锁（失败表示任务由其他存活的进程执行）
+        """
+        if not self.journal_dir:
+            return True
+        try:
+            lock_file = open(os.path.join(self.journal_dir, f'{job_id}.lock'), 'a+b')
+        except OSError as e:
+            print(f"打开任务锁文件失败: {e}")
+            return False
+        if not try_lock_file(lock_file):
+            lock_file.close()
+            return False
+        with self._lock_claims:
+            self._claims[job_id] = lock_file
+        return True
+    
+    def _release_claim(self, job_id: str):
+        """释放并删除任务的锁文件（在删除任务日志之后调用）"""
+        with self._lock_claims:
+            lock_file = self._claims.pop(job_id, None)
+        if lock_file is None:
+            return
+        try:
+            unlock_file(lock_file)
+        except OSError:
+            pass
+        lock_file.close()
+        try:
+            os.remove(lock_file.name)
+        except OSError:
+            pass
+    
+    def _write_journal(self, job: Dict):
+        """写入任务日志"""
+        if not self.journal_dir:
+            return
+        try:
+            journal_path = self._journal_path(job['id'])
+            with open(f'{journal_path}.tmp', 'w', encoding='utf-8') as f:
+                json.dump(job, f, ensure_ascii=False, indent=2)
+            os.replace(f'{journal_path}.tmp', journal_path)
+        except Exception as e:
+            print(f"写入任务日志失败: {e}")
+    
+    def _remove_journal(self, job_id: str):
+        """删除已完成任务的日志"""
+        if not self.journal_dir:
+            return
+        journal_path = self._journal_path(job_id)
+        try:
+            if os.path.exists(journal_path):
+                os.remove(journal_path)
+        except Exception as e:
+            print(f"删除任务日志失败: {e}")
@@ -0,0 +1,72 @@
+import threading
+from collections import deque
+from typing import Dict
+
+class MetricsRegistry:
+    """进程内运行指标 - 计数器和耗时分布（保留最近的样本计算分位数）"""
+    
+    def __init__(self, window: int = 500):
+        """初始化指标登记表
+        
+        Args:
+            window: 每个耗时指标保留的最近样本数
+        """
+        self.window = window
+        self._counters: Dict[str, int] = {}
+        self._timings: Dict[str, deque] = {}
+        self._timing_counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+    
+    def increment(self, name: str, value: int = 1):
+        """计数器加一
+        
+        Args:
+            name: 指标名称
+            value: 增量
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+    
+    def observe(self, name: str, seconds: float):
+        """记录一次耗时
+        
+        Args:
+            name: 指标名称
+            seconds: 耗时（秒）
+        """
+        with self._lock:
+            if name not in self._timings:
+                self._timings[name] = deque(maxlen=self.window)
+            self._timings[name].append(seconds)
+            self._timing_counts[name] = self._timing_counts.get(name, 0) + 1
+    
+    def snapshot(self) -> Dict:
+        """获取所有指标
+        
+        Returns:
+            {'counters': {...}, 'timings': {名称: {count, avg_ms, p50_ms, p95_ms, max_ms}}}
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            samples = {name: sorted(values) for name, values in self._timings.items()}
+            counts = dict(self._timing_counts)
+        
+        timings = {}
+        for name, values in samples.items():
+            if not values:
+                continue
+            timings[name] = {
+                'count': counts[name],
+                'avg_ms': round(sum(values) / len(values) * 1000, 1),
+                'p50_ms': round(values[len(values) // 2] * 1000, 1),
+                'p95_ms': round(values[min(len(values) - 1, int(len(values) * 0.95))] * 1000, 1),
+                'max_ms': round(values[-1] * 1000, 1)
+            }
+        
+        return {
+            'counters': counters,
+            'timings': timings
+        }
+
+# 全局指标实例
+metrics = MetricsRegistry()
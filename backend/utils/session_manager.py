@@ -6,6 +6,9 @@ import shutil
 from datetime import datetime, timedelta
 from typing import Dict, Set
 from config import Config
+from backend.utils.artifact_store import artifact_store
+from backend.utils.job_queue import load_journal
+from backend.utils.cancellation import cancellation_registry
 
 class SessionManager:
     """会话管理器 - 管理浏览器会话和自动清理"""
@@ -30,12 +33,27 @@ class SessionManager:
         try:
             print("正在清理启动前的历史记录...")
             
+            # 任务日志中未完成的上传需要保留，重启后继续处理
+            pending_jobs = load_journal(os.path.join(Config.DATA_FOLDER, 'jobs'))
+            pending_files = {
+                os.path.abspath(job['payload']['file_path'])
+                for job in pending_jobs
+                if job.get('payload', {}).get('file_path')
+            }
+            pending_documents = {
+                job['payload']['document_id']
+                for job in pending_jobs
+                if job.get('payload', {}).get('document_id')
+            }
+            
             # 清理uploads目录中的所有PDF文件
             uploads_dir = Config.UPLOAD_FOLDER
             if os.path.exists(uploads_dir):
                 for filename in os.listdir(uploads_dir):
                     if filename.endswith('.pdf'):
                         file_path = os.path.join(uploads_dir, filename)
+                        if os.path.abspath(file_path) in pending_files:
+                            continue
                         try:
                             os.remove(file_path)
                             print(f"已删除历史上传文件: {filename}")
@@ -78,6 +96,33 @@ class SessionManager:
                         except Exception as e:
                             print(f"删除Figure目录 {item} 失败: {e}")
             
+            # 清理text目录中的所有文字层文件夹
+            text_dir = os.path.join(data_dir, 'text')
+            if os.path.exists(text_dir):
+                for item in os.listdir(text_dir):
+                    item_path = os.path.join(text_dir, item)
+                    if os.path.isdir(item_path):
+                        try:
+                            shutil.rmtree(item_path)
+                            print(f"已删除历史文字层目录: {item}")
+                        except Exception as e:
+                            print(f"删除文字层目录 {item} 失败: {e}")
+            
+            # 清理总结检查点（未完成的上传重新处理时从检查点继续生成总结）
+            checkpoints_dir = os.path.join(data_dir, 'checkpoints')
+            if os.path.exists(checkpoints_dir):
+                for item in os.listdir(checkpoints_dir):
+                    item_path = os.path.join(checkpoints_dir, item)
+                    if os.path.isdir(item_path) and item not in pending_documents:
+                        try:
+                            shutil.rmtree(item_path)
+                            print(f"已删除历史总结检查点: {item}")
+                        except Exception as e:
+                            print(f"删除总结检查点 {item} 失败: {e}")
+            
+            # 清空产物登记表（对应的文件已在上面删除）
+            artifact_store.reset()
+            
             print("历史记录清理完成")
             
         except Exception as e:
@@ -213,8 +258,9 @@ class SessionManager:
             
             print(f"开始清理会话 {session_id}，关联文档数量: {len(document_ids)}")
             
-            # 清理每个文档的数据
+            # 取消进行中的处理和总结生成，再清理每个文档的数据
             for document_id in document_ids:
+                cancellation_registry.cancel(document_id, '会话已结束')
                 self._cleanup_document_data(document_id)
             
             # 从会话记录中移除
@@ -239,31 +285,17 @@ class SessionManager:
             # 清理文档元数据文件
             metadata_path = os.path.join(Config.DATA_FOLDER, f'{document_id}.json')
             if os.path.exists(metadata_path):
-                # 读取文档信息获取原始文件路径
+                # 读取文档信息获取原始文件路径和产物ID
                 with open(metadata_path, 'r', encoding='utf-8') as f:
                     doc_data = json.load(f)
                 
-                # 删除原始PDF文件
-                original_path = doc_data.get('original_path')
-                if original_path and os.path.exists(original_path):
-                    os.remove(original_path)
-                    print(f"已删除原始文件: {original_path}")
-                
                 # 删除元数据文件
                 os.remove(metadata_path)
                 print(f"已删除元数据文件: {metadata_path}")
-            
-            # 清理图片目录
-            images_dir = os.path.join(Config.DATA_FOLDER, 'images', document_id)
-            if os.path.exists(images_dir):
-                shutil.rmtree(images_dir)
-                print(f"已删除图片目录: {images_dir}")
-            
-            # 清理Figure截取图片目录
-            figures_dir = os.path.join(Config.DATA_FOLDER, 'figures', document_id)
-            if os.path.exists(figures_dir):
-                shutil.rmtree(figures_dir)
-                print(f"已删除Figure目录: {figures_dir}")
+                
+                # 释放共享产物：原始PDF、图片和Figure目录在没有其他文档引用时删除
+                artifact_store.release(doc_data.get('artifact_id') or document_id, document_id,
+                                       doc_data.get('original_path'))
             
             print(f"文档 {document_id} 数据清理完成")
             
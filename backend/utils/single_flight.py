@@ -0,0 +1,104 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Tuple
+from backend.utils.cancellation import CancelledError, check_cancelled, sleep_cancellable
+from backend.utils.file_lock import try_lock_file, unlock_file
+
+# 等待其他调用完成时检查取消状态的间隔（秒）
+POLL_INTERVAL = 0.5
+
+class SingleFlight:
+    """单飞协调 - 同一个键同一时间只执行一次计算，并发的调用者等待并共享结果
+    
+    同一进程内的调用者等待正在进行的计算；不同worker进程之间通过锁文件排队，
+    计算函数在持有锁文件时执行，应先检查结果是否已由其他进程生成。
+    """
+    
+    def __init__(self, lock_dir: str, name: str):
+        """初始化单飞协调器
+        
+        Args:
+            lock_dir: 锁文件根目录，锁文件为 <lock_dir>/<键>/<name>.lock
+            name: 锁文件名（如 summary）
+        """
+        self.lock_dir = lock_dir
+        self.name = name
+        self._lock = threading.Lock()
+        self._flights: Dict[str, Dict] = {}
+        self._led = 0
+        self._joined = 0
+        self._lock_waits = 0
+    
+    def run(self, key: str, compute: Callable[[], Any]) -> Tuple[Any, bool]:
+        """执行计算，已有相同键的计算在进行时等待其结果
+        
+        发起计算的调用被取消时，等待中的调用者重新发起计算，而不是一起失败。
+        
+        Args:
+            key: 键（如产物ID）
+            compute: 计算函数
+        
+        Returns:
+            (结果, 是否共享了本进程内其他调用的结果)
+        """
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                if flight is None:
+                    flight = {'event': threading.Event(), 'result': None, 'error': None}
+                    self._flights[key] = flight
+                    self._led += 1
+                    break
+                self._joined += 1
+            
+            print(f"{key} 已有相同的计算正在进行，等待其完成")
+            while not flight['event'].wait(POLL_INTERVAL):
+                check_cancelled()
+            
+            error = flight['error']
+            if isinstance(error, CancelledError):
+                continue
+            if error is not None:
+                raise error
+            return flight['result'], True
+        
+        try:
+            with self._file_lock(key):
+                flight['result'] = compute()
+            return flight['result'], False
+        except BaseException as e:
+            flight['error'] = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight['event'].set()
+    
+    @contextmanager
+    def _file_lock(self, key: str):
+        """持有键对应的锁文件（其他进程持有时等待，等待期间可被取消）"""
+        lock_path = os.path.join(self.lock_dir, key, f'{self.name}.lock')
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        
+        with open(lock_path, 'a+b') as lock_file:
+            if not try_lock_file(lock_file):
+                with self._lock:
+                    self._lock_waits += 1
+                print(f"{key} 的计算正在其他进程中进行，等待其完成")
+                while not try_lock_file(lock_file):
+                    sleep_cancellable(POLL_INTERVAL)
+            try:
+                yield
+            finally:
+                unlock_file(lock_file)
+    
+    def get_stats(self) -> Dict:
+        """获取协调统计"""
+        with self._lock:
+            return {
+                'in_flight': len(self._flights),
+                'led': self._led,
+                'joined': self._joined,
+                'waited_for_other_process': self._lock_waits
+            }
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PDF入库性能基准测试
+
+对同一组PDF按不同的渲染配置分别执行 PDFProcessor.process_pdf，
+输出每种配置的耗时、页/秒和峰值内存。每种配置在独立子进程中运行，
+峰值内存互不影响；数据写入临时目录，不会触碰正式数据。
+
+用法:
+    python benchmarks/bench_ingestion.py paper1.pdf paper2.pdf --repeat 3
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows没有resource模块，不统计峰值内存
+    resource = None
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 基准配置：名称 -> 环境变量
+VARIANTS = {
+    'fixed-dpi': {'PDF_RASTERIZER': 'pdf2image', 'PDF_RENDER_AT_TARGET_SIZE': 'False', 'PDF_NATIVE_OUTPUT': 'False'},
+    'target-size': {'PDF_RASTERIZER': 'pdf2image', 'PDF_RENDER_AT_TARGET_SIZE': 'True', 'PDF_NATIVE_OUTPUT': 'False'},
+    'native-output': {'PDF_RASTERIZER': 'pdf2image', 'PDF_RENDER_AT_TARGET_SIZE': 'True', 'PDF_NATIVE_OUTPUT': 'True'},
+    'pdfium': {'PDF_RASTERIZER': 'pdfium', 'PDF_RENDER_AT_TARGET_SIZE': 'True', 'PDF_NATIVE_OUTPUT': 'True'},
+}
+
+def run_variant(pdf_paths, repeat):
+    """在当前进程中执行一种配置（由子进程调用）"""
+    sys.path.insert(0, PROJECT_ROOT)
+    from backend.services.pdf_processor import PDFProcessor
+    
+    processor = PDFProcessor()
+    total_pages = 0
+    started_at = time.perf_counter()
+    
+    for _ in range(repeat):
+        for pdf_path in pdf_paths:
+            result = processor.process_pdf(pdf_path, os.path.basename(pdf_path))
+            if not result['success']:
+                raise RuntimeError(result['error'])
+            total_pages += result['total_pages']
+    
+    elapsed = time.perf_counter() - started_at
+    peak_kb = 0
+    if resource:
+        peak_kb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                      resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    
+    return {
+        'pages': total_pages,
+        'elapsed_seconds': round(elapsed, 3),
+        'pages_per_second': round(total_pages / elapsed, 2) if elapsed > 0 else 0.0,
+        'peak_rss_mb': round(peak_kb / 1024, 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='PDF入库性能基准测试')
+    parser.add_argument('pdfs', nargs='+', help='测试用PDF文件')
+    parser.add_argument('--repeat', type=int, default=1, help='每个文件的重复次数')
+    parser.add_argument('--variants', default=','.join(VARIANTS), help='要测试的配置，逗号分隔')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    pdf_paths = [os.path.abspath(path) for path in args.pdfs]
+    
+    if args.worker:
+        print(json.dumps(run_variant(pdf_paths, args.repeat)))
+        return
+    
+    results = {}
+    for name in args.variants.split(','):
+        with tempfile.TemporaryDirectory(prefix='bench_ingestion_') as work_dir:
+            env = os.environ.copy()
+            env.update(VARIANTS[name])
+            env['UPLOAD_FOLDER'] = os.path.join(work_dir, 'uploads')
+            env['DATA_FOLDER'] = os.path.join(work_dir, 'data')
+            
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), *pdf_paths,
+                 '--repeat', str(args.repeat), '--worker', name],
+                env=env, check=True, capture_output=True, text=True
+            ).stdout
+            results[name] = json.loads(output.strip().splitlines()[-1])
+    
+    print(f"{'配置':<14}{'页数':>8}{'耗时(秒)':>12}{'页/秒':>10}{'峰值内存(MB)':>16}")
+    for name, result in results.items():
+        print(f"{name:<14}{result['pages']:>8}{result['elapsed_seconds']:>12}"
+              f"{result['pages_per_second']:>10}{result['peak_rss_mb']:>16}")
+
+if __name__ == '__main__':
+    main()
@@ -20,6 +20,39 @@ class Config:
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', os.path.join(os.path.dirname(__file__), 'backend', 'uploads'))
     DATA_FOLDER = os.environ.get('DATA_FOLDER', os.path.join(os.path.dirname(__file__), 'backend', 'data'))
     
+    # 入库任务队列配置
+    INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', '2'))  # 同时处理的上传数
+    INGEST_QUEUE_MAX_DEPTH = int(os.environ.get('INGEST_QUEUE_MAX_DEPTH', '20'))  # 最大排队数，超出时返回429
+    INGEST_QUEUE_POLICY = os.environ.get('INGEST_QUEUE_POLICY', 'fifo')  # fifo 或 priority
+    INGEST_RETRY_AFTER = int(os.environ.get('INGEST_RETRY_AFTER', '30'))  # 无历史数据时建议的重试秒数
+    INGEST_SYNC_WAIT_SECONDS = int(os.environ.get('INGEST_SYNC_WAIT_SECONDS', '120'))  # 同步上传接口最长等待秒数，超时返回202
+    
+    # PDF渲染配置
+    PDF_RASTERIZER = os.environ.get('PDF_RASTERIZER', 'pdf2image')  # pdf2image（poppler子进程）或 pdfium（进程内）
+    PDF_RENDER_MODE = os.environ.get('PDF_RENDER_MODE', 'eager')  # eager（上传时全部渲染）或 lazy（首次使用时渲染）
+    PDF_LAZY_WARMUP = os.environ.get('PDF_LAZY_WARMUP', 'False').lower() == 'true'  # 懒加载时后台预热剩余页面
+    PDF_EXTRACT_TEXT = os.environ.get('PDF_EXTRACT_TEXT', 'True').lower() == 'true'  # 入库时用pdftotext提取文字层
+    PAGE_TEXT_CONTEXT_CHARS = int(os.environ.get('PAGE_TEXT_CONTEXT_CHARS', '20000'))  # 问答时文字上下文的最大字符数
+    PDF_RENDER_DPI = int(os.environ.get('PDF_RENDER_DPI', '200'))
+    PDF_RENDER_BATCH_SIZE = int(os.environ.get('PDF_RENDER_BATCH_SIZE', '4'))  # 每批渲染的页数，决定内存峰值
+    PDF_RENDER_THREADS = int(os.environ.get('PDF_RENDER_THREADS', '2'))
+    PDF_RENDER_AT_TARGET_SIZE = os.environ.get('PDF_RENDER_AT_TARGET_SIZE', 'True').lower() == 'true'  # 按最终尺寸渲染，跳过缩放
+    PDF_NATIVE_OUTPUT = os.environ.get('PDF_NATIVE_OUTPUT', 'True').lower() == 'true'  # 由poppler直接写出最终PNG
+    PDF_ENCODE_WORKERS = int(os.environ.get('PDF_ENCODE_WORKERS', '0'))  # 0表示使用全部CPU核心
+    PDF_ENCODE_EXECUTOR = os.environ.get('PDF_ENCODE_EXECUTOR', 'process')  # process 或 thread
+    IMAGE_PAYLOAD_CACHE_MB = int(os.environ.get('IMAGE_PAYLOAD_CACHE_MB', '256'))  # 发送给大模型的base64页面图片缓存上限，0表示不缓存
+    
+    # 文档总结配置（分块并发分析页面，再逐级合并）
+    SUMMARY_CHUNK_PAGES = int(os.environ.get('SUMMARY_CHUNK_PAGES', '8'))  # 每个分块的页数
+    SUMMARY_REDUCE_FAN_IN = int(os.environ.get('SUMMARY_REDUCE_FAN_IN', '4'))  # 每次合并的分块结果数
+    SUMMARY_MAX_PARALLEL = int(os.environ.get('SUMMARY_MAX_PARALLEL', '4'))  # 同时进行的分块分析和合并调用数
+    
+    # 问题语义缓存配置
+    SEMANTIC_CACHE_ENABLED = os.environ.get('SEMANTIC_CACHE_ENABLED', 'True').lower() == 'true'
+    SEMANTIC_CACHE_THRESHOLD = float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', '0.8'))  # 命中所需的最低余弦相似度
+    SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get('SEMANTIC_CACHE_MAX_ENTRIES', '50'))  # 每个文档保留的问题数
+    SEMANTIC_CACHE_MAX_DOCUMENTS = int(os.environ.get('SEMANTIC_CACHE_MAX_DOCUMENTS', '100'))
+    
     # 服务器配置
     HOST = os.environ.get('HOST', '127.0.0.1')
     PORT = int(os.environ.get('PORT', 5000))
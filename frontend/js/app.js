@@ -409,80 +409,101 @@ class PDFReaderApp {
         }
     }
     
-    // 加载文档总结
+    // 加载文档总结（按游标轮询生成进度，分块分析完成后逐段显示，最终总结完成后替换）
     async loadDocumentSummary(documentId) {
         const summaryContent = document.getElementById('summaryContent');
-        summaryContent.innerHTML = '<div class="loading-summary">正在生成总结...</div>';
+        if (summaryContent) {
+            summaryContent.innerHTML = '<div class="loading-summary">正在生成总结...</div>';
+        }
+        
+        document.getElementById('chatMessages').innerHTML = '';
+        const progressId = this.addMessage('🤖 正在生成文档总结，请稍候...', 'assistant', true);
+        let cursor = 0;
+        let parts = [];
         
         try {
             console.log(`开始加载文档总结: ${documentId}`);
             
-            // 创建带超时的fetch请求
-            const controller = new AbortController();
-            const timeoutId = setTimeout(() => {
-                controller.abort();
-            }, 60000); // 60秒超时
-            
-            const response = await fetch(`/api/documents/${documentId}/summary`, {
-                method: 'GET',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                signal: controller.signal
-            });
-            
-            clearTimeout(timeoutId);
-            console.log(`总结API响应状态: ${response.status}`);
-            
-            if (!response.ok) {
-                throw new Error(`HTTP ${response.status}: ${response.statusText}`);
-            }
-            
-            const data = await response.json();
-            console.log('总结API响应数据:', data);
-            
-            if (data.success) {
-                // 添加欢迎消息
-                this.addWelcomeMessage(data.summary);
-                console.log('总结加载成功，已添加欢迎消息');
+            while (true) {
+                // 已切换到其他文档时停止轮询
+                if (this.currentDocument && this.currentDocument.id !== documentId) {
+                    this.removeMessage(progressId);
+                    return;
+                }
+                
+                const response = await fetch(`/api/documents/${documentId}/summary?cursor=${cursor}`);
+                const data = await response.json();
                 
-                // 删除doc-summary元素，避免转圈渲染状态
-                const docSummary = document.getElementById('docSummary');
-                if (docSummary) {
-                    docSummary.remove();
+                if (!data.success) {
+                    throw new Error(data.error || `HTTP ${response.status}`);
                 }
                 
-                if (data.cached) {
-                    console.log('使用缓存的总结');
-                } else {
-                    console.log('生成新的总结');
+                if (data.status === 'done') {
+                    this.removeMessage(progressId);
+                    this.addWelcomeMessage(data.summary);
+                    console.log('总结加载成功，已添加欢迎消息');
+                    
+                    // 删除doc-summary元素，避免转圈渲染状态
+                    const docSummary = document.getElementById('docSummary');
+                    if (docSummary) {
+                        docSummary.remove();
+                    }
+                    return;
                 }
-            } else {
-                console.error('总结生成失败:', data.error);
-                summaryContent.innerHTML = `<div class="error-summary">总结生成失败: ${data.error}</div>`;
                 
-                // 即使总结失败，也要添加基本的欢迎消息
-                this.addWelcomeMessage('文档已加载完成，您可以开始提问了。');
-                console.log('总结失败，已添加默认欢迎消息');
+                if (data.reset) {
+                    parts = [];
+                }
+                if (data.parts.length > 0 || data.reset) {
+                    parts = parts.concat(data.parts);
+                    this.updateSummaryProgress(progressId, parts, data.total_chunks);
+                }
+                cursor = data.cursor;
+                
+                await new Promise(resolve => setTimeout(resolve, 2000));
             }
         } catch (error) {
             console.error('加载总结失败:', error);
+            this.removeMessage(progressId);
             
-            let errorMessage = '总结加载失败';
-            if (error.name === 'AbortError') {
-                errorMessage = '总结生成超时，请稍后重试';
-            } else {
-                errorMessage = `总结加载失败: ${error.message}`;
+            if (summaryContent) {
+                summaryContent.innerHTML = `<div class="error-summary">总结加载失败: ${error.message}</div>`;
             }
             
-            summaryContent.innerHTML = `<div class="error-summary">${errorMessage}</div>`;
-            
             // 即使总结失败，也要添加基本的欢迎消息
             this.addWelcomeMessage('文档已加载完成，您可以开始提问了。');
-            console.log('总结异常，已添加默认欢迎消息');
+            console.log('总结失败，已添加默认欢迎消息');
         }
     }
     
+    // 显示总结的部分结果：合并后的中间摘要替换其页面范围内的分块分析
+    updateSummaryProgress(messageId, parts, totalChunks) {
+        const message = document.getElementById(messageId);
+        if (!message) return;
+        
+        const visibleParts = parts
+            .filter(part => !parts.some(other => other.level > part.level &&
+                other.first_page <= part.first_page && other.last_page >= part.last_page))
+            .sort((a, b) => a.first_page - b.first_page);
+        const analyzedChunks = parts.filter(part => part.level === 0).length;
+        
+        const sections = visibleParts.map(part => {
+            const pageRange = part.first_page === part.last_page
+                ? `第${part.first_page}页` : `第${part.first_page}-${part.last_page}页`;
+            return `### ${pageRange}\n\n${part.text}`;
+        });
+        const header = `📄 **文档总结生成中**（已分析 ${analyzedChunks}/${totalChunks || '?'} 个分块，完整总结生成后将替换以下内容）`;
+        
+        const contentDiv = message.querySelector('.message-content');
+        const timeDiv = contentDiv.querySelector('.message-time');
+        contentDiv.classList.remove('loading');
+        contentDiv.innerHTML = this.formatMessageContent([header, ...sections].join('\n\n'));
+        if (timeDiv) {
+            contentDiv.appendChild(timeDiv);
+        }
+        this.scrollToBottom();
+    }
+    
     // 高亮当前文档
     highlightCurrentDocument(documentId) {
         // 移除所有高亮
@@ -539,7 +560,7 @@ class PDFReaderApp {
                 requestBody.document_id = this.currentDocument.id;
             }
             
-            const response = await fetch('/api/chat', {
+            const response = await fetch('/api/chat/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
@@ -547,7 +568,32 @@ class PDFReaderApp {
                 body: JSON.stringify(requestBody)
             });
             
-            const data = await response.json();
+            let data;
+            if (response.ok && response.body) {
+                // 流式接收回答，收到第一段文字后替换加载消息并逐步渲染
+                let streamingId = null;
+                let answerText = '';
+                
+                await this.readEventStream(response, (event, eventData) => {
+                    if (event === 'delta') {
+                        answerText += eventData.content;
+                        if (!streamingId) {
+                            this.removeMessage(loadingId);
+                            streamingId = this.addMessage('', 'assistant');
+                        }
+                        this.updateStreamingMessage(streamingId, answerText);
+                    } else if (event === 'done' || event === 'error') {
+                        data = eventData;
+                    }
+                });
+                
+                if (streamingId) {
+                    this.removeMessage(streamingId);
+                }
+                data = data || { success: false, error: answerText ? '回答被中断' : '没有收到回答' };
+            } else {
+                data = await response.json();
+            }
             
             // 移除加载消息
             this.removeMessage(loadingId);
@@ -601,6 +647,62 @@ class PDFReaderApp {
         }
     }
     
+    // 读取Server-Sent Events响应，按事件回调
+    async readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder('utf-8');
+        let buffer = '';
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            
+            buffer += decoder.decode(value, { stream: true });
+            
+            // 事件之间以空行分隔
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                
+                let event = 'message';
+                const dataLines = [];
+                frame.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) {
+                        event = line.slice(6).trim();
+                    } else if (line.startsWith('data:')) {
+                        dataLines.push(line.slice(5).trim());
+                    }
+                });
+                
+                if (dataLines.length > 0) {
+                    onEvent(event, JSON.parse(dataLines.join('\n')));
+                }
+            }
+        }
+    }
+    
+    // 更新流式消息内容（每帧最多渲染一次）
+    updateStreamingMessage(messageId, content) {
+        this.streamingContent = content;
+        if (this.streamingRenderPending) return;
+        
+        this.streamingRenderPending = true;
+        requestAnimationFrame(() => {
+            this.streamingRenderPending = false;
+            const message = document.getElementById(messageId);
+            if (!message) return;
+            
+            const contentDiv = message.querySelector('.message-content');
+            const timeDiv = contentDiv.querySelector('.message-time');
+            contentDiv.innerHTML = this.formatMessageContent(this.streamingContent);
+            if (timeDiv) {
+                contentDiv.appendChild(timeDiv);
+            }
+            this.scrollToBottom();
+        });
+    }
+    
     // 添加消息
     addMessage(content, type, isLoading = false, sourcePages = null, messageType = 'normal', answerType = 'text', pageImages = [], confidence = null, extractedFigures = []) {
         const chatMessages = document.getElementById('chatMessages');
@@ -857,51 +959,8 @@ class PDFReaderApp {
     
     // 在聊天框中显示文档总结
     async showDocumentSummaryInChat(documentId) {
-        try {
-            console.log(`开始获取文档总结并显示在聊天框: ${documentId}`);
-            
-            // 清空现有消息
-            document.getElementById('chatMessages').innerHTML = '';
-            
-            // 添加加载消息
-            const loadingId = this.addMessage('🤖 正在生成文档总结，请稍候...', 'assistant', true);
-            
-            const response = await fetch(`/api/documents/${documentId}/summary`);
-            const data = await response.json();
-            
-            // 移除加载消息
-            this.removeMessage(loadingId);
-            
-            if (data.success && data.summary) {
-                // 在聊天框中添加总结消息
-                this.addMessage(
-                    `📄 **文档总结**\n\n${data.summary}\n\n---\n\n💬 您可以基于此文档内容向我提问，我将为您提供详细的解答和页面定位。`, 
-                    'assistant', 
-                    false, 
-                    null, 
-                    'summary'
-                );
-                console.log('文档总结已显示在聊天框中');
-            } else {
-                console.error('获取文档总结失败:', data.error);
-                this.addMessage(
-                    '📄 文档已处理完成，但总结生成失败。您可以开始提问了。', 
-                    'assistant', 
-                    false, 
-                    null, 
-                    'info'
-                );
-            }
-        } catch (error) {
-            console.error('显示文档总结失败:', error);
-            this.addMessage(
-                '📄 文档已处理完成，您可以开始提问了。', 
-                'assistant', 
-                false, 
-                null, 
-                'info'
-            );
-        }
+        console.log(`开始获取文档总结并显示在聊天框: ${documentId}`);
+        await this.loadDocumentSummary(documentId);
     }
 
     // 添加欢迎消息